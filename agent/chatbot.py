@@ -1,25 +1,35 @@
 from typing import Annotated
 
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from typing_extensions import TypedDict
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.memory import InMemorySaver
-
-memory = InMemorySaver()
-
 from dotenv import load_dotenv
 
 import sys
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from chatbot_tools import * 
+from llm_clients import get_chat_model
+from checkpointer import BoundedSaver
 
 load_dotenv()
 
+# Bounded per-thread checkpointer: keeps the last few checkpoints of each conversation,
+# evicts idle conversations, and optionally spills them to disk instead of dropping them
+memory = BoundedSaver(
+    max_checkpoints=int(os.getenv("AGENT_MAX_CHECKPOINTS", "5")),
+    max_threads=int(os.getenv("AGENT_MAX_THREADS", "1000")),
+    idle_ttl=float(os.getenv("AGENT_THREAD_IDLE_TTL", "3600")),
+    spill_dir=os.getenv("AGENT_CHECKPOINT_SPILL_DIR") or None,
+)
+
 class State(TypedDict):
     messages: Annotated[list, add_messages]
 
@@ -27,15 +37,72 @@ graph_builder = StateGraph(State)
 
 # Simplified tools list to avoid compatibility issues
 tools = [get_weather]
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.5)
+llm = get_chat_model("gemini-2.5-flash", temperature=0.5)
 llm_with_tools = llm.bind_tools(tools)
 
-def chatbot(state: State):
+# Mood detection and state saving run here, off the reply's critical path
+background_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AGENT_BACKGROUND_WORKERS", "4")),
+    thread_name_prefix="agent-mood",
+)
+
+# thread_id -> Future resolving to the mood of that thread's latest user message
+# (bounded like the checkpointer, least recently updated threads dropped first)
+_mood_futures = OrderedDict()
+_mood_lock = threading.Lock()
+
+
+def get_latest_mood(thread_id: str = "1", timeout: float = None):
+    """
+    Get the mood detected for the latest user message of a thread.
+
+    Mood is computed in the background, so this waits up to `timeout` seconds
+    (forever if None) for it to be ready. Returns None if there is no mood yet.
+    """
+    with _mood_lock:
+        future = _mood_futures.get(str(thread_id))
+    if future is None:
+        return None
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        print(f"Background mood error: {e}")
+        return None
+
+
+def _record_turn(user_message: str, ai_response: str, mood_future):
+    """Save state once the background mood detection for a turn has finished"""
+    try:
+        mood_data = mood_future.result()
+        save_state.invoke({
+            "emotion": mood_data['mood'],
+            "user_message": user_message,
+            "ai_response": ai_response,
+        })
+    except Exception as e:
+        # Don't let mood detection errors affect the main response
+        print(f"Background mood/state error: {e}")
+
+
+def chatbot(state: State, config: RunnableConfig):
     """Main chatbot function that handles mood detection and state saving"""
     messages = state["messages"]
+    thread_id = str(config.get("configurable", {}).get("thread_id", "1"))
+    
+    # Get the latest user message (None when re-entering after a tool call)
+    is_user_turn = bool(messages) and isinstance(messages[-1], HumanMessage)
+    user_message = messages[-1].content if is_user_turn else ""
     
-    # Get the latest user message
-    user_message = messages[-1].content if messages else ""
+    # Start mood detection now so it runs concurrently with the main reply
+    mood_future = None
+    if is_user_turn:
+        mood_future = background_executor.submit(
+            get_mood_with_intensity.invoke, {"user_message": user_message})
+        with _mood_lock:
+            _mood_futures[thread_id] = mood_future
+            _mood_futures.move_to_end(thread_id)
+            while len(_mood_futures) > memory.max_threads:
+                _mood_futures.popitem(last=False)
     
     # Add system prompt to the messages if it's not already there
     if not messages or not isinstance(messages[0], SystemMessage):
@@ -139,17 +206,17 @@ UNLOCK MECHANICS
     # Get the AI response
     ai_response = llm_with_tools.invoke(messages_with_system)
     
-    # Quick mood detection and state saving in the background (non-blocking)
-    try:
-        # Use the optimized mood detection function
-        mood_data = get_mood_with_intensity(user_message)
-        detected_emotion = mood_data['mood']
-        
-        # Save state with detected emotion
-        save_state(detected_emotion, user_message, ai_response.content)
-    except Exception as e:
-        print(f"Background mood/state error: {e}")
-        # Don't let mood detection errors affect the main response
+    # A tool call comes back through this node; the turn is saved with the final reply.
+    # Attach mood and save state whenever mood detection finishes; don't wait for it here
+    if not ai_response.tool_calls:
+        if not is_user_turn:
+            user_message = next(
+                (m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+            with _mood_lock:
+                mood_future = _mood_futures.get(thread_id)
+        if mood_future is not None:
+            mood_future.add_done_callback(
+                lambda future: _record_turn(user_message, ai_response.content, future))
     
     return {"messages": [ai_response]}
 
@@ -167,24 +234,30 @@ graph_builder.add_edge("tools", "chatbot")
 graph_builder.add_edge(START, "chatbot")
 graph = graph_builder.compile(checkpointer=memory)
 
-config = {"configurable": {"thread_id": "1"}}
+DEFAULT_THREAD_ID = "1"
+
+def get_config(thread_id: str = DEFAULT_THREAD_ID):
+    """Build the graph config for a conversation thread (one thread per user)"""
+    return {"configurable": {"thread_id": str(thread_id)}}
+
+config = get_config()
 
-def stream_graph_updates(user_input: str):
+def stream_graph_updates(user_input: str, thread_id: str = DEFAULT_THREAD_ID):
     """Stream updates from the graph"""
     for event in graph.stream(
         {"messages": [HumanMessage(content=user_input)]}, 
-        config=config):
+        config=get_config(thread_id)):
 
         for value in event.values():
             print("Assistant:", value["messages"][-1].content)
 
 # Function to stream chatbot response (for server integration)
-def stream_chatbot_response(user_input: str):
-    """Stream response from the chatbot"""
+def stream_chatbot_response(user_input: str, thread_id: str = DEFAULT_THREAD_ID):
+    """Stream response from the chatbot for the given user's conversation thread"""
     try:
         for event in graph.stream(
             {"messages": [HumanMessage(content=user_input)]}, 
-            config=config):
+            config=get_config(thread_id)):
             
             for value in event.values():
                 if "messages" in value and value["messages"]:
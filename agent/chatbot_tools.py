@@ -1,8 +1,17 @@
 import json
 import os
+import sys
 import datetime
 from langchain_core.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_clients import get_chat_model
+
+from mood_classifier import get_mood_classifier, log_label
+from state_journal import get_state_journal
+
+# Local predictions at or above this confidence skip the LLM call entirely
+MOOD_CONFIDENCE_THRESHOLD = float(os.getenv("MOOD_CONFIDENCE_THRESHOLD", "0.6"))
 
 @tool
 def get_weather(city: str) -> str:
@@ -25,8 +34,17 @@ def get_weather(city: str) -> str:
 @tool 
 def get_mood_with_intensity(user_message: str) -> dict:
     """Analyze user message and return mood ('happy', 'sad', 'angry') with intensity (1-100)"""
+    # Tier 1: in-process classifier, no network round-trip
     try:
-        llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0)
+        local = get_mood_classifier().predict(user_message)
+        if local['confidence'] >= MOOD_CONFIDENCE_THRESHOLD:
+            return {'mood': local['mood'], 'intensity': local['intensity']}
+    except Exception as e:
+        print(f"Error in local mood classifier: {e}")
+
+    # Tier 2: LLM for low-confidence messages
+    try:
+        llm = get_chat_model("gemini-1.5-flash", temperature=0)
         response = llm.invoke(f"""
         Analyze this message for emotional content and return a JSON object with two fields:
         1. "mood": one of "happy", "sad", "angry", or "neutral"
@@ -83,6 +101,9 @@ def get_mood_with_intensity(user_message: str) -> dict:
                 intensity = 1
             elif intensity > 100:
                 intensity = 100
+            
+            # Keep the LLM's label as training data for the local classifier
+            log_label(user_message, mood, intensity)
                 
             return {'mood': mood, 'intensity': intensity}
             
@@ -98,13 +119,8 @@ def get_mood_with_intensity(user_message: str) -> dict:
 
 @tool
 def save_state(emotion: str, user_message: str, ai_response: str) -> str:
-    """Save current state to JSON file"""
+    """Save current state to the state journal (written in the background)"""
     try:
-        state_file = "server/state.json"
-        
-        # Create state directory if it doesn't exist
-        os.makedirs(os.path.dirname(state_file), exist_ok=True)
-        
         state = {
             "current_emotion": emotion,
             "last_user_message": user_message,
@@ -112,8 +128,7 @@ def save_state(emotion: str, user_message: str, ai_response: str) -> str:
             "timestamp": str(datetime.datetime.now())
         }
         
-        with open(state_file, 'w') as f:
-            json.dump(state, f, indent=2)
+        get_state_journal().append(state)
         
         return f"State saved with emotion: {emotion}"
     except Exception as e:
@@ -0,0 +1,175 @@
+import os
+import pickle
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+class BoundedSaver(InMemorySaver):
+    """
+    In-memory LangGraph checkpointer with bounded memory use.
+
+    - Keeps only the last `max_checkpoints` checkpoints per thread (and namespace)
+    - Evicts threads that have been idle for `idle_ttl` seconds, and the least
+      recently used threads once more than `max_threads` are held
+    - If `spill_dir` is set, evicted threads are pickled to disk and transparently
+      reloaded the next time they are used instead of being dropped
+    """
+
+    def __init__(self, max_checkpoints=5, max_threads=1000, idle_ttl=3600,
+                 spill_dir=None, **kwargs):
+        super().__init__(**kwargs)
+        self.max_checkpoints = max(1, int(max_checkpoints))
+        self.max_threads = max(1, int(max_threads))
+        self.idle_ttl = idle_ttl
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        # thread_id -> last access (monotonic), ordered oldest first
+        self._last_access = OrderedDict()
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # BaseCheckpointSaver interface
+    # ------------------------------------------------------------------
+
+    def get_tuple(self, config):
+        with self._lock:
+            self._touch(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        with self._lock:
+            if config:
+                self._touch(config["configurable"]["thread_id"])
+            # Materialize under the lock so pruning can't mutate mid-iteration
+            items = list(super().list(config, filter=filter, before=before, limit=limit))
+        yield from items
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            self._touch(thread_id)
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            self._prune(thread_id, config["configurable"]["checkpoint_ns"])
+            self._evict_idle()
+            return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            self._touch(config["configurable"]["thread_id"])
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            super().delete_thread(thread_id)
+            self._last_access.pop(thread_id, None)
+            path = self._spill_path(thread_id)
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+    # ------------------------------------------------------------------
+    # Introspection
+    # ------------------------------------------------------------------
+
+    def thread_count(self):
+        """Number of threads currently held in memory"""
+        with self._lock:
+            return len(self._last_access)
+
+    def checkpoint_count(self, thread_id=None):
+        """Number of checkpoints held in memory, optionally for a single thread"""
+        with self._lock:
+            threads = [thread_id] if thread_id is not None else list(self.storage)
+            return sum(
+                len(checkpoints)
+                for t in threads if t in self.storage
+                for checkpoints in self.storage[t].values()
+            )
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _touch(self, thread_id):
+        new = thread_id not in self._last_access
+        if new:
+            self._restore(thread_id)
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+        if new:
+            # A restored (or first-seen) thread can push the count past max_threads
+            self._evict_idle()
+
+    def _prune(self, thread_id, checkpoint_ns):
+        """Drop all but the newest checkpoints of a thread, with their writes and blobs"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.max_checkpoints:
+            return
+
+        # Checkpoint ids are time-ordered (uuid6), so sorting gives age order
+        ordered = sorted(checkpoints)
+        for checkpoint_id in ordered[:-self.max_checkpoints]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        # Keep only the channel blobs still referenced by a retained checkpoint
+        referenced = set()
+        for serialized, _, _ in checkpoints.values():
+            kept = self.serde.loads_typed(serialized)
+            referenced.update(kept["channel_versions"].items())
+        for key in [k for k in self.blobs
+                    if k[0] == thread_id and k[1] == checkpoint_ns]:
+            if (key[2], key[3]) not in referenced:
+                del self.blobs[key]
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        while self._last_access:
+            thread_id, last_seen = next(iter(self._last_access.items()))
+            idle = self.idle_ttl is not None and now - last_seen > self.idle_ttl
+            if not idle and len(self._last_access) <= self.max_threads:
+                break
+            self._evict(thread_id)
+
+    def _evict(self, thread_id):
+        self._last_access.pop(thread_id, None)
+        path = self._spill_path(thread_id)
+        if path:
+            snapshot = {
+                "storage": {ns: dict(cps) for ns, cps in self.storage.get(thread_id, {}).items()},
+                "writes": {k: v for k, v in self.writes.items() if k[0] == thread_id},
+                "blobs": {k: v for k, v in self.blobs.items() if k[0] == thread_id},
+            }
+            try:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Error spilling thread {thread_id} to disk: {e}")
+        super().delete_thread(thread_id)
+
+    def _restore(self, thread_id):
+        path = self._spill_path(thread_id)
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "rb") as f:
+                snapshot = pickle.load(f)
+            for ns, checkpoints in snapshot["storage"].items():
+                self.storage[thread_id][ns].update(checkpoints)
+            self.writes.update(snapshot["writes"])
+            self.blobs.update(snapshot["blobs"])
+            os.unlink(path)
+        except Exception as e:
+            print(f"Error restoring thread {thread_id} from disk: {e}")
+
+    def _spill_path(self, thread_id):
+        if not self.spill_dir:
+            return None
+        digest = hashlib.sha256(str(thread_id).encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.pkl")
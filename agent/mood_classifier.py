@@ -0,0 +1,309 @@
+"""
+Fast in-process mood classifier used as the first tier of mood detection.
+
+A softmax-linear model over hashed word n-grams, implemented with NumPy:
+- Starts from a small built-in lexicon, so it works with no training data
+- Can be trained from the labels Gemini produces for low-confidence messages
+  (logged to a JSONL file by `log_label`), so it handles more turns over time
+
+Usage:
+    python agent/mood_classifier.py train --labels agent/mood_labels.jsonl --out agent/mood_model.npz
+    python agent/mood_classifier.py predict "I'm so tired of this"
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+MOODS = ("happy", "sad", "angry", "neutral")
+NEUTRAL = MOODS.index("neutral")
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mood_model.npz")
+DEFAULT_LABEL_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mood_labels.jsonl")
+
+NEGATIONS = {"not", "no", "never", "don't", "dont", "isn't", "isnt", "wasn't", "wasnt",
+             "can't", "cant", "won't", "wont", "didn't", "didnt", "nothing", "hardly"}
+INTENSIFIERS = {"so", "very", "really", "extremely", "super", "totally", "incredibly",
+                "absolutely", "completely", "deeply", "too"}
+
+# Seed lexicon: mood -> words that mark it on their own
+LEXICON = {
+    "happy": [
+        "happy", "glad", "great", "awesome", "amazing", "love", "excited", "proud",
+        "thanks", "thank", "grateful", "wonderful", "fantastic", "good", "nice", "fun",
+        "yay", "congrats", "congratulations", "appreciate", "lighter", "hopeful",
+        "better", "enjoy", "enjoyed",
+    ],
+    "sad": [
+        "sad", "tired", "exhausted", "lonely", "alone", "depressed", "hopeless",
+        "miss", "cry", "crying", "hurt", "stuck", "overwhelmed", "drained", "worthless",
+        "anxious", "stressed", "empty", "struggling", "rough", "bad",
+        "worried", "scared",
+    ],
+    "angry": [
+        "angry", "mad", "furious", "hate", "annoyed", "annoying", "irritated",
+        "frustrated", "frustrating", "stupid", "pissed", "ridiculous",
+        "idiot", "useless", "terrible", "worst", "unfair",
+    ],
+}
+
+# Everyday words that only hint at a mood ("I'm here", "I don't care"). One of
+# them alone stays below MOOD_CONFIDENCE_THRESHOLD, so such messages go to Gemini.
+WEAK_LEXICON = {
+    "happy": ["care", "support", "here"],
+    "sad": ["down", "sorry", "lost"],
+    "angry": ["sick", "shut", "whatever"],
+}
+LEXICON_WEIGHT = 3.0
+WEAK_LEXICON_WEIGHT = 1.5
+
+# Hash buckets; at 2 ** 14 lexicon words collided ("lost" with "anxious", "dont" with "NOT_here")
+N_FEATURES = 2 ** 16
+
+_TOKEN_RE = re.compile(r"[a-z']+|[!?]")
+
+
+def tokenize(text):
+    """Lowercase word tokens, with negated words prefixed by NOT_"""
+    tokens = []
+    negate = 0
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in NEGATIONS:
+            negate = 3
+            tokens.append(token)
+            continue
+        if negate and token not in ("!", "?"):
+            token = f"NOT_{token}"
+            negate -= 1
+        tokens.append(token)
+    return tokens
+
+
+def ngrams(tokens):
+    """Unigrams and bigrams of a token list"""
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _hash(feature, n_features):
+    # crc32 rather than hash(): stable across processes, so saved models stay valid
+    return zlib.crc32(feature.encode("utf-8")) % n_features
+
+
+class MoodClassifier:
+    """Softmax-linear mood model over hashed n-grams, plus a linear intensity head"""
+
+    def __init__(self, n_features=N_FEATURES):
+        self.n_features = n_features
+        self.weights = np.zeros((n_features, len(MOODS)), dtype=np.float32)
+        self.bias = np.zeros(len(MOODS), dtype=np.float32)
+        self.intensity_weights = np.zeros(n_features, dtype=np.float32)
+        self.intensity_bias = np.float32(0.0)
+
+    # ------------------------------------------------------------------
+    # Features
+    # ------------------------------------------------------------------
+
+    def features(self, text):
+        """Hashed feature indices for a message (with repeats, one per occurrence)"""
+        return np.fromiter(
+            (_hash(f, self.n_features) for f in ngrams(tokenize(text))),
+            dtype=np.int64,
+        )
+
+    # ------------------------------------------------------------------
+    # Prediction
+    # ------------------------------------------------------------------
+
+    def predict_proba(self, text):
+        idx = self.features(text)
+        logits = self.bias + self.weights[idx].sum(axis=0)
+        logits = logits - logits.max()
+        probs = np.exp(logits)
+        return probs / probs.sum(), idx
+
+    def predict(self, text):
+        """Return {'mood', 'intensity', 'confidence'} for a message"""
+        probs, idx = self.predict_proba(text)
+        label = int(probs.argmax())
+        raw = self.intensity_bias + self.intensity_weights[idx].sum()
+        intensity = int(round(100.0 / (1.0 + np.exp(-raw))))
+        return {
+            "mood": MOODS[label],
+            "intensity": min(100, max(1, intensity)),
+            "confidence": float(probs[label]),
+        }
+
+    # ------------------------------------------------------------------
+    # Training
+    # ------------------------------------------------------------------
+
+    def fit(self, examples, epochs=10, learning_rate=0.1, l2=1e-4, seed=0):
+        """
+        Train on labelled examples with plain SGD.
+
+        Args:
+            examples: iterable of dicts with 'text', 'mood' and optionally 'intensity'
+            epochs: passes over the data
+            learning_rate: SGD step size
+            l2: weight decay applied to touched rows
+        Returns:
+            Training accuracy after the last epoch
+        """
+        rows = []
+        for ex in examples:
+            mood = str(ex.get("mood", "")).lower()
+            if mood not in MOODS or not ex.get("text"):
+                continue
+            intensity = ex.get("intensity")
+            rows.append((self.features(ex["text"]), MOODS.index(mood),
+                         None if intensity is None else min(99.0, max(1.0, float(intensity))) / 100.0))
+        if not rows:
+            return 0.0
+
+        rng = np.random.default_rng(seed)
+        eye = np.eye(len(MOODS), dtype=np.float32)
+        for _ in range(epochs):
+            correct = 0
+            for i in rng.permutation(len(rows)):
+                idx, label, target = rows[i]
+                logits = self.bias + self.weights[idx].sum(axis=0)
+                probs = np.exp(logits - logits.max())
+                probs /= probs.sum()
+                correct += int(probs.argmax() == label)
+
+                grad = (probs - eye[label]).astype(np.float32)
+                np.add.at(self.weights, idx, -learning_rate * grad)
+                self.weights[idx] *= (1.0 - l2)
+                self.bias -= learning_rate * grad
+
+                if target is not None:
+                    raw = self.intensity_bias + self.intensity_weights[idx].sum()
+                    err = np.float32(1.0 / (1.0 + np.exp(-raw)) - target)
+                    np.add.at(self.intensity_weights, idx, -learning_rate * err)
+                    self.intensity_bias -= learning_rate * err
+        return correct / len(rows)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            weights=self.weights,
+            bias=self.bias,
+            intensity_weights=self.intensity_weights,
+            intensity_bias=np.array([self.intensity_bias], dtype=np.float32),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        model = cls(n_features=data["weights"].shape[0])
+        model.weights = data["weights"].astype(np.float32)
+        model.bias = data["bias"].astype(np.float32)
+        model.intensity_weights = data["intensity_weights"].astype(np.float32)
+        model.intensity_bias = np.float32(data["intensity_bias"][0])
+        return model
+
+    @classmethod
+    def from_lexicon(cls, n_features=N_FEATURES):
+        """Build an untrained model from the seed lexicon"""
+        model = cls(n_features=n_features)
+        # With no emotional words the message leans neutral, but not confidently
+        model.bias[NEUTRAL] = 1.0
+        model.intensity_bias = np.float32(-0.4)
+        for lexicon, weight in ((LEXICON, LEXICON_WEIGHT), (WEAK_LEXICON, WEAK_LEXICON_WEIGHT)):
+            for mood, words in lexicon.items():
+                label = MOODS.index(mood)
+                for word in words:
+                    model.weights[_hash(word, n_features), label] += weight
+                    model.intensity_weights[_hash(word, n_features)] += 0.2 * weight
+                    # Negated emotion words ("not happy") point the other way
+                    negated = _hash(f"NOT_{word}", n_features)
+                    opposite = MOODS.index("sad") if mood == "happy" else NEUTRAL
+                    model.weights[negated, opposite] += 2.0 * weight / LEXICON_WEIGHT
+        for word in INTENSIFIERS:
+            model.intensity_weights[_hash(word, n_features)] += 0.5
+        model.intensity_weights[_hash("!", n_features)] += 0.4
+        return model
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+_label_lock = threading.Lock()
+
+
+def get_mood_classifier():
+    """Shared classifier: the trained model at MOOD_MODEL_PATH if present, else the lexicon model"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                path = os.getenv("MOOD_MODEL_PATH", DEFAULT_MODEL_PATH)
+                try:
+                    _classifier = MoodClassifier.load(path) if os.path.exists(path) \
+                        else MoodClassifier.from_lexicon()
+                except Exception as e:
+                    print(f"Error loading mood model {path}: {e}")
+                    _classifier = MoodClassifier.from_lexicon()
+    return _classifier
+
+
+def log_label(text, mood, intensity, path=None):
+    """Append an LLM-produced label to the training log (JSONL)"""
+    path = path or os.getenv("MOOD_LABEL_LOG", DEFAULT_LABEL_LOG)
+    try:
+        line = json.dumps({"text": text, "mood": mood, "intensity": intensity}, ensure_ascii=False)
+        with _label_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except Exception as e:
+        print(f"Error logging mood label: {e}")
+
+
+def load_labels(path):
+    """Read labelled examples from a JSONL file, skipping malformed lines"""
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                examples.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return examples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or query the local mood classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="Train from logged Gemini labels")
+    train.add_argument("--labels", default=DEFAULT_LABEL_LOG, help="JSONL file of labelled messages")
+    train.add_argument("--out", default=DEFAULT_MODEL_PATH, help="Where to save the model")
+    train.add_argument("--epochs", type=int, default=10)
+    train.add_argument("--lr", type=float, default=0.1)
+    train.add_argument("--from-scratch", action="store_true", help="Don't start from the seed lexicon")
+
+    predict = sub.add_parser("predict", help="Classify a message")
+    predict.add_argument("text")
+
+    args = parser.parse_args()
+    if args.command == "train":
+        examples = load_labels(args.labels)
+        model = MoodClassifier() if args.from_scratch else MoodClassifier.from_lexicon()
+        accuracy = model.fit(examples, epochs=args.epochs, learning_rate=args.lr)
+        model.save(args.out)
+        print(f"✅ Trained on {len(examples)} examples (train accuracy {accuracy:.1%}), saved to {args.out}")
+    else:
+        print(json.dumps(get_mood_classifier().predict(args.text)))
+
+
+if __name__ == "__main__":
+    main()
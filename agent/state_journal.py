@@ -0,0 +1,243 @@
+"""
+Append-only state journal written by a background thread.
+
+`append()` only puts the record on a queue, so saving state costs nothing on the
+request path. A writer thread appends queued records to a JSONL journal in
+batches and periodically compacts it:
+- the latest state is written (every `compact_every` records or
+  `compact_interval` seconds) to a snapshot (the old `state.json` format plus a
+  turn count) via a temp file and atomic rename
+- the journal is trimmed to the most recent `keep_history` records, also via
+  atomic rename, so history is kept without growing forever
+
+Appends and compactions take an exclusive lock on `<journal>.lock`, so several
+processes (e.g. gunicorn workers) can share one journal without a compaction
+dropping lines another process appended. On startup the latest state is
+recovered from the snapshot plus any journal records written after it.
+"""
+
+import atexit
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single process only
+    fcntl = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STATE_DIR = os.path.join(REPO_ROOT, "server")
+
+
+def _atomic_write(path, text):
+    # A unique temp file per write, so concurrent writers never share (or truncate) one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on a sidecar file (the journal itself is replaced, so it can't hold the lock)"""
+    with open(path, "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class StateJournal:
+    """Batched, asynchronous JSONL journal with periodic snapshot compaction"""
+
+    def __init__(self, journal_path, snapshot_path, flush_interval=0.5, batch_size=256,
+                 compact_every=500, compact_interval=30.0, keep_history=5000):
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.lock_path = f"{journal_path}.lock"
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.keep_history = keep_history
+
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+        self._latest = None
+        self._turns = 0
+        self._since_compaction = 0
+        self._last_compaction = time.monotonic()
+
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="state-journal", daemon=True)
+        self._thread.start()
+
+    def append(self, record):
+        """Queue a state record for writing; never blocks on disk"""
+        if self._closed.is_set():
+            raise RuntimeError("State journal is closed")
+        self._queue.put(record)
+
+    def flush(self, timeout=None):
+        """Block until every record queued so far has been written"""
+        if self._closed.is_set():
+            # The writer drains the queue before it exits; don't wait on a stopped thread
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5):
+        """Flush, compact and stop the writer thread"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def latest(self):
+        """The most recent state record written, or None"""
+        return self._latest
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        running = True
+        while running:
+            batch, waiters = [], []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._compaction_due():
+                    self._safe_compact()
+                continue
+            # Drain whatever else is queued, up to one batch
+            while True:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+            except Exception as e:
+                print(f"Error writing state journal: {e}")
+            if self._compaction_due() or (not running and self._since_compaction):
+                self._safe_compact()
+            for waiter in waiters:
+                waiter.set()
+
+    def _write_batch(self, batch):
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        with _file_lock(self.lock_path), open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self._latest = batch[-1]
+        self._turns += len(batch)
+        self._since_compaction += len(batch)
+
+    def _compaction_due(self):
+        if not self._since_compaction:
+            return False
+        return (self._since_compaction >= self.compact_every
+                or time.monotonic() - self._last_compaction >= self.compact_interval)
+
+    def _safe_compact(self):
+        try:
+            self._compact()
+        except Exception as e:
+            print(f"Error compacting state journal: {e}")
+
+    def _compact(self):
+        if self._latest is None:
+            return
+        snapshot = dict(self._latest)
+        snapshot["turns"] = self._turns
+
+        # Write the snapshot, then read and replace the journal, under the lock, so no
+        # other process writes its snapshot or appends in between
+        with _file_lock(self.lock_path):
+            _atomic_write(self.snapshot_path, json.dumps(snapshot, indent=2, ensure_ascii=False))
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, "r", encoding="utf-8") as f:
+                    lines = f.readlines()
+                if len(lines) > self.keep_history:
+                    _atomic_write(self.journal_path, "".join(lines[-self.keep_history:]))
+        self._since_compaction = 0
+        self._last_compaction = time.monotonic()
+
+    def _recover(self):
+        """Latest state and turn count from the snapshot plus the journal records after it"""
+        snapshot = None
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self._turns = int(snapshot.pop("turns", 0))
+            self._latest = snapshot
+        except (OSError, ValueError):
+            pass
+
+        records = []
+        try:
+            with _file_lock(self.lock_path), open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass  # a line torn by a crash mid-write
+        except OSError:
+            return
+        if not records:
+            return
+        if snapshot is None:
+            self._turns = len(records)
+        elif snapshot in records:
+            # Records written after the last compaction, lost from the snapshot by a crash
+            last = len(records) - 1 - records[::-1].index(snapshot)
+            self._turns += len(records) - 1 - last
+        self._latest = records[-1]
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_state_journal():
+    """Shared journal under STATE_DIR (defaults to server/)"""
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                state_dir = os.getenv("STATE_DIR", DEFAULT_STATE_DIR)
+                _journal = StateJournal(
+                    journal_path=os.path.join(state_dir, "state.jsonl"),
+                    snapshot_path=os.path.join(state_dir, "state.json"),
+                )
+                atexit.register(_journal.close)
+    return _journal
@@ -1,7 +1,19 @@
+"""
+Compatibility wrapper around server/convert_chats.py, which holds the single
+chat converter (including streaming JSONL conversion for large exports).
+"""
+
 import json
+import os
+import sys
 from typing import List, Dict
 
-def process_chats_to_json(chats: List[str], output_file: str = "processed_chats.json") -> List[Dict[str, str]]:
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "server"))
+from convert_chats import chats_to_pairs, format_from_path, iter_messages
+
+
+def process_chats_to_json(chats: List[str], output_file: str = "processed_chats.json",
+                          drop_incomplete: bool = False) -> List[Dict[str, str]]:
     """
     Process a list of chat messages where even indexes are user messages 
     and odd indexes are system messages, then save as JSON.
@@ -9,23 +21,13 @@ def process_chats_to_json(chats: List[str], output_file: str = "processed_chats.
     Args:
         chats: List of chat messages
         output_file: Output JSON filename
+        drop_incomplete: Drop a trailing user message instead of pairing it
+            with an empty system message
         
     Returns:
         List of dictionaries with user/system message pairs
     """
-    
-    processed_chats = []
-    
-    # Process messages in pairs
-    for i in range(0, len(chats) - 1, 2):
-        user_message = chats[i]
-        system_message = chats[i + 1] if i + 1 < len(chats) else ""
-        
-        chat_pair = {
-            "user": user_message,
-            "system": system_message
-        }
-        processed_chats.append(chat_pair)
+    processed_chats = chats_to_pairs(chats, drop_incomplete)
     
     # Save to JSON file
     with open(output_file, 'w', encoding='utf-8') as f:
@@ -36,7 +38,8 @@ def process_chats_to_json(chats: List[str], output_file: str = "processed_chats.
 
 def load_chats_from_file(input_file: str) -> List[str]:
     """
-    Load chats from a text file (one message per line) or JSON file
+    Load chats from a text file (one message per line), JSON array or JSONL file;
+    the format comes from the .txt/.json/.jsonl extension, else from the content
     
     Args:
         input_file: Path to input file
@@ -44,52 +47,13 @@ def load_chats_from_file(input_file: str) -> List[str]:
     Returns:
         List of chat messages
     """
-    if input_file.endswith('.json'):
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                return data
-            else:
-                print("❌ JSON file should contain a list of messages")
-                return []
-    else:
-        # Text file - one message per line
-        with open(input_file, 'r', encoding='utf-8') as f:
-            return [line.strip() for line in f.readlines() if line.strip()]
-
-def example_usage():
-    """Example of how to use the chat processor"""
-    
-    # Example chat list (even = user, odd = system)
-    example_chats = [
-        "Hello, how are you?",                           # User (index 0)
-        "I'm doing great! How can I help you today?",    # System (index 1)
-        "Can you tell me about the weather?",            # User (index 2) 
-        "Sure! The weather today is sunny and warm.",    # System (index 3)
-        "That's wonderful, thank you!",                  # User (index 4)
-        "You're welcome! Is there anything else I can help with?",  # System (index 5)
-        "No, that's all for now."                        # User (index 6)
-    ]
-    
-    # Process and save
-    processed = process_chats_to_json(example_chats, "example_chats.json")
-    
-    # Display the result
-    print("\n📋 Processed chats:")
-    for i, chat in enumerate(processed):
-        print(f"\nChat {i + 1}:")
-        print(f"  User: {chat['user']}")
-        print(f"  System: {chat['system']}")
+    with open(input_file, 'r', encoding='utf-8') as f:
+        try:
+            return list(iter_messages(f, format_from_path(input_file)))
+        except ValueError as e:
+            print(f"❌ Could not read chats from {input_file}: {e}")
+            return []
 
 if __name__ == "__main__":
-    print("🤖 Chat Processor - Convert chat lists to JSON format")
-    print("=" * 50)
-    
-    # Run example
-    example_usage()
-    
-    print("\n" + "=" * 50)
-    print("💡 To use with your own data:")
-    print("1. Import the functions: from chat_processor import process_chats_to_json")
-    print("2. Call: process_chats_to_json(your_chat_list, 'output.json')")
-    print("3. Or load from file: load_chats_from_file('input.txt')")
\ No newline at end of file
+    print("💡 Convert a chat export to JSONL pairs with:")
+    print("   python server/convert_chats.py input.json output.jsonl")
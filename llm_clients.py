@@ -0,0 +1,116 @@
+"""
+Shared Gemini client registry used by the server, the agent and the email report.
+
+Clients are created lazily on first use and cached by model name and settings,
+so repeated calls reuse the same client (and its connections) instead of
+building a new one per request. The `google.generativeai` SDK is configured
+exactly once, from GEMINI_API_KEY (or GOOGLE_API_KEY as a fallback), so
+modules no longer race each other reconfiguring it with different keys.
+
+GEMINI_API_ENDPOINT points the SDK at another Gemini-compatible REST endpoint,
+e.g. the local stand-in in server/llm_stub.py for offline load tests.
+A model hook (set_model_hook) can wrap or replace the models handed out, which
+is how server/recorder.py records Gemini calls and replays them from an archive.
+"""
+
+import json
+import os
+import threading
+
+_lock = threading.RLock()
+_clients = {}
+_genai_configured = False
+_model_hook = None
+
+
+def get_api_key():
+    """The Gemini API key, preferring GEMINI_API_KEY over GOOGLE_API_KEY"""
+    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("No Gemini API key configured. Set GEMINI_API_KEY or GOOGLE_API_KEY.")
+    return api_key
+
+
+def _settings_key(settings):
+    # Settings may contain dicts (e.g. generation_config), so key on their JSON form
+    return json.dumps(settings, sort_keys=True, default=str)
+
+
+def _configure_genai():
+    global _genai_configured
+    import google.generativeai as genai
+
+    if not _genai_configured:
+        endpoint = os.getenv("GEMINI_API_ENDPOINT")
+        if endpoint:
+            genai.configure(api_key=get_api_key(), transport="rest",
+                            client_options={"api_endpoint": endpoint})
+        else:
+            genai.configure(api_key=get_api_key())
+        _genai_configured = True
+    return genai
+
+
+def set_model_hook(hook):
+    """
+    Route get_genai_model() through hook(model_name, create) -> model, where create()
+    returns the shared real client; None removes the hook
+    """
+    global _model_hook
+    _model_hook = hook
+
+
+def get_genai_model(model_name, **settings):
+    """
+    Shared `google.generativeai.GenerativeModel` for a model name and settings.
+
+    Args:
+        model_name: e.g. "gemini-1.5-flash"
+        **settings: extra GenerativeModel arguments (generation_config, ...)
+    """
+    if _model_hook is not None:
+        return _model_hook(model_name, lambda: _get_genai_model(model_name, settings))
+    return _get_genai_model(model_name, settings)
+
+
+def _get_genai_model(model_name, settings):
+    key = ("genai", model_name, _settings_key(settings))
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                genai = _configure_genai()
+                client = genai.GenerativeModel(model_name, **settings)
+                _clients[key] = client
+    return client
+
+
+def get_chat_model(model_name, **settings):
+    """
+    Shared LangChain `ChatGoogleGenerativeAI` for a model name and settings.
+
+    Args:
+        model_name: e.g. "gemini-2.5-flash"
+        **settings: extra ChatGoogleGenerativeAI arguments (temperature, ...)
+    """
+    key = ("langchain", model_name, _settings_key(settings))
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+
+                client = ChatGoogleGenerativeAI(
+                    model=model_name, google_api_key=get_api_key(), **settings)
+                _clients[key] = client
+    return client
+
+
+def reset_clients():
+    """Drop all cached clients (e.g. after rotating the API key)"""
+    global _genai_configured
+    with _lock:
+        _clients.clear()
+        _genai_configured = False
@@ -0,0 +1,182 @@
+"""
+Admission control for the expensive request stages.
+
+Each pool (e.g. transcription, chat, reports) has a concurrency cap and a bounded
+wait queue. A request that finds its pool full waits in the queue for up to
+`queue_timeout` seconds; when the queue is full or the wait times out the request
+is shed with Overloaded, which the servers turn into 503 + Retry-After. When a
+slot frees up, waiters in higher-priority pools (lower number) are admitted
+before lower-priority ones, so interactive chat goes ahead of report generation.
+An optional `total` cap bounds the work in flight across all pools.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import ADMISSION_SHED
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """A request was shed because its pool is at capacity"""
+
+    def __init__(self, pool, retry_after):
+        super().__init__(f"Server busy ({pool}), retry in {retry_after}s")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class _Pool:
+    def __init__(self, name, limit, queue_depth, priority, queue_timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.priority = priority
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        # Moving average of how long a slot is held, for Retry-After
+        self.avg_hold = 1.0
+
+
+class Slot:
+    """An admitted request; release() is idempotent"""
+
+    def __init__(self, controller, pool):
+        self._controller = controller
+        self._pool = pool
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self._pool, time.monotonic() - self._started)
+
+
+class AdmissionController:
+    """Per-pool concurrency caps and wait queues with priority between pools"""
+
+    def __init__(self, total=None):
+        self.total = total
+        self._pools = {}
+        self._active = 0
+        self._cond = threading.Condition()
+
+    def add_pool(self, name, limit, queue_depth=0, priority=0, queue_timeout=10.0):
+        """
+        Args:
+            limit: requests of this pool allowed in flight at once
+            queue_depth: requests allowed to wait for a slot before new ones are shed
+            priority: lower numbers are admitted first when several pools have waiters
+            queue_timeout: longest a request waits for a slot before it is shed
+        """
+        self._pools[name] = _Pool(name, limit, queue_depth, priority, queue_timeout)
+        return self
+
+    def _can_admit(self, pool):
+        if pool.active >= pool.limit:
+            return False
+        if self.total is not None and self._active >= self.total:
+            return False
+        # Leave the slot to a waiting higher-priority request that could take it
+        return not any(
+            other.waiting and other.priority < pool.priority and other.active < other.limit
+            for other in self._pools.values())
+
+    def _retry_after(self, pool):
+        backlog = (pool.active + pool.waiting + 1) / max(1, pool.limit)
+        return max(1, math.ceil(pool.avg_hold * backlog))
+
+    def _shed(self, pool):
+        pool.shed += 1
+        ADMISSION_SHED.inc(pool=pool.name)
+        retry_after = self._retry_after(pool)
+        logger.warning(f"Shedding {pool.name} request ({pool.active} active, {pool.waiting} waiting)")
+        raise Overloaded(pool.name, retry_after)
+
+    def acquire(self, name, timeout=None):
+        """
+        Admit a request to pool `name`, waiting in its queue if needed.
+
+        Returns a Slot to release when the work is done; raises Overloaded if the
+        queue is full or no slot frees up within the timeout.
+        """
+        pool = self._pools[name]
+        timeout = pool.queue_timeout if timeout is None else timeout
+        with self._cond:
+            if not self._can_admit(pool):
+                if pool.waiting >= pool.queue_depth:
+                    self._shed(pool)
+                pool.waiting += 1
+                deadline = time.monotonic() + timeout
+                try:
+                    while not self._can_admit(pool):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._shed(pool)
+                        self._cond.wait(remaining)
+                finally:
+                    pool.waiting -= 1
+                    # A shed high-priority waiter may unblock lower-priority ones
+                    self._cond.notify_all()
+            pool.active += 1
+            self._active += 1
+        return Slot(self, pool)
+
+    def _release(self, pool, held):
+        with self._cond:
+            pool.active -= 1
+            self._active -= 1
+            pool.avg_hold = 0.8 * pool.avg_hold + 0.2 * held
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, name, timeout=None):
+        """Context manager form of acquire()"""
+        slot = self.acquire(name, timeout)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def wrap(self, name, fn, timeout=None):
+        """fn admitted through pool `name`, e.g. for background workers"""
+        def admitted(*args, **kwargs):
+            with self.slot(name, timeout):
+                return fn(*args, **kwargs)
+        admitted.__name__ = getattr(fn, "__name__", "admitted")
+        return admitted
+
+    def stats(self):
+        """Active, waiting and shed counts per pool"""
+        with self._cond:
+            return {name: {"active": p.active, "waiting": p.waiting, "shed": p.shed, "limit": p.limit}
+                    for name, p in self._pools.items()}
+
+
+def from_env(pools, total=None):
+    """
+    Controller for {name: (limit, queue_depth, priority)} defaults, each overridable with
+    ADMISSION_<NAME>_LIMIT / ADMISSION_<NAME>_QUEUE; ADMISSION_QUEUE_TIMEOUT sets the wait
+    and ADMISSION_TOTAL the cap across all pools
+    """
+    total = os.getenv("ADMISSION_TOTAL", total)
+    controller = AdmissionController(total=int(total) if total else None)
+    queue_timeout = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+    for name, (limit, queue_depth, priority) in pools.items():
+        prefix = f"ADMISSION_{name.upper()}"
+        controller.add_pool(
+            name,
+            limit=int(os.getenv(f"{prefix}_LIMIT", limit)),
+            queue_depth=int(os.getenv(f"{prefix}_QUEUE", queue_depth)),
+            priority=priority,
+            queue_timeout=queue_timeout,
+        )
+    return controller
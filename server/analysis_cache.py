@@ -0,0 +1,154 @@
+"""
+On-disk memoization of conversation analyses.
+
+Results are keyed by a hash of the normalized transcript, the rubric version and
+the model, so re-requesting a report for an unchanged conversation returns
+instantly. Concurrent requests for the same key (double-clicks) wait for the
+first one instead of starting a second LLM call. The least recently used entries
+are evicted once the cache holds more than `max_entries`.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analysis_cache")
+
+
+def normalize_transcript(chats):
+    """Canonical form of a transcript: (role, text) pairs with whitespace collapsed"""
+    normalized = []
+    for i, message in enumerate(chats):
+        if isinstance(message, dict):
+            role = message.get("role", "user" if i % 2 == 0 else "assistant")
+            content = message.get("content", "")
+        else:
+            role = "user" if i % 2 == 0 else "assistant"
+            content = message
+        normalized.append([role, " ".join(str(content).split())])
+    return normalized
+
+
+def make_key(chats, rubric_version, model):
+    """Cache key for a transcript analysed with a given rubric and model"""
+    canonical = json.dumps(
+        {"rubric": rubric_version, "model": model, "transcript": normalize_transcript(chats)},
+        ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """Directory of JSON entries with LRU eviction and per-key single-flight"""
+
+    def __init__(self, cache_dir, max_entries=500):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._count = len(self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _entries(self):
+        return [name for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+
+    def get(self, key):
+        """Cached analysis text, or None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Bump the mtime so eviction is least-recently-used
+            os.utime(path, None)
+            CACHE_LOOKUPS.inc(result="hit")
+            return entry["analysis"]
+        except (OSError, ValueError, KeyError):
+            CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+    def put(self, key, analysis):
+        path = self._path(key)
+        existed = os.path.exists(path)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"analysis": analysis}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if not existed:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in self._entries():
+            try:
+                entries.append((os.path.getmtime(os.path.join(self.cache_dir, name)), name))
+            except OSError:
+                continue
+        entries.sort()
+        excess = len(entries) - self.max_entries
+        for _, name in entries[:max(0, excess)]:
+            try:
+                os.unlink(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+        self._count = min(len(entries), self.max_entries)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached analysis for `key`, computing and storing it on a miss.
+
+        If another thread is already computing the same key, wait for its result.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            logger.info(f"Analysis cache hit ({key[:12]})")
+            return cached
+
+        with self._lock:
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight[key] = threading.Event()
+
+        if not owner:
+            event.wait()
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            # The first computation failed; fall through and try ourselves
+            return compute()
+
+        try:
+            result = compute()
+            self.put(key, result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """Shared cache for ANALYSIS_CACHE_DIR (defaults to server/analysis_cache)"""
+    cache_dir = os.getenv("ANALYSIS_CACHE_DIR", DEFAULT_CACHE_DIR)
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = _caches[cache_dir] = AnalysisCache(
+                cache_dir, max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "500")))
+        return cache
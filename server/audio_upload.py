@@ -0,0 +1,354 @@
+"""
+Bounded, streamed audio uploads.
+
+The request body is read in chunks straight from the WSGI input and the
+multipart form is parsed incrementally (werkzeug's sans-IO MultipartDecoder), so
+nothing is spooled to disk. For WAV uploads the header is parsed as soon as it
+arrives: non-audio payloads and clips over the size or duration limits are
+rejected before the rest of the body is read, and 8/16/32-bit PCM and 32-bit
+float samples are decoded chunk by chunk into a PCM buffer preallocated from
+the header. Other WAV encodings (24-bit, 64-bit float, mu-law, ...) and
+compressed formats (Ogg, WebM, FLAC, MP3, MP4) are recognised by their magic
+bytes and collected, size-capped, for decoding afterwards.
+"""
+
+import io
+import logging
+import struct
+
+import numpy as np
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+logger = logging.getLogger(__name__)
+
+WHISPER_SAMPLE_RATE = 16000
+CHUNK_SIZE = 64 * 1024
+# A WAV header (with any metadata chunks) has to fit in this many bytes
+MAX_HEADER_BYTES = 64 * 1024
+# Multipart boundaries and part headers on top of the audio itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+# WAVE format tags
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+_SAMPLE_TYPES = {
+    (WAVE_FORMAT_PCM, 8): np.dtype("u1"),
+    (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+}
+
+
+class UploadError(Exception):
+    """A rejected upload; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_format(head):
+    """Container format from the first bytes of a file, or None if it isn't audio"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"\x1aE\xdf\xa3":
+        return "webm"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def parse_wav_header(data):
+    """
+    Parse a RIFF/WAVE header.
+
+    Returns (format dict, offset of the sample data), or None if `data` doesn't
+    reach the start of the data chunk yet. Raises UploadError for unsupported files.
+    """
+    if len(data) < 12:
+        return None
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise UploadError("Not a WAV file", 415)
+
+    fmt = None
+    offset = 12
+    while len(data) >= offset + 8:
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack_from("<I", data, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b"data":
+            if fmt is None:
+                raise UploadError("WAV data before format chunk", 415)
+            fmt["data_size"] = chunk_size
+            return fmt, body
+        if len(data) < body + chunk_size:
+            return None
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate, byte_rate, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if audio_format == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # The real format tag is the first field of the sub-format GUID
+                audio_format = struct.unpack_from("<H", data, body + 24)[0]
+            if not channels or not sample_rate:
+                raise UploadError("Invalid WAV format chunk", 415)
+            # dtype is None for encodings the PCM fast path doesn't handle; those are decoded later
+            fmt = {"channels": channels, "sample_rate": sample_rate, "byte_rate": byte_rate,
+                   "dtype": _SAMPLE_TYPES.get((audio_format, bits))}
+        # Chunks are padded to an even size
+        offset = body + chunk_size + (chunk_size & 1)
+    return None
+
+
+class PcmBuffer:
+    """Samples decoded from raw little-endian bytes into a preallocated array"""
+
+    def __init__(self, dtype, channels, max_frames, expected_frames=None, data_bytes=None):
+        self.dtype = dtype
+        self.channels = channels
+        self.max_frames = max_frames
+        # Bytes of sample data still to come; whatever follows (LIST/INFO chunks, ...) isn't audio
+        self._remaining = data_bytes
+        # Without a reliable size in the header, start small and grow as needed
+        capacity = min(expected_frames or 1 << 18, max_frames) * channels
+        self._samples = np.empty(capacity, dtype=dtype)
+        self._count = 0
+        self._carry = b""
+
+    def write(self, data):
+        if self._remaining is not None:
+            data = data[:self._remaining]
+            self._remaining -= len(data)
+        data = self._carry + data
+        usable = len(data) - len(data) % self.dtype.itemsize
+        self._carry = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=self.dtype)
+        end = self._count + len(samples)
+        if end > self._samples.size:
+            if end > self.max_frames * self.channels:
+                raise UploadError("Audio is longer than allowed", 413)
+            # The header under-reported the size (e.g. a streamed recording); grow
+            grown = np.empty(min(max(end, self._samples.size * 2), self.max_frames * self.channels), self.dtype)
+            grown[:self._count] = self._samples[:self._count]
+            self._samples = grown
+        self._samples[self._count:end] = samples
+        self._count = end
+
+    def frames(self):
+        """(frames, channels) float32 array scaled to [-1, 1]"""
+        count = self._count - self._count % self.channels
+        samples = self._samples[:count]
+        if self.dtype.kind == "u":
+            audio = (samples.astype(np.float32) - 128.0) / 128.0
+        elif self.dtype.kind == "i":
+            audio = samples.astype(np.float32) / float(np.iinfo(self.dtype).max + 1)
+        else:
+            audio = samples.astype(np.float32, copy=False)
+        return audio.reshape(-1, self.channels)
+
+
+class AudioUpload:
+    """A received clip: decoded PCM for WAV, or the encoded bytes of a compressed format"""
+
+    def __init__(self, filename, container, frames=None, sample_rate=None, encoded=None):
+        self.filename = filename
+        self.container = container
+        self.frames = frames
+        self.sample_rate = sample_rate
+        self.encoded = encoded
+
+    @property
+    def size(self):
+        return len(self.encoded) if self.encoded is not None else self.frames.nbytes
+
+    @property
+    def duration(self):
+        """Length in seconds, if known before decoding"""
+        if self.frames is None:
+            return None
+        return len(self.frames) / self.sample_rate
+
+    def decode(self):
+        """(mono float32 samples, sample rate), decoding compressed formats in memory"""
+        if self.frames is not None:
+            audio, sample_rate = self.frames, self.sample_rate
+        else:
+            import soundfile as sf
+            audio, sample_rate = sf.read(io.BytesIO(self.encoded), dtype="float32", always_2d=True)
+
+        audio = audio.mean(axis=1) if audio.shape[1] > 1 else audio[:, 0]
+        return np.ascontiguousarray(audio, dtype=np.float32), sample_rate
+
+    def to_whisper(self):
+        """Mono float32 samples at 16 kHz, the input Whisper expects"""
+        return resample(*self.decode())
+
+
+def resample(audio, sample_rate):
+    """Resample mono samples to Whisper's 16 kHz"""
+    if sample_rate != WHISPER_SAMPLE_RATE:
+        import librosa
+        audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=WHISPER_SAMPLE_RATE)
+    return audio
+
+
+def _receive(chunks, filename, max_bytes, max_seconds):
+    """Build an AudioUpload from the file's data chunks, checking limits as they arrive"""
+    head = b""
+    pcm = None
+    encoded = None
+    container = None
+    total = 0
+
+    for chunk in chunks:
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadError(f"Audio file is larger than {max_bytes} bytes", 413)
+
+        if pcm is not None:
+            pcm.write(chunk)
+            continue
+        if encoded is not None:
+            encoded.extend(chunk)
+            continue
+
+        head += chunk
+        if container is None and len(head) >= 12:
+            container = sniff_format(head)
+            if container is None:
+                raise UploadError("Uploaded file is not a supported audio format", 415)
+            if container != "wav":
+                encoded = bytearray(head)
+                continue
+        if container == "wav":
+            parsed = parse_wav_header(head)
+            if parsed is None:
+                if len(head) > MAX_HEADER_BYTES:
+                    raise UploadError("WAV header is too large", 415)
+                continue
+            fmt, data_offset = parsed
+            # Streamed recordings may leave the size as 0 or 0xFFFFFFFF; check as we read
+            sized = fmt["data_size"] not in (0, 0xFFFFFFFF)
+            if fmt["dtype"] is None:
+                if sized and fmt["byte_rate"] and fmt["data_size"] / fmt["byte_rate"] > max_seconds:
+                    raise UploadError(f"Audio is longer than {max_seconds} seconds", 413)
+                # Collected like a compressed format; the duration is checked again after decoding
+                encoded = bytearray(head)
+                continue
+            frame_size = fmt["dtype"].itemsize * fmt["channels"]
+            max_frames = int(max_seconds * fmt["sample_rate"])
+            expected_frames = fmt["data_size"] // frame_size
+            if sized and expected_frames > max_frames:
+                raise UploadError(f"Audio is longer than {max_seconds} seconds", 413)
+            pcm = PcmBuffer(fmt["dtype"], fmt["channels"], max_frames, expected_frames or None,
+                            data_bytes=fmt["data_size"] if sized else None)
+            pcm.write(head[data_offset:])
+            head = b""
+
+    if total == 0:
+        raise UploadError("Audio file is empty")
+    if pcm is not None:
+        return AudioUpload(filename, container, frames=pcm.frames(), sample_rate=fmt["sample_rate"])
+    if encoded is not None:
+        return AudioUpload(filename, container, encoded=bytes(encoded))
+    if container is None and len(head) < 12:
+        raise UploadError("Uploaded file is not a supported audio format", 415)
+    raise UploadError("Incomplete WAV header", 415)
+
+
+def _read_chunks(stream, chunk_size=CHUNK_SIZE):
+    while True:
+        try:
+            chunk = stream.read(chunk_size)
+        except RequestEntityTooLarge:
+            # The body went past MAX_CONTENT_LENGTH (e.g. a chunked upload without a length)
+            raise UploadError("Upload is too large", 413)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _multipart_file(stream, boundary, field, max_bytes):
+    """(filename, data chunks) of the `field` file part of a multipart body, parsed as it streams"""
+    decoder = MultipartDecoder(boundary, max_form_memory_size=MULTIPART_OVERHEAD)
+    body = _read_chunks(stream)
+    current = None
+    filename = None
+
+    def events():
+        for chunk in body:
+            decoder.receive_data(chunk)
+            while True:
+                event = decoder.next_event()
+                if isinstance(event, NeedData):
+                    break
+                yield event
+        decoder.receive_data(None)
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, (NeedData, Epilogue)):
+                return
+            yield event
+
+    stream_events = events()
+    for event in stream_events:
+        if isinstance(event, File) and event.name == field:
+            filename = event.filename
+            current = event
+            break
+    if current is None:
+        raise UploadError("No audio file provided")
+    if not filename:
+        raise UploadError("No file selected")
+
+    def data():
+        for event in stream_events:
+            if isinstance(event, Data):
+                if event.data:
+                    yield event.data
+                if not event.more_data:
+                    return
+            elif event is not None:
+                return
+
+    return filename, data()
+
+
+def read_audio_file(f, max_bytes, max_seconds, filename=""):
+    """AudioUpload from an open binary file, parsed and limited exactly like an upload"""
+    return _receive(_read_chunks(f), filename, max_bytes, max_seconds)
+
+
+def read_audio_upload(request, max_bytes, max_seconds, field="file"):
+    """
+    Stream the audio of a request into an AudioUpload.
+
+    Accepts a multipart form with the clip in `field`, or a raw audio/* or
+    application/octet-stream body. Raises UploadError (400, 413 or 415).
+    """
+    if request.content_length is not None and request.content_length > max_bytes + MULTIPART_OVERHEAD:
+        raise UploadError(f"Audio file is larger than {max_bytes} bytes", 413)
+
+    mimetype, options = parse_options_header(request.headers.get("Content-Type", ""))
+    if mimetype == "multipart/form-data":
+        boundary = options.get("boundary")
+        if not boundary:
+            raise UploadError("Missing multipart boundary")
+        filename, chunks = _multipart_file(request.stream, boundary.encode("latin-1"), field, max_bytes)
+    elif mimetype.startswith("audio/") or mimetype == "application/octet-stream":
+        filename, chunks = "", _read_chunks(request.stream)
+    else:
+        raise UploadError("No audio file provided")
+
+    upload = _receive(chunks, filename, max_bytes, max_seconds)
+    logger.info(f"Received {upload.container} upload {filename!r} ({upload.size} bytes"
+                + (f", {upload.duration:.1f}s)" if upload.duration is not None else ")"))
+    return upload
@@ -0,0 +1,230 @@
+"""
+Batch evaluation of archived transcripts.
+
+Reads transcripts in the chats.json pair format ([{"user": ..., "system": ...}])
+from a directory of .json files or from a JSONL stream, and evaluates them with
+bounded concurrency under a request rate limit. Results are appended to a JSONL
+file, which doubles as the checkpoint: re-running with the same output skips
+transcripts that were already evaluated successfully.
+
+    python batch_evaluate.py sessions/ -o results.jsonl --workers 8 --rate 2
+    python batch_evaluate.py sessions.jsonl -o results.jsonl --local-only
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rubric_scorer import score_transcript
+
+
+def pairs_to_chats(pairs):
+    """Flatten {"user", "system"} pairs back into the alternating chats list"""
+    chats = []
+    for pair in pairs:
+        chats.append(pair.get("user", ""))
+        chats.append(pair.get("system", ""))
+    # A trailing user message was stored with an empty system message
+    if chats and not chats[-1]:
+        chats.pop()
+    return chats
+
+
+def _record_to_transcript(record, default_id):
+    """(id, chats) for one JSONL record: a list of pairs, or {"id", "pairs" or "chats"}"""
+    if isinstance(record, list):
+        return default_id, pairs_to_chats(record)
+    transcript_id = str(record.get("id", default_id))
+    if "pairs" in record:
+        return transcript_id, pairs_to_chats(record["pairs"])
+    return transcript_id, list(record["chats"])
+
+
+def iter_transcripts(source):
+    """
+    Yield (transcript_id, chats) from a directory of .json files, a .jsonl file,
+    or "-" for JSONL on stdin. Transcripts are read lazily, one at a time.
+    """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(source, name), "r", encoding="utf-8") as f:
+                yield name, pairs_to_chats(json.load(f))
+        return
+
+    f = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                transcript = _record_to_transcript(json.loads(line), f"line-{line_number}")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"⚠️ Skipping line {line_number}: {e}")
+                continue
+            yield transcript
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+class TokenBucket:
+    """Blocking rate limiter: `rate` acquisitions per second, bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def completed_ids(output_path):
+    """Ids already evaluated successfully in an existing results file"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A partially written last line from an interrupted run
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    # pct * n / 100 rather than pct / 100 * n, so exact ranks don't pick up float error
+    index = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+def local_evaluation(chats):
+    """Deterministic rubric scores only, no LLM call"""
+    return {"scores": score_transcript(chats)}
+
+
+def llm_evaluation(chats):
+    """Rubric scores plus the full LLM-written analysis"""
+    from simple_email import generate_analysis
+    return {"scores": score_transcript(chats), "analysis": generate_analysis(chats)}
+
+
+def run_batch(transcripts, output_path, evaluate=llm_evaluation, workers=4, rate=None, resume=True):
+    """
+    Evaluate (id, chats) transcripts concurrently and append results to output_path
+
+    Args:
+        transcripts: iterable of (transcript_id, chats)
+        evaluate: function chats -> dict of result fields
+        workers: maximum number of evaluations in flight
+        rate: maximum evaluations started per second (None for no limit)
+        resume: skip ids already marked "ok" in output_path
+    Returns:
+        Stats dict: counts, wall time, throughput and latency percentiles
+    """
+    done = completed_ids(output_path) if resume else set()
+    bucket = TokenBucket(rate, burst=workers) if rate else None
+    slots = threading.Semaphore(workers)
+    write_lock = threading.Lock()
+    latencies = []
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+
+    def evaluate_one(transcript_id, chats, out):
+        start = time.perf_counter()
+        try:
+            record = {"id": transcript_id, "status": "ok", **evaluate(chats)}
+        except Exception as e:
+            record = {"id": transcript_id, "status": "error", "error": str(e)}
+        record["latency"] = round(time.perf_counter() - start, 3)
+        try:
+            try:
+                line = json.dumps(record, ensure_ascii=False)
+            except (TypeError, ValueError) as e:
+                # Written as an error instead, so it is counted and retried on --resume
+                record = {"id": transcript_id, "status": "error", "error": f"Unserializable result: {e}",
+                          "latency": record["latency"]}
+                line = json.dumps(record, ensure_ascii=False)
+            with write_lock:
+                out.write(line + "\n")
+                out.flush()
+                counts[record["status"]] += 1
+                latencies.append(record["latency"])
+        finally:
+            slots.release()
+
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        for transcript_id, chats in transcripts:
+            if transcript_id in done:
+                counts["skipped"] += 1
+                continue
+            # Bound the number of transcripts held in memory to the ones in flight
+            slots.acquire()
+            if bucket:
+                bucket.acquire()
+            pool.submit(evaluate_one, transcript_id, chats, out)
+    elapsed = time.perf_counter() - started
+
+    evaluated = counts["ok"] + counts["error"]
+    return {
+        **counts,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(evaluated / elapsed, 3) if elapsed > 0 else None,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate archived transcripts in parallel")
+    parser.add_argument("source", help="Directory of .json transcripts, a .jsonl file, or - for stdin")
+    parser.add_argument("-o", "--output", default="evaluations.jsonl", help="JSONL results file (also the checkpoint)")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum evaluations in flight")
+    parser.add_argument("--rate", type=float, default=None, help="Maximum evaluations started per second")
+    parser.add_argument("--local-only", action="store_true", help="Only compute local rubric scores (no LLM)")
+    parser.add_argument("--no-resume", action="store_true", help="Re-evaluate transcripts already in the output")
+
+    args = parser.parse_args()
+    stats = run_batch(
+        iter_transcripts(args.source), args.output,
+        evaluate=local_evaluation if args.local_only else llm_evaluation,
+        workers=args.workers, rate=args.rate, resume=not args.no_resume)
+
+    print(f"✅ Evaluated {stats['ok']} transcripts ({stats['error']} failed, {stats['skipped']} already done) "
+          f"in {stats['elapsed']}s, {stats['throughput']}/s")
+    if stats["p50"] is not None:
+        print(f"   Latency p50 {stats['p50']}s, p90 {stats['p90']}s, p99 {stats['p99']}s")
+
+
+if __name__ == "__main__":
+    main()
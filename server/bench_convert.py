@@ -0,0 +1,88 @@
+"""
+Throughput benchmark for the streaming chat converter (convert_chats.convert_file).
+
+Writes a synthetic chat export of --messages messages in each input format,
+converts it to JSONL pairs and reports MB/s, messages/s and peak Python memory.
+
+    python bench_convert.py --messages 1000000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from convert_chats import convert_file
+
+SAMPLE_MESSAGES = [
+    "Hey, how have you been lately?",
+    "Honestly not great, I've been really stressed with exams and I can't sleep.",
+    "That sounds exhausting. I'm here for you, do you want to talk about it?",
+    "Yeah... I just feel like I'm falling behind everyone else.",
+]
+
+
+def write_export(path, fmt, count):
+    """Synthetic chat export of `count` messages"""
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            f.write("[\n")
+        for i in range(count):
+            message = f"{SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)]} ({i})"
+            if fmt == "text":
+                f.write(message + "\n")
+            elif fmt == "jsonl":
+                f.write(json.dumps(message) + "\n")
+            else:
+                f.write(("  " if i == 0 else ",\n  ") + json.dumps(message))
+        if fmt == "json":
+            f.write("\n]\n")
+
+
+def bench(fmt, count, directory, trace_memory):
+    source = os.path.join(directory, f"export.{fmt}")
+    target = os.path.join(directory, f"pairs.{fmt}.jsonl")
+    write_export(source, fmt, count)
+    size_mb = os.path.getsize(source) / 1e6
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    pairs = convert_file(source, target, fmt)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+
+    return {
+        "format": fmt,
+        "messages": count,
+        "pairs": pairs,
+        "input_mb": round(size_mb, 2),
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(size_mb / elapsed, 2),
+        "messages_per_s": round(count / elapsed),
+        "peak_memory_kb": round(peak / 1024) if peak is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming chat converter")
+    parser.add_argument("--messages", type=int, default=200000, help="Messages in the synthetic export")
+    parser.add_argument("--formats", nargs="+", default=["text", "json", "jsonl"])
+    parser.add_argument("--memory", action="store_true",
+                        help="Also measure peak Python memory (tracemalloc slows the conversion down)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in args.formats:
+            result = bench(fmt, args.messages, directory, args.memory)
+            memory = f", peak {result['peak_memory_kb']} KB" if args.memory else ""
+            print(f"{fmt:>5}: {result['input_mb']} MB in {result['seconds']}s -> "
+                  f"{result['mb_per_s']} MB/s, {result['messages_per_s']} messages/s{memory}")
+
+
+if __name__ == "__main__":
+    main()
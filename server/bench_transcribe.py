@@ -0,0 +1,276 @@
+"""
+Offline benchmark for the ASR path (whisper_server.transcribe_audio_file).
+
+Runs a matrix of generated clips (durations x sample rates x mono/stereo), plus
+any audio files given with --clips, straight through decode, resample and
+Whisper without a running server. Reports per-stage times, the real-time
+factor (processing seconds per second of audio), peak RSS, and throughput at
+several concurrency levels. --output writes the results as JSON and --compare
+prints the change against an earlier run.
+
+    python bench_transcribe.py --durations 1 5 15 --rates 16000 48000 --output base.json
+    python bench_transcribe.py --model small --compare base.json
+
+Generated clips are a deterministic voiced-speech-like signal (harmonics with a
+syllable envelope and pauses); use --clips with real recordings for model-time
+numbers that reflect actual speech.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_upload import read_audio_file
+from batch_evaluate import percentile
+
+STAGES = ("decode", "resample", "decode_ffmpeg", "whisper")
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3", ".webm", ".m4a", ".mp4")
+# Read limits for benchmark clips; transcribe_audio_file still enforces AUDIO_MAX_SECONDS
+MAX_BYTES = 1 << 30
+MAX_SECONDS = 3600
+
+
+def synth_speech(seconds, sample_rate, channels=1, seed=0):
+    """PCM16 WAV bytes of a deterministic speech-like signal"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    # Gliding pitch with harmonics shaped by two formant-like peaks
+    f0 = 140 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    signal = np.zeros_like(t)
+    for harmonic in range(1, 16):
+        if harmonic * 180 >= sample_rate / 2:
+            break
+        weight = np.exp(-((harmonic * 180 - 500) / 300) ** 2) + 0.6 * np.exp(-((harmonic * 180 - 1500) / 500) ** 2)
+        signal += (weight + 0.05) * np.sin(harmonic * phase)
+    # ~4 syllables a second, with a short pause every couple of seconds
+    envelope = np.clip(np.sin(2 * np.pi * 2 * t), 0, None) * (np.sin(2 * np.pi * 0.4 * t) > -0.8)
+    signal = 0.3 * signal / np.abs(signal).max() * envelope + 0.003 * rng.standard_normal(len(t))
+    if channels == 2:
+        signal = np.stack([signal, 0.8 * np.roll(signal, sample_rate // 1000)], axis=1)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def generated_clips(durations, rates, channel_counts):
+    """(name, AudioUpload) for every combination in the matrix"""
+    for seconds in durations:
+        for rate in rates:
+            for channels in channel_counts:
+                name = f"{seconds:g}s-{rate}hz-{'stereo' if channels == 2 else 'mono'}"
+                data = synth_speech(seconds, rate, channels)
+                yield name, read_audio_file(io.BytesIO(data), MAX_BYTES, MAX_SECONDS, f"{name}.wav")
+
+
+def file_clips(paths):
+    """(name, AudioUpload) for audio files, and those in directories, given on the command line"""
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            files = [path]
+        for file_path in files:
+            with open(file_path, "rb") as f:
+                yield os.path.basename(file_path), read_audio_file(f, MAX_BYTES, MAX_SECONDS, file_path)
+
+
+def audio_seconds(upload):
+    """Clip length, decoding compressed clips to find it"""
+    if upload.duration is not None:
+        return upload.duration
+    audio, sample_rate = upload.decode()
+    return len(audio) / sample_rate
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1 << 20) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hide Whisper's per-segment output"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def bench_clip(transcribe, name, upload, repeat):
+    """Median per-stage seconds and real-time factors for one clip"""
+    duration = audio_seconds(upload)
+    runs = []
+    for _ in range(repeat):
+        timings = {}
+        start = time.perf_counter()
+        with quiet():
+            result = transcribe(upload, timings)
+        timings["total"] = time.perf_counter() - start
+        runs.append(timings)
+
+    stats = {stage: round(statistics.median(run.get(stage, 0.0) for run in runs), 4)
+             for stage in STAGES + ("total",) if any(stage in run for run in runs)}
+    return {
+        "clip": name,
+        "container": upload.container,
+        "duration": round(duration, 3),
+        "sample_rate": upload.sample_rate,
+        "channels": upload.frames.shape[1] if upload.frames is not None else None,
+        "runs": repeat,
+        "seconds": stats,
+        "rtf": round(stats["total"] / duration, 4),
+        "whisper_rtf": round(stats.get("whisper", 0.0) / duration, 4),
+        "words": len(result.get("text", "").split()),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_concurrency(transcribe, upload, level, requests):
+    """Throughput and latency with `level` transcriptions in flight at once"""
+    duration = audio_seconds(upload)
+    latencies = []
+    lock = threading.Lock()
+
+    def one(_):
+        start = time.perf_counter()
+        transcribe(upload, {})
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with quiet(), ThreadPoolExecutor(max_workers=level) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": level,
+        "requests": requests,
+        "clip_duration": round(duration, 3),
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(requests / elapsed, 3),
+        "audio_seconds_per_s": round(requests * duration / elapsed, 3),
+        "p50": round(percentile(latencies, 50), 4),
+        "p95": round(percentile(latencies, 95), 4),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(results, baseline):
+    """Lines describing the change of each clip's total time and each level's throughput"""
+    lines = []
+    before = {clip["clip"]: clip for clip in baseline.get("clips", [])}
+    for clip in results["clips"]:
+        old = before.get(clip["clip"])
+        if old and old["seconds"]["total"]:
+            change = (clip["seconds"]["total"] - old["seconds"]["total"]) / old["seconds"]["total"] * 100
+            lines.append(f"{clip['clip']:>24}: {old['seconds']['total']:.3f}s -> "
+                         f"{clip['seconds']['total']:.3f}s ({change:+.1f}%)")
+    levels = {level["concurrency"]: level for level in baseline.get("concurrency", [])}
+    for level in results["concurrency"]:
+        old = levels.get(level["concurrency"])
+        if old and old["audio_seconds_per_s"]:
+            change = (level["audio_seconds_per_s"] - old["audio_seconds_per_s"]) / old["audio_seconds_per_s"] * 100
+            lines.append(f"{'concurrency ' + str(level['concurrency']):>24}: {old['audio_seconds_per_s']} -> "
+                         f"{level['audio_seconds_per_s']} audio s/s ({change:+.1f}%)")
+    return lines
+
+
+def load_transcriber(model_name=None):
+    """(transcribe_audio_file, metadata), importing the server (which loads its Whisper model)"""
+    start = time.perf_counter()
+    import whisper_server
+    logging.getLogger().setLevel(logging.WARNING)
+    if model_name:
+        import whisper
+        whisper_server.model = whisper.load_model(model_name)
+    meta = {"model": model_name or "server default", "load_seconds": round(time.perf_counter() - start, 2),
+            "device": str(next(whisper_server.model.parameters()).device)}
+    try:
+        import torch
+        meta["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return whisper_server.transcribe_audio_file, meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decode, resample and Whisper on a clip matrix")
+    parser.add_argument("--durations", type=float, nargs="+", default=[1, 5, 15, 30, 60])
+    parser.add_argument("--rates", type=int, nargs="+", default=[8000, 16000, 44100, 48000])
+    parser.add_argument("--channels", type=int, nargs="+", choices=[1, 2], default=[1, 2])
+    parser.add_argument("--clips", nargs="*", default=[], help="Audio files or directories to add to the matrix")
+    parser.add_argument("--no-generated", action="store_true", help="Only benchmark the --clips files")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per clip (the median is reported)")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 2, 4],
+                        help="Concurrency levels for the throughput test (none to skip it)")
+    parser.add_argument("--concurrency-clip", type=float, default=10,
+                        help="Length in seconds of the 16 kHz mono clip used for the throughput test")
+    parser.add_argument("--requests", type=int, default=8, help="Transcriptions per concurrency level")
+    parser.add_argument("--model", help="Whisper model to load instead of the server's (e.g. tiny, small)")
+    parser.add_argument("-o", "--output", help="Write the results as JSON")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    transcribe, meta = load_transcriber(args.model)
+    meta.update({"python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")})
+    print(f"Model {meta['model']} on {meta['device']}, loaded in {meta['load_seconds']}s")
+
+    # The first transcription pays for lazy initialisation; keep it out of the numbers
+    warmup = read_audio_file(io.BytesIO(synth_speech(1, 16000)), MAX_BYTES, MAX_SECONDS)
+    with quiet():
+        transcribe(warmup, {})
+
+    clips = [] if args.no_generated else list(generated_clips(args.durations, args.rates, args.channels))
+    clips += list(file_clips(args.clips))
+
+    results = {"meta": meta, "clips": [], "concurrency": []}
+    print(f"{'clip':>24} {'audio':>7} {'decode':>8} {'resample':>9} {'whisper':>8} {'total':>8} {'RTF':>6} {'RSS MB':>7}")
+    for name, upload in clips:
+        row = bench_clip(transcribe, name, upload, args.repeat)
+        results["clips"].append(row)
+        seconds = row["seconds"]
+        decode = seconds.get("decode", 0.0) + seconds.get("decode_ffmpeg", 0.0)
+        print(f"{name:>24} {row['duration']:>6.1f}s {decode:>7.3f}s {seconds.get('resample', 0.0):>8.3f}s "
+              f"{seconds.get('whisper', 0.0):>7.3f}s {seconds['total']:>7.3f}s {row['rtf']:>6.3f} {row['peak_rss_mb']:>7}")
+
+    if args.concurrency:
+        upload = read_audio_file(io.BytesIO(synth_speech(args.concurrency_clip, 16000)), MAX_BYTES, MAX_SECONDS)
+        for level in args.concurrency:
+            row = bench_concurrency(transcribe, upload, level, max(args.requests, level))
+            results["concurrency"].append(row)
+            print(f"concurrency {level}: {row['requests_per_s']} req/s, {row['audio_seconds_per_s']} audio s/s, "
+                  f"p50 {row['p50']}s, p95 {row['p95']}s, peak RSS {row['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} ({baseline.get('meta', {}).get('model')}):")
+        print("\n".join(compare(results, baseline)) or "No matching clips")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# Agent modules import each other by bare name, as agent/chatbot.py does
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agent"))
+
+
+@pytest.fixture(autouse=True)
+def isolated_analysis_cache(tmp_path, monkeypatch):
+    """Give every test its own analysis cache so cached results never leak between tests"""
+    monkeypatch.setenv("ANALYSIS_CACHE_DIR", str(tmp_path / "analysis_cache"))
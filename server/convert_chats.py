@@ -1,27 +1,263 @@
+"""
+Chat transcript conversion.
+
+Chats are a flat list of messages where even indexes (0, 2, 4...) are user
+messages and odd indexes (1, 3, 5...) are system messages. They are grouped into
+{"user", "system"} pairs; a trailing user message gets an empty system message
+(pass drop_incomplete=True to drop it instead).
+
+Large exports are converted as a stream: messages are read one at a time from
+text lines, a JSON array (parsed incrementally) or JSONL, and pairs are written
+as JSONL in a single pass, so memory stays constant whatever the input size.
+
+    python convert_chats.py export.json chats.jsonl
+"""
+
+import argparse
 import json
+import os
+import re
+import sys
+
+CHUNK_SIZE = 1 << 16
+_WHITESPACE = re.compile(r"\s*")
+# "[" opening a JSON array, as opposed to a text line like "[laughs] hey"
+_JSON_ARRAY_START = re.compile(r'\[\s*($|["{\[\]\d-]|true\b|false\b|null\b)')
+# Non-blank lines looked at when telling JSONL from plain text
+SNIFF_LINES = 5
+
+FORMATS_BY_EXTENSION = {".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl", ".txt": "text"}
+
+
+def iter_pairs(messages, drop_incomplete=False):
+    """Group an iterable of messages into {"user", "system"} pairs, lazily"""
+    user_msg = None
+    for message in messages:
+        if user_msg is None:
+            user_msg = message
+        else:
+            yield {"user": user_msg, "system": message}
+            user_msg = None
+    if user_msg is not None and not drop_incomplete:
+        yield {"user": user_msg, "system": ""}
+
+
+def chats_to_pairs(chats, drop_incomplete=False):
+    """
+    Group a list of chats into {"user", "system"} pairs, in memory
+    (see iter_pairs for the pairing rules)
+    """
+    return list(iter_pairs(chats, drop_incomplete))
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """
+    Yield the items of a top-level JSON array from a text file, reading it in
+    chunks so only about one item is held in memory at a time
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        need_more = pos == len(buffer)
+
+        if not need_more:
+            char = buffer[pos]
+            if not started:
+                if char != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+            elif char == "]":
+                return
+            elif char == ",":
+                pos += 1
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    end = None
+                # The item may be cut off (or, for a number, continue) past the buffer
+                need_more = end is None or (end == len(buffer) and not eof)
+                if not need_more:
+                    pos = end
+                    yield item
+
+        if need_more:
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            # Drop what has been consumed and read the next chunk
+            chunk = f.read(chunk_size)
+            buffer, pos = buffer[pos:] + chunk, 0
+            eof = not chunk
+
+
+def format_from_path(path):
+    """Chat format implied by a file's extension, or None (no extension, unknown, or "-")"""
+    return FORMATS_BY_EXTENSION.get(os.path.splitext(path)[1].lower())
+
+
+def iter_messages(f, fmt=None):
+    """
+    Yield messages from a text file: a JSON array ("json"), one JSON value per
+    line ("jsonl") or one plain-text message per line ("text"). When not given
+    (pass format_from_path() for files), the format is sniffed from the first
+    lines: "json" if the first one opens a JSON array, "jsonl" if the first few
+    all parse as JSON and at least one is an object or array, else "text".
+    """
+    if fmt is None:
+        head = []
+        for line in f:
+            head.append(line)
+            if sum(1 for h in head if h.strip()) >= SNIFF_LINES:
+                break
+        lines = [h.strip() for h in head if h.strip()]
+        if lines and _JSON_ARRAY_START.match(lines[0]):
+            fmt = "json"
+        else:
+            fmt = "jsonl" if lines and _looks_like_jsonl(lines) else "text"
+        # Put the consumed lines back in front of the rest of the file
+        f = _Prepended("".join(head), f)
+
+    if fmt == "json":
+        yield from iter_json_array(f)
+    elif fmt == "jsonl":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == "text":
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+    else:
+        raise ValueError(f"Unknown chat format: {fmt}")
+
+
+def _looks_like_jsonl(lines):
+    """Every line is JSON, and not just text that happens to parse as a scalar ("quoted opener")"""
+    try:
+        values = [json.loads(line) for line in lines]
+    except ValueError:
+        return False
+    return any(isinstance(value, (dict, list)) for value in values)
+
+
+class _Prepended:
+    """File-like reader that returns `head` before the rest of `f`"""
+
+    def __init__(self, head, f):
+        self.head = head
+        self.f = f
+
+    def read(self, size=-1):
+        if self.head:
+            data, self.head = self.head, ""
+            return data
+        return self.f.read(size)
+
+    def __iter__(self):
+        if self.head:
+            head, self.head = self.head, ""
+            yield from head.splitlines(keepends=True)
+        yield from self.f
+
+
+def convert_stream(src, dst, fmt=None, drop_incomplete=False):
+    """
+    Convert messages read from `src` into JSONL pairs written to `dst`, in one pass
+
+    Returns:
+        Number of pairs written
+    """
+    count = 0
+    for pair in iter_pairs(iter_messages(src, fmt), drop_incomplete):
+        dst.write(json.dumps(pair, ensure_ascii=False))
+        dst.write("\n")
+        count += 1
+    return count
+
+
+def convert_file(input_path, output_path, fmt=None, drop_incomplete=False):
+    """Stream-convert a chat export file into a JSONL file of pairs ("-" for stdin/stdout)"""
+    fmt = fmt or (None if input_path == "-" else format_from_path(input_path))
+    src = sys.stdin if input_path == "-" else open(input_path, "r", encoding="utf-8")
+    dst = sys.stdout if output_path == "-" else open(output_path, "w", encoding="utf-8")
+    try:
+        return convert_stream(src, dst, fmt, drop_incomplete)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+
+def message_text(message):
+    """Text of a chat message, which may be a plain string or a {"role", "content"} dict"""
+    if isinstance(message, dict):
+        message = message.get("content", "")
+    return " ".join(str(message).split())
+
+
+def message_role(message, index):
+    """
+    "user" or "system" for a chat message: from its role if it is a {"role", "content"}
+    dict, else by position (even indexes are the user's)
+    """
+    if isinstance(message, dict) and "role" in message:
+        return "user" if message["role"] == "user" else "system"
+    return "user" if index % 2 == 0 else "system"
+
+
+def format_transcript(chats, user_label="User", system_label="Friend"):
+    """
+    Compact, prompt-friendly transcript: one numbered line per message, e.g.
+
+        1 User: Hey, how are you?
+        1 Friend: I've been okay.
+
+    Much smaller than indented JSON, and nothing is written to disk.
+    """
+    return "\n".join(f"{turn} {user_label if role == 'user' else system_label}: {text}"
+                     for turn, role, text in iter_turns(chats))
+
+
+def iter_turns(chats):
+    """
+    Yield (turn number, role, text) for each non-empty message, numbered as in
+    format_transcript (from 1)
+    """
+    turn = 0
+    previous = None
+    for index, message in enumerate(chats):
+        role = message_role(message, index)
+        text = message_text(message)
+        if not text:
+            continue
+        # A turn starts with the user's message (or with whatever opens a trimmed history)
+        if turn == 0 or (role == "user" and previous != "user"):
+            turn += 1
+        yield turn, role, text
+        previous = role
+
 
 def convert_chats_to_json(chats, output_filename="chats.json"):
     """
-    Convert a list of chats to JSON format where:
-    - Even indexes (0, 2, 4...) are user messages  
-    - Odd indexes (1, 3, 5...) are system messages
+    Export a list of chats to a JSON file of {"user", "system"} pairs
+    (see chats_to_pairs for the pairing rules)
     
     Args:
         chats: List of chat messages
         output_filename: Name of output JSON file
     """
     
-    result = []
-    
-    # Process messages in pairs
-    for i in range(0, len(chats), 2):
-        user_msg = chats[i] if i < len(chats) else ""
-        system_msg = chats[i + 1] if i + 1 < len(chats) else ""
-        
-        result.append({
-            "user": user_msg,
-            "system": system_msg
-        })
+    result = chats_to_pairs(chats)
     
     # Save to JSON
     with open(output_filename, 'w', encoding='utf-8') as f:
@@ -30,24 +266,19 @@ def convert_chats_to_json(chats, output_filename="chats.json"):
     print(f"✅ Converted {len(result)} chat pairs to {output_filename}")
     return result
 
-# Example usage - replace this with your actual chat data
+def main():
+    parser = argparse.ArgumentParser(description="Convert a chat export into JSONL {user, system} pairs")
+    parser.add_argument("input", help="Chat export: text lines, JSON array or JSONL (- for stdin)")
+    parser.add_argument("output", help="JSONL output file (- for stdout)")
+    parser.add_argument("--format", choices=["text", "json", "jsonl"], help="Input format (from the file extension, else detected, if omitted)")
+    parser.add_argument("--drop-incomplete", action="store_true",
+                        help="Drop a trailing user message that has no reply")
+
+    args = parser.parse_args()
+    count = convert_file(args.input, args.output, args.format, args.drop_incomplete)
+    if args.output != "-":
+        print(f"✅ Converted {count} chat pairs to {args.output}")
+
+
 if __name__ == "__main__":
-    # Your chats list goes here
-    my_chats = [
-        "Hello there!",                    # User (index 0)
-        "Hi! How can I help you?",         # System (index 1)  
-        "What's the weather like?",        # User (index 2)
-        "It's sunny and 75°F today.",      # System (index 3)
-        "Thanks!"                          # User (index 4)
-        # System message missing for last user message (will be empty)
-    ]
-    
-    # Convert to JSON
-    converted = convert_chats_to_json(my_chats, "my_chats.json")
-    
-    # Print result
-    print("\n📋 Converted chats:")
-    for i, chat in enumerate(converted):
-        print(f"{i+1}. User: '{chat['user']}'")
-        print(f"   System: '{chat['system']}'")
-        print()
\ No newline at end of file
+    main()
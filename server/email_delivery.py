@@ -0,0 +1,142 @@
+"""
+Outbound email delivery through the Resend API.
+
+Uses one shared keep-alive `requests.Session` (connection pooling), explicit
+connect/read timeouts, and retries on 429/5xx and connection errors that honour
+the provider's Retry-After header. Several messages can be sent in one call
+through the batch endpoint.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.resend.com"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Resend accepts at most 100 emails per batch request
+MAX_BATCH_SIZE = 100
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class EmailDeliveryClient:
+    """Pooled, retrying Resend client"""
+
+    def __init__(self, api_key=None, base_url=None, connect_timeout=5.0, read_timeout=30.0,
+                 max_retries=3, backoff=0.5, max_retry_delay=30.0, pool_size=10):
+        """
+        Args:
+            api_key: Resend API key; read from RESEND_API_KEY on each request if not given
+            base_url: API root, defaults to RESEND_API_URL or the public Resend API
+            connect_timeout / read_timeout: per-request timeouts in seconds
+            max_retries: retries after the first attempt for 429/5xx and connection errors
+            backoff: first retry delay when the server sends no Retry-After, doubled each retry
+            max_retry_delay: cap on any single retry delay, including Retry-After
+            pool_size: keep-alive connections kept per host
+        """
+        self.api_key = api_key
+        self.base_url = (base_url or os.getenv("RESEND_API_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_delay = max_retry_delay
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _headers(self, idempotency_key):
+        return {
+            "Authorization": f"Bearer {self.api_key or os.getenv('RESEND_API_KEY')}",
+            "Content-Type": "application/json",
+            # Makes retried POSTs safe: the provider delivers each key only once
+            "Idempotency-Key": idempotency_key,
+        }
+
+    def _post(self, path, payload):
+        """POST with retries; returns the final response or raises the last connection error"""
+        url = f"{self.base_url}{path}"
+        headers = self._headers(uuid.uuid4().hex)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"Email delivery error ({e}), retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                delay = retry_after if retry_after is not None else self.backoff * 2 ** attempt
+                logger.warning(f"Email provider returned {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(min(delay, self.max_retry_delay))
+
+    def send(self, message):
+        """Send one email; returns (ok, response)"""
+        response = self._post("/emails", message)
+        return response.status_code == 200, response
+
+    def send_batch(self, messages):
+        """
+        Send several emails through the batch endpoint.
+
+        Returns a list of booleans, one per message, in order.
+        """
+        results = []
+        for start in range(0, len(messages), MAX_BATCH_SIZE):
+            chunk = messages[start:start + MAX_BATCH_SIZE]
+            if len(chunk) == 1:
+                ok, _ = self.send(chunk[0])
+                results.append(ok)
+                continue
+            response = self._post("/emails/batch", chunk)
+            ok = response.status_code == 200
+            if not ok:
+                logger.error(f"Batch email send failed: {response.text}")
+            results.extend([ok] * len(chunk))
+        return results
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_delivery_client():
+    """Shared delivery client, so every send reuses the same connection pool"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = EmailDeliveryClient(
+                    connect_timeout=float(os.getenv("EMAIL_CONNECT_TIMEOUT", "5")),
+                    read_timeout=float(os.getenv("EMAIL_READ_TIMEOUT", "30")),
+                    max_retries=int(os.getenv("EMAIL_MAX_RETRIES", "3")),
+                )
+    return _client
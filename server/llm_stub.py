@@ -0,0 +1,196 @@
+"""
+Local stand-in for the Gemini REST API and the Resend email API, so capacity
+tests run offline without keys or quota.
+
+    python llm_stub.py --port 8089 --latency 0.8 --error-rate 0.02
+
+Point a server at it:
+
+    GEMINI_API_ENDPOINT=http://localhost:8089 GEMINI_API_KEY=stub \\
+    RESEND_API_URL=http://localhost:8089 RESEND_API_KEY=stub python whisper_server.py
+
+Mood prompts are answered with a canned mood/reply JSON object and other
+prompts (the analysis report) with canned markdown. Replies are delayed by
+`latency` (+/- `jitter`) seconds before the first byte, and streamed replies
+are split into `stream_chunks` chunks `chunk_delay` seconds apart. A fraction
+`error_rate` of model calls fails with `error_status`. The settings can be
+changed while it runs with POST /_stub/config, and GET /_stub/stats returns
+request counts.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+DEFAULT_CONFIG = {
+    "latency": 0.5,
+    "jitter": 0.1,
+    "stream_chunks": 6,
+    "chunk_delay": 0.05,
+    "error_rate": 0.0,
+    # 500 fails the call at once; the SDK retries 503s with backoff for up to 10 minutes
+    "error_status": 500,
+    "email_latency": 0.1,
+    "email_error_rate": 0.0,
+}
+
+MOOD_REPLIES = [
+    {"mood": "sad", "intensity": 60, "stage": 1, "conversation_over": False,
+     "response": "Ugh, that sounds rough. What's been going on?"},
+    {"mood": "anxious", "intensity": 70, "stage": 2, "conversation_over": False,
+     "response": "Yeah, exams have me stressed too honestly. Have you talked to anyone about it?"},
+    {"mood": "neutral", "intensity": 40, "stage": 2, "conversation_over": False,
+     "response": "Thanks for listening, it helps to say it out loud."},
+]
+
+ANALYSIS_REPLY = """## Peer Support Analysis
+
+**Empathy:** ★★★☆☆ (3.0/5)
+**Supportive statements:** ★★★☆☆ (3.0/5)
+**Avoiding harmful language:** ★★★★☆ (4.0/5)
+
+The supporter listened and reflected the friend's feelings, and could have
+asked more open questions before offering advice.
+"""
+
+_STATUS_NAMES = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE", 504: "DEADLINE_EXCEEDED"}
+
+
+def _prompt_text(body):
+    return "\n".join(part.get("text", "") for content in body.get("contents", [])
+                     for part in content.get("parts", []))
+
+
+def canned_reply(prompt):
+    """Canned model output for a prompt: mood JSON for chat turns, markdown otherwise"""
+    if '"mood"' in prompt:
+        # Stable per prompt, so repeated runs see the same replies
+        return json.dumps(MOOD_REPLIES[sum(prompt.encode()) % len(MOOD_REPLIES)])
+    return ANALYSIS_REPLY
+
+
+def _candidate(text, prompt, finished=True):
+    chunk = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+    if finished:
+        chunk["candidates"][0]["finishReason"] = "STOP"
+        prompt_tokens = len(prompt.split())
+        reply_tokens = len(text.split())
+        chunk["usageMetadata"] = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": reply_tokens,
+                                  "totalTokenCount": prompt_tokens + reply_tokens}
+    return chunk
+
+
+def _split(text, parts):
+    size = max(1, -(-len(text) // max(1, parts)))
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def create_app(config=None, seed=None):
+    """Stub Flask app; `config` overrides DEFAULT_CONFIG"""
+    app = Flask(__name__)
+    settings = dict(DEFAULT_CONFIG, **(config or {}))
+    stats = {"generate": 0, "stream": 0, "email": 0, "errors": 0}
+    lock = threading.Lock()
+    rng = random.Random(seed)
+
+    def count(kind):
+        with lock:
+            stats[kind] += 1
+
+    def delay(base):
+        time.sleep(max(0.0, base + rng.uniform(-settings["jitter"], settings["jitter"])))
+
+    def injected_error(rate, status):
+        if rng.random() >= rate:
+            return None
+        count("errors")
+        return jsonify({"error": {"code": status, "message": "Injected error",
+                                  "status": _STATUS_NAMES.get(status, "UNKNOWN")}}), status
+
+    @app.route("/v1beta/models/<path:model_action>", methods=["POST"])
+    def generate(model_action):
+        """generateContent and streamGenerateContent for any model name"""
+        _, _, action = model_action.partition(":")
+        body = request.get_json(silent=True) or {}
+        prompt = _prompt_text(body)
+        error = injected_error(settings["error_rate"], settings["error_status"])
+        if error:
+            delay(settings["latency"])
+            return error
+        text = canned_reply(prompt)
+
+        if action == "generateContent":
+            count("generate")
+            delay(settings["latency"])
+            return jsonify(_candidate(text, prompt))
+        if action != "streamGenerateContent":
+            return jsonify({"error": {"code": 404, "message": f"Unknown method {action}"}}), 404
+
+        count("stream")
+        chunks = _split(text, settings["stream_chunks"])
+
+        def stream():
+            # The REST transport reads a streamed JSON array of responses
+            delay(settings["latency"])
+            for i, chunk in enumerate(chunks):
+                if i:
+                    time.sleep(settings["chunk_delay"])
+                last = i == len(chunks) - 1
+                yield ("[" if i == 0 else ",\r\n") + json.dumps(_candidate(chunk, prompt, last)) + ("]" if last else "")
+
+        return Response(stream(), content_type="application/json")
+
+    @app.route("/emails", methods=["POST"])
+    def send_email():
+        count("email")
+        delay(settings["email_latency"])
+        return injected_error(settings["email_error_rate"], 503) or jsonify({"id": uuid.uuid4().hex})
+
+    @app.route("/emails/batch", methods=["POST"])
+    def send_batch():
+        count("email")
+        delay(settings["email_latency"])
+        messages = request.get_json(silent=True) or []
+        return (injected_error(settings["email_error_rate"], 503)
+                or jsonify({"data": [{"id": uuid.uuid4().hex} for _ in messages]}))
+
+    @app.route("/_stub/config", methods=["GET", "POST"])
+    def stub_config():
+        """Current settings; POST a JSON object to change some of them"""
+        if request.method == "POST":
+            changes = request.get_json(silent=True) or {}
+            unknown = set(changes) - set(DEFAULT_CONFIG)
+            if unknown:
+                return jsonify({"error": f"Unknown settings: {', '.join(sorted(unknown))}"}), 400
+            settings.update(changes)
+        return jsonify(settings)
+
+    @app.route("/_stub/stats", methods=["GET"])
+    def stub_stats():
+        with lock:
+            return jsonify(dict(stats))
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Gemini and Resend stand-in for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    for name, default in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    parser.add_argument("--seed", type=int, help="Seed for jitter and error injection")
+    args = parser.parse_args()
+
+    config = {name: getattr(args, name) for name in DEFAULT_CONFIG}
+    print(f"Stub listening on http://{args.host}:{args.port} with {config}")
+    create_app(config, args.seed).run(host=args.host, port=args.port, threaded=True, use_reloader=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Concurrent end-to-end load generator for /voice-chat and /voice-chat-stream.
+
+Runs --sessions simulated users at once against a running server, each sending
+--turns audio turns with a think time in between, and reports per endpoint:
+outcome counts (ok, shed with 503, rejected with another 4xx, errors), turn
+throughput, and p50/p90/p99 of
+
+    ttfe    time to first event: the transcript event of a stream, or the whole
+            JSON response of /voice-chat
+    reply   time until the reply text arrives
+    full    time until the turn is complete
+
+To run it offline, start the LLM stand-in and point the server at it:
+
+    python llm_stub.py --latency 0.8 &
+    GEMINI_API_ENDPOINT=http://localhost:8089 GEMINI_API_KEY=stub python whisper_server.py &
+    python load_test.py --sessions 20 --turns 5 --audio hello.wav --stub-url http://localhost:8089
+
+Whisper still runs for real. Use a recording of speech for --audio: the
+generated default clip is often transcribed as silence, and those turns are
+counted as rejected (400). The servers keep one shared conversation, so
+sessions load the pipeline but don't have separate histories.
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import requests
+
+from batch_evaluate import percentile
+
+ENDPOINTS = ("voice-chat", "voice-chat-stream")
+
+
+def run_turn(session, base_url, endpoint, audio, timeout):
+    """Send one audio turn; returns a record with the outcome and timings in seconds"""
+    record = {"endpoint": endpoint, "status": None, "outcome": "error", "ttfe": None, "reply": None,
+              "full": None, "trace_id": None}
+    start = time.perf_counter()
+    try:
+        response = session.post(f"{base_url}/{endpoint}", files={"file": ("turn.wav", audio, "audio/wav")},
+                                stream=True, timeout=timeout)
+        record["status"] = response.status_code
+        record["trace_id"] = response.headers.get("X-Trace-Id")
+        with response:
+            if response.status_code != 200:
+                record["outcome"] = "shed" if response.status_code == 503 else (
+                    "rejected" if response.status_code < 500 else "error")
+            elif endpoint == "voice-chat-stream":
+                record["outcome"] = _read_stream(response, start, record)
+            else:
+                response.json()
+                record["ttfe"] = record["reply"] = time.perf_counter() - start
+                record["outcome"] = "ok"
+    except (requests.RequestException, ValueError) as e:
+        record["error"] = str(e)
+    record["full"] = time.perf_counter() - start
+    return record
+
+
+def _read_stream(response, start, record):
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        event = json.loads(line[5:])
+        elapsed = time.perf_counter() - start
+        if record["ttfe"] is None:
+            record["ttfe"] = elapsed
+        if event.get("type") == "text":
+            record["reply"] = elapsed
+        elif event.get("type") == "error":
+            record["error"] = event.get("content")
+            return "error"
+        elif event.get("type") == "complete":
+            return "ok"
+    record["error"] = "Stream ended before the complete event"
+    return "error"
+
+
+def run_session(index, args, audio, records, lock, start_at):
+    """One simulated user: --turns turns, cycling through the endpoints"""
+    time.sleep(max(0.0, start_at - time.time()))
+    with requests.Session() as session:
+        for turn in range(args.turns):
+            endpoint = args.endpoints[(index + turn) % len(args.endpoints)]
+            record = run_turn(session, args.url.rstrip("/"), endpoint, audio, args.timeout)
+            record.update(session=index, turn=turn)
+            with lock:
+                records.append(record)
+            if turn < args.turns - 1:
+                time.sleep(args.think_time)
+
+
+def summarize(records, elapsed):
+    """Per-endpoint outcome counts, throughput and latency percentiles"""
+    summary = {}
+    for endpoint in sorted({r["endpoint"] for r in records}):
+        rows = [r for r in records if r["endpoint"] == endpoint]
+        ok = [r for r in rows if r["outcome"] == "ok"]
+        summary[endpoint] = {
+            "turns": len(rows),
+            **{outcome: sum(r["outcome"] == outcome for r in rows) for outcome in ("ok", "shed", "rejected", "error")},
+            "ok_turns_per_s": round(len(ok) / elapsed, 3) if elapsed else None,
+        }
+        for metric in ("ttfe", "reply", "full"):
+            values = [r[metric] for r in ok if r[metric] is not None]
+            summary[endpoint][metric] = {f"p{pct}": round(percentile(values, pct), 3) if values else None
+                                         for pct in (50, 90, 99)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent voice chat sessions and report latency percentiles")
+    parser.add_argument("--url", default="http://localhost:5000", help="Server under test")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per session")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS),
+                        help="Endpoints to use; sessions alternate between them")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Seconds between a session's turns")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds over which sessions start")
+    parser.add_argument("--audio", help="WAV (or other audio) file sent as every turn; a generated clip if omitted")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--stub-url", help="LLM stub to report request and error counts from")
+    parser.add_argument("-o", "--output", help="Write the summary and per-turn records as JSON")
+    args = parser.parse_args()
+
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio = f.read()
+    else:
+        from bench_transcribe import synth_speech
+        audio = synth_speech(3, 16000)
+
+    records = []
+    lock = threading.Lock()
+    start_at = time.time() + 0.1
+    threads = [threading.Thread(target=run_session, daemon=True,
+                                args=(i, args, audio, records, lock, start_at + i * args.ramp_up / max(1, args.sessions)))
+               for i in range(args.sessions)]
+    print(f"Running {args.sessions} sessions x {args.turns} turns against {args.url}...")
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(records, elapsed)
+    print(f"\n{len(records)} turns in {elapsed:.1f}s")
+    for endpoint, row in summary.items():
+        print(f"\n{endpoint}: {row['ok']} ok, {row['shed']} shed, {row['rejected']} rejected, "
+              f"{row['error']} errors, {row['ok_turns_per_s']} ok turns/s")
+        for metric in ("ttfe", "reply", "full"):
+            print(f"  {metric:>5}: " + ", ".join(f"{pct} {value}s" for pct, value in row[metric].items()))
+
+    slowest = sorted((r for r in records if r["outcome"] == "ok"), key=lambda r: r["full"], reverse=True)[:5]
+    if slowest:
+        print("\nSlowest turns (trace ids match the server's spans):")
+        for r in slowest:
+            print(f"  {r['full']:.2f}s {r['endpoint']} session {r['session']} turn {r['turn']} trace {r['trace_id']}")
+    errors = [r for r in records if r["outcome"] == "error"][:5]
+    for r in errors:
+        print(f"  error: {r['endpoint']} status {r['status']}: {r.get('error')} (trace {r['trace_id']})")
+
+    stub_stats = None
+    if args.stub_url:
+        try:
+            stub_stats = requests.get(f"{args.stub_url.rstrip('/')}/_stub/stats", timeout=5).json()
+            print(f"\nStub: {stub_stats}")
+        except requests.RequestException as e:
+            print(f"\nCould not read stub stats: {e}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "elapsed": round(elapsed, 3), "summary": summary,
+                       "stub": stub_stats, "turns": records}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+On-demand request profiling.
+
+Profiling is off until an admin arms it, either for the next N requests
+(`Profiler.arm`) or for one request sent with an `X-Profile` header. Each
+profiled request is recorded with cProfile or a statistical stack sampler and
+kept in memory, so slow turns can be diagnosed live without restarting:
+
+    cprofile   deterministic, per-function call counts and times (pstats)
+    sample     wall-clock stack samples every few milliseconds, as collapsed
+               stacks for flamegraph tools; cheap enough for long SSE streams
+
+Profiles are kept per process; with several gunicorn workers each worker holds
+the profiles of the requests it served.
+"""
+
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+MODES = ("cprofile", "sample")
+DEFAULT_INTERVAL = 0.005
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval from a background thread"""
+
+    def __init__(self, thread_id, interval=DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Stacks in the collapsed format ("outer;inner count" per line) used by flamegraph.pl and speedscope"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profile:
+    """One profiled request"""
+
+    def __init__(self, profile_id, mode, name, trace_id=None):
+        self.id = profile_id
+        self.mode = mode
+        self.name = name
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.duration = None
+        self.stats = None
+        self.sampler = None
+
+    def summary(self):
+        info = {"id": self.id, "mode": self.mode, "name": self.name, "trace_id": self.trace_id,
+                "started_at": self.started_at, "duration": self.duration}
+        if self.sampler is not None:
+            info["samples"] = self.sampler.samples
+        return info
+
+    def formats(self):
+        return ("pstats", "text") if self.mode == "cprofile" else ("collapsed",)
+
+    def render(self, fmt=None, limit=50):
+        """
+        (bytes, content type) of the profile: raw pstats data (load with
+        pstats.Stats), a text report sorted by cumulative time, or collapsed stacks
+        """
+        fmt = fmt or self.formats()[0]
+        if fmt not in self.formats():
+            raise ValueError(f"{self.mode} profiles are available as {', '.join(self.formats())}")
+        if fmt == "collapsed":
+            return self.sampler.collapsed().encode(), "text/plain; charset=utf-8"
+        if fmt == "pstats":
+            return marshal.dumps(self.stats.stats), "application/octet-stream"
+        out = io.StringIO()
+        self.stats.stream = out
+        self.stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue().encode(), "text/plain; charset=utf-8"
+
+
+class ActiveProfile:
+    """A profile being recorded; stop() from the thread that started it"""
+
+    def __init__(self, profiler, profile):
+        self._profiler = profiler
+        self.profile = profile
+        self._start = time.perf_counter()
+        self._cprofile = None
+        if profile.mode == "cprofile":
+            self._cprofile = cProfile.Profile()
+            try:
+                self._cprofile.enable()
+            except ValueError:
+                # Python 3.12+ allows one cProfile at a time; sample this request instead
+                self._cprofile = None
+                profile.mode = "sample"
+        if profile.mode == "sample":
+            profile.sampler = StackSampler(threading.get_ident(), profiler.interval).start()
+        self._stopped = False
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self.profile.stats = pstats.Stats(self._cprofile)
+        if self.profile.sampler is not None:
+            self.profile.sampler.stop()
+        self.profile.duration = time.perf_counter() - self._start
+        self._profiler._store(self.profile)
+
+
+class Profiler:
+    """Decides which requests to profile and keeps the most recent profiles"""
+
+    def __init__(self, keep=20, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self._profiles = deque(maxlen=keep)
+        self._remaining = 0
+        self._mode = "sample"
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def arm(self, count, mode="sample"):
+        """Profile the next `count` requests (0 disarms)"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r} (use {' or '.join(MODES)})")
+        with self._lock:
+            self._remaining = max(0, int(count))
+            self._mode = mode
+
+    def status(self):
+        with self._lock:
+            return {"armed": self._remaining, "mode": self._mode, "stored": len(self._profiles)}
+
+    def maybe_start(self, name, requested_mode=None, trace_id=None):
+        """
+        Start profiling a request if it asked for it (`requested_mode`, from an
+        authorized X-Profile header) or profiling is armed; returns an
+        ActiveProfile to stop() when the request is done, or None
+        """
+        with self._lock:
+            if requested_mode:
+                if requested_mode not in MODES:
+                    raise ValueError(f"Unknown profiling mode {requested_mode!r} (use {' or '.join(MODES)})")
+                mode = requested_mode
+            elif self._remaining:
+                self._remaining -= 1
+                mode = self._mode
+            else:
+                return None
+            # Unique across gunicorn workers, for telling their profiles apart
+            profile_id = f"{os.getpid()}-{next(self._ids)}"
+        return ActiveProfile(self, Profile(profile_id, mode, name, trace_id))
+
+    def _store(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self):
+        """Summaries of the stored profiles, newest first"""
+        with self._lock:
+            return [p.summary() for p in reversed(self._profiles)]
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+
+def profiler_from_env():
+    """Profiler keeping PROFILE_KEEP profiles, sampling every PROFILE_SAMPLE_INTERVAL seconds"""
+    return Profiler(keep=int(os.getenv("PROFILE_KEEP", "20")),
+                    interval=float(os.getenv("PROFILE_SAMPLE_INTERVAL", str(DEFAULT_INTERVAL))))
@@ -0,0 +1,223 @@
+"""
+Record and replay voice chat sessions for deterministic, offline timing runs.
+
+With RECORD_DIR set, the server writes a session archive per process:
+
+    <RECORD_DIR>/<YYYYmmdd-HHMMSS>-<pid>/
+        turns.jsonl   one line per /voice-chat(-stream) turn: endpoint, audio file,
+                      transcript, reply, stage timings and trace id
+        llm.jsonl     every Gemini call: model, prompt, response (and streamed
+                      chunks), seconds and trace id
+        audio/        the audio of each turn
+
+With REPLAY_ARCHIVE=<archive dir> set, Gemini is not called: each call is
+answered from llm.jsonl, by its exact prompt or, if the prompt changed, by the
+next unused recorded response of that model (counted as a miss). replay.py
+feeds the recorded turns back through the full pipeline in this mode.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import wave
+from collections import defaultdict, deque
+
+import numpy as np
+
+import tracing
+from llm_clients import set_model_hook
+
+logger = logging.getLogger(__name__)
+
+
+def _prompt_text(prompt):
+    return prompt if isinstance(prompt, str) else json.dumps(prompt, default=str, sort_keys=True)
+
+
+def _prompt_hash(model_name, prompt):
+    return hashlib.sha256(f"{model_name}\0{_prompt_text(prompt)}".encode()).hexdigest()
+
+
+class RecordedText:
+    """Stands in for a Gemini response (or streamed chunk): just its .text"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class RecordingModel:
+    """Wraps a Gemini model and writes every generate_content call to the archive"""
+
+    def __init__(self, archive, model_name, model):
+        self._archive = archive
+        self._model_name = model_name
+        self._model = model
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        start = time.perf_counter()
+        if not stream:
+            response = self._model.generate_content(prompt, **kwargs)
+            self._archive.record_llm(self._model_name, prompt, response.text, time.perf_counter() - start)
+            return response
+        return self._record_stream(prompt, start, self._model.generate_content(prompt, stream=True, **kwargs))
+
+    def _record_stream(self, prompt, start, response):
+        chunks = []
+        for chunk in response:
+            chunks.append(chunk.text)
+            yield chunk
+        self._archive.record_llm(self._model_name, prompt, "".join(chunks), time.perf_counter() - start, chunks)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class ReplayModel:
+    """Answers generate_content from the archive instead of calling Gemini"""
+
+    def __init__(self, archive, model_name, delay=False):
+        self._archive = archive
+        self._model_name = model_name
+        self._delay = delay
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        entry = self._archive.answer(self._model_name, prompt)
+        if self._delay:
+            # Reproduce the recorded model latency
+            time.sleep(entry["seconds"])
+        if not stream:
+            return RecordedText(entry["response"])
+        return iter([RecordedText(chunk) for chunk in entry.get("chunks") or [entry["response"]]])
+
+
+class SessionArchive:
+    """A recorded session on disk, written while recording and read while replaying"""
+
+    def __init__(self, path, recording=False):
+        self.path = path
+        self.recording = recording
+        self._lock = threading.Lock()
+        self._turns = 0
+        self.misses = 0
+        if recording:
+            os.makedirs(os.path.join(path, "audio"), exist_ok=True)
+        else:
+            self.rewind()
+
+    def _append(self, name, record):
+        with open(os.path.join(self.path, name), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def record_llm(self, model_name, prompt, response, seconds, chunks=None):
+        record = {"model": model_name, "prompt_hash": _prompt_hash(model_name, prompt),
+                  "prompt": _prompt_text(prompt), "response": response, "seconds": round(seconds, 4),
+                  "trace_id": tracing.current_trace_id()}
+        if chunks is not None:
+            record["chunks"] = chunks
+        with self._lock:
+            self._append("llm.jsonl", record)
+
+    def record_turn(self, endpoint, upload, transcript, result, timings):
+        """Save one turn's audio and outcome (a no-op unless recording)"""
+        if not self.recording:
+            return
+        with self._lock:
+            self._turns += 1
+            turn = self._turns
+            audio_name = f"audio/{turn:04d}.{'wav' if upload.frames is not None else upload.container}"
+            audio_path = os.path.join(self.path, audio_name)
+            if upload.frames is not None:
+                _write_wav(audio_path, upload.frames, upload.sample_rate)
+            else:
+                with open(audio_path, "wb") as f:
+                    f.write(upload.encoded)
+            self._append("turns.jsonl", {
+                "turn": turn, "endpoint": endpoint, "audio": audio_name, "transcript": transcript,
+                "response": result.get("response"), "mood": result.get("mood"), "stage": result.get("stage"),
+                "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+                "trace_id": tracing.current_trace_id(), "recorded_at": time.time(),
+            })
+
+    # ------------------------------------------------------------------
+    # Replay
+    # ------------------------------------------------------------------
+
+    def turns(self):
+        with open(os.path.join(self.path, "turns.jsonl"), encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def rewind(self):
+        """Make every recorded response available again (e.g. before another replay pass)"""
+        entries = []
+        llm_path = os.path.join(self.path, "llm.jsonl")
+        if os.path.exists(llm_path):
+            with open(llm_path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        with self._lock:
+            self._by_prompt = defaultdict(deque)
+            self._by_model = defaultdict(deque)
+            for index, entry in enumerate(entries):
+                self._by_prompt[entry["prompt_hash"]].append(index)
+                self._by_model[entry["model"]].append(index)
+            self._entries = entries
+            self._used = set()
+            self.misses = 0
+
+    def answer(self, model_name, prompt):
+        """The recorded response for a prompt; raises LookupError when the recording has none left"""
+        with self._lock:
+            matches = self._by_prompt.get(_prompt_hash(model_name, prompt), deque())
+            while matches and matches[0] in self._used:
+                matches.popleft()
+            if matches:
+                index = matches.popleft()
+            else:
+                # The prompt changed since recording; fall back to the recorded order
+                fallback = self._by_model.get(model_name, deque())
+                while fallback and fallback[0] in self._used:
+                    fallback.popleft()
+                if not fallback:
+                    raise LookupError(f"No recorded {model_name} response left to replay")
+                index = fallback.popleft()
+                self.misses += 1
+            self._used.add(index)
+            return self._entries[index]
+
+
+def _write_wav(path, frames, sample_rate):
+    """PCM16 WAV of (frames, channels) float samples"""
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(frames.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((np.clip(frames, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+def from_env():
+    """
+    Archive for RECORD_DIR (recording) or REPLAY_ARCHIVE (replay), with the Gemini
+    model hook installed; None when neither is set
+    """
+    replay_path = os.getenv("REPLAY_ARCHIVE")
+    if replay_path:
+        archive = SessionArchive(replay_path)
+        delay = os.getenv("REPLAY_LLM_DELAY") == "1"
+        set_model_hook(lambda model_name, create: ReplayModel(archive, model_name, delay))
+        logger.info(f"Replaying Gemini responses from {replay_path}")
+        return archive
+
+    record_dir = os.getenv("RECORD_DIR")
+    if record_dir:
+        archive = SessionArchive(
+            os.path.join(record_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"), recording=True)
+        set_model_hook(lambda model_name, create: RecordingModel(archive, model_name, create()))
+        logger.info(f"Recording turns to {archive.path}")
+        return archive
+    return None
@@ -0,0 +1,184 @@
+"""
+Replay a recorded session archive through the full pipeline for timing runs.
+
+Record a session by running a server with RECORD_DIR set (see recorder.py),
+then replay it offline, with the same audio and Gemini answered from the
+recording:
+
+    RECORD_DIR=recordings python whisper_server.py
+    python replay.py recordings/20261019-101500-4242 --repeat 3 -o run.json
+    python replay.py recordings/20261019-101500-4242 --compare run.json
+
+Every turn is posted to its recorded endpoint through the Flask test client,
+so upload parsing, decode, resample, Whisper, prompt assembly and parsing all
+run; only the model call is replaced. Reports per-turn wall time, time to the
+first streamed event, per-stage seconds, and whether the transcript and reply
+match the recording. --llm-delay sleeps for the recorded model latency to
+approximate a live run.
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+from serve import APPS, load_server
+
+STAGES = ("upload", "decode", "resample", "decode_ffmpeg", "whisper", "prompt", "llm", "parse")
+
+
+def _events(body):
+    """SSE events of a /voice-chat-stream body"""
+    events = []
+    for line in body.decode("utf-8").splitlines():
+        if line.startswith("data:"):
+            events.append(json.loads(line[5:]))
+    return events
+
+
+def replay_turn(server, archive, turn):
+    """Post one recorded turn and time it; returns a result dict"""
+    with open(os.path.join(archive.path, turn["audio"]), "rb") as f:
+        audio = f.read()
+    before = {stage: server.metrics.STAGE_SECONDS.snapshot(stage=stage)["sum"] for stage in STAGES}
+
+    client = server.app.test_client()
+    start = time.perf_counter()
+    response = client.post(f"/{turn['endpoint']}", data={"file": (io.BytesIO(audio), os.path.basename(turn["audio"]))},
+                           content_type="multipart/form-data", buffered=False)
+    ttfe = None
+    chunks = []
+    for chunk in response.response:
+        if ttfe is None:
+            ttfe = time.perf_counter() - start
+        chunks.append(chunk if isinstance(chunk, bytes) else chunk.encode())
+    response.close()
+    elapsed = time.perf_counter() - start
+    body = b"".join(chunks)
+
+    if turn["endpoint"] == "voice-chat-stream" and response.status_code == 200:
+        events = {event["type"]: event.get("content") for event in _events(body)}
+        transcript, reply = events.get("transcript"), events.get("text")
+    else:
+        data = json.loads(body or b"{}")
+        transcript, reply = data.get("transcript"), data.get("ai_response")
+
+    stages = {}
+    for stage in STAGES:
+        spent = server.metrics.STAGE_SECONDS.snapshot(stage=stage)["sum"] - before[stage]
+        if spent:
+            stages[stage] = round(spent, 4)
+    return {
+        "turn": turn["turn"],
+        "endpoint": turn["endpoint"],
+        "status": response.status_code,
+        "seconds": round(elapsed, 4),
+        "ttfe": round(ttfe, 4) if ttfe is not None else None,
+        "stages": stages,
+        "transcript_match": transcript == turn["transcript"],
+        "reply_match": reply == turn["response"],
+    }
+
+
+def replay(server, archive, repeat=1):
+    """Replay every turn `repeat` times from a fresh conversation; returns the per-turn results of each pass"""
+    passes = []
+    for _ in range(repeat):
+        server.app.test_client().delete("/conversation")
+        archive.rewind()
+        passes.append([replay_turn(server, archive, turn) for turn in archive.turns()])
+    return passes
+
+
+def summarize(passes, misses):
+    """Median seconds per turn and stage across passes"""
+    turns = []
+    for results in zip(*passes):
+        first = results[0]
+        turns.append({
+            "turn": first["turn"],
+            "endpoint": first["endpoint"],
+            "seconds": round(statistics.median(r["seconds"] for r in results), 4),
+            "ttfe": round(statistics.median(r["ttfe"] or 0.0 for r in results), 4),
+            "stages": {stage: round(statistics.median(r["stages"].get(stage, 0.0) for r in results), 4)
+                       for stage in STAGES if any(stage in r["stages"] for r in results)},
+            "transcript_match": all(r["transcript_match"] for r in results),
+            "reply_match": all(r["reply_match"] for r in results),
+        })
+    stage_totals = {}
+    for turn in turns:
+        for stage, seconds in turn["stages"].items():
+            stage_totals[stage] = round(stage_totals.get(stage, 0.0) + seconds, 4)
+    return {
+        "turns": turns,
+        "total_seconds": round(sum(turn["seconds"] for turn in turns), 4),
+        "stage_totals": stage_totals,
+        "llm_misses": misses,
+        "mismatched_turns": [t["turn"] for t in turns if not (t["transcript_match"] and t["reply_match"])],
+    }
+
+
+def compare(summary, baseline):
+    """Lines describing the change in total, per-stage and per-turn time against an earlier run"""
+    def change(old, new):
+        return f"{old:.3f}s -> {new:.3f}s ({(new - old) / old * 100:+.1f}%)" if old else f"{old:.3f}s -> {new:.3f}s"
+
+    lines = [f"{'total':>14}: {change(baseline['total_seconds'], summary['total_seconds'])}"]
+    for stage, seconds in summary["stage_totals"].items():
+        if stage in baseline.get("stage_totals", {}):
+            lines.append(f"{stage:>14}: {change(baseline['stage_totals'][stage], seconds)}")
+    old_turns = {turn["turn"]: turn for turn in baseline.get("turns", [])}
+    for turn in summary["turns"]:
+        if turn["turn"] in old_turns:
+            lines.append(f"{'turn ' + str(turn['turn']):>14}: {change(old_turns[turn['turn']]['seconds'], turn['seconds'])}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the voice pipeline")
+    parser.add_argument("archive", help="Session archive directory written with RECORD_DIR")
+    parser.add_argument("--app", choices=sorted(APPS), default="aaron")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay passes (medians are reported)")
+    parser.add_argument("--llm-delay", action="store_true", help="Sleep for the recorded model latency")
+    parser.add_argument("-o", "--output", help="Write the summary as JSON")
+    parser.add_argument("--compare", help="Summary JSON of an earlier replay to compare against")
+    args = parser.parse_args()
+
+    # Must be set before the server is imported; it installs the replay hook at import
+    os.environ["REPLAY_ARCHIVE"] = args.archive
+    os.environ.pop("RECORD_DIR", None)
+    if args.llm_delay:
+        os.environ["REPLAY_LLM_DELAY"] = "1"
+    server = load_server(args.app)
+    archive = server.session_archive
+
+    print(f"Replaying {len(archive.turns())} turns from {args.archive} ({args.repeat} pass(es))...")
+    summary = summarize(replay(server, archive, args.repeat), archive.misses)
+    for turn in summary["turns"]:
+        stages = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in turn["stages"].items())
+        flags = "" if turn["transcript_match"] and turn["reply_match"] else "  (differs from recording)"
+        print(f"turn {turn['turn']:>3} {turn['endpoint']:>17}: {turn['seconds']:.3f}s, "
+              f"first event {turn['ttfe']:.3f}s [{stages}]{flags}")
+    print(f"\nTotal {summary['total_seconds']:.3f}s; " +
+          ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in summary["stage_totals"].items()))
+    if summary["llm_misses"]:
+        print(f"{summary['llm_misses']} model call(s) had prompts that differ from the recording "
+              f"and were answered in recorded order")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare}:")
+        print("\n".join(compare(summary, baseline)))
+    return 0 if not summary["mismatched_turns"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
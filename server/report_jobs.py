@@ -0,0 +1,365 @@
+"""
+Durable background queue for report (analysis + email) jobs.
+
+Jobs are stored in a local SQLite outbox, so queued work survives restarts.
+A small pool of worker threads claims due jobs, runs the handler, and retries
+failures with exponential backoff until `max_attempts` is reached.
+
+In digest mode (digest_window > 0) a new job waits up to `digest_window`
+seconds, and when it becomes due every queued job for the same recipient is
+claimed with it and handed to the digest handler, so they go out as one email.
+
+The trace context of the enqueuing request is stored with each job, so the
+job's "email_job" span joins the request's trace.
+
+A handler that raises `Overloaded` (its admission pool is shedding load) has
+its jobs rescheduled after the suggested delay without using up an attempt.
+Each claimed job records the process running it (host:pid). On start, jobs
+left 'running' by a process on this host that no longer exists are requeued
+at once; jobs whose owner can't be checked (another host, or another platform)
+are requeued once they have been running for `stale_after` seconds, checked
+on start and then every `stale_after / 2` seconds.
+
+Job statuses: queued -> running -> sent | failed
+"""
+
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+import tracing
+from admission import Overloaded
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    to_email TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_error TEXT,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_attempt_at);
+"""
+
+
+def _owner():
+    """The running process, as recorded on the jobs it claims"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner):
+    """Whether the process that claimed a job still exists (None if that can't be told)"""
+    host, _, pid = (owner or "").rpartition(":")
+    if os.name != "posix" or host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+class ReportQueue:
+    """SQLite-backed job queue with a worker thread pool and retry backoff"""
+
+    def __init__(self, db_path, handler, workers=2, max_attempts=5,
+                 base_delay=2.0, max_delay=300.0, poll_interval=1.0, stale_after=900.0,
+                 batch_handler=None, batch_size=10, digest_handler=None, digest_window=0.0,
+                 max_digest_size=50):
+        """
+        Args:
+            db_path: SQLite file used as the outbox
+            handler: callable(to_email, chats, **options) -> truthy on success; falsy or raising
+                means retry. `options` are the extra keyword arguments given to enqueue()
+            batch_handler: optional callable([(to_email, chats, options), ...]) -> [bool, ...]; when
+                several jobs are due at once, a worker claims up to `batch_size` of them
+                and hands them over in one call
+            workers: number of worker threads
+            max_attempts: attempts before a job is marked failed
+            base_delay: first retry delay in seconds, doubled on each attempt
+            max_delay: upper bound on the retry delay
+            poll_interval: how often idle workers check for due retries
+            stale_after: seconds after which a 'running' job whose owner can't be checked
+                is assumed abandoned
+            digest_handler: optional callable(to_email, [(chats, options), ...]) -> truthy on
+                success; used with digest_window > 0 to send a recipient's reports as one email
+            digest_window: seconds a new job waits for more reports to the same recipient
+            max_digest_size: most reports combined into one digest
+        """
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.batch_handler = batch_handler
+        self.batch_size = batch_size if batch_handler else 1
+        self.digest_handler = digest_handler
+        self.digest_window = digest_window if digest_handler else 0.0
+        self.max_digest_size = max_digest_size
+
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._last_recovery = 0.0
+
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+            # Outboxes created before jobs recorded their owner
+            if "owner" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            self._recover_orphaned()
+            self._recover_stale()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"report-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Report queue started with {self.workers} workers ({self.db_path})")
+
+    def stop(self, timeout=5):
+        """Stop the worker threads; unfinished jobs stay in the outbox"""
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def enqueue(self, to_email, chats, **options):
+        """
+        Persist a report job and return its id.
+
+        Extra keyword options (e.g. analysis=already generated text) must be
+        JSON-serializable; they are passed on to the handler.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        payload = {"chats": chats, "options": options, "traceparent": tracing.current_traceparent()}
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, to_email, payload, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, to_email, json.dumps(payload), now + self.digest_window, now, now))
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        """Job status as a dict, or None if unknown"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, status, to_email, attempts, next_attempt_at, created_at, updated_at, last_error "
+                "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _recover_orphaned(self):
+        """Requeue jobs left 'running' by a process on this host that has exited (crashed)"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            running = conn.execute("SELECT id, owner FROM jobs WHERE status = 'running'").fetchall()
+            orphaned = [row["id"] for row in running if _owner_alive(row["owner"]) is False]
+            conn.executemany(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE id = ? AND status = 'running'",
+                [(now, job_id) for job_id in orphaned])
+        if orphaned:
+            logger.warning(f"Requeued {len(orphaned)} report job(s) left running by an exited process")
+
+    def _recover_stale(self):
+        """Requeue jobs left 'running' by a crashed worker or process"""
+        now = time.time()
+        self._last_recovery = now
+        with closing(self._connect()) as conn:
+            recovered = conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ?",
+                (now, now - self.stale_after)).rowcount
+        if recovered:
+            logger.warning(f"Requeued {recovered} stale report job(s)")
+
+    def _claim(self):
+        """
+        Atomically move the oldest due jobs (up to batch_size) to 'running' and return them.
+
+        In digest mode, the oldest due job is claimed together with every other
+        queued job for the same recipient that isn't waiting out a retry backoff.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            limit = 1 if self.digest_window else self.batch_size
+            now = time.time()
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND next_attempt_at <= ? "
+                "ORDER BY created_at LIMIT ?", (now, limit)).fetchall()
+            if self.digest_window and rows:
+                # Jobs still in their digest window come along; ones backing off after a failure don't
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND to_email = ? "
+                    "AND (attempts = 0 OR next_attempt_at <= ?) "
+                    "ORDER BY created_at LIMIT ?", (rows[0]["to_email"], now, self.max_digest_size)).fetchall()
+            now = time.time()
+            owner = _owner()
+            conn.executemany(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?, owner = ? "
+                "WHERE id = ?", [(now, owner, row["id"]) for row in rows])
+            conn.execute("COMMIT")
+            jobs = [dict(row) for row in rows]
+            for job in jobs:
+                job["attempts"] += 1
+            return jobs
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish(self, job, error=None, retry_after=None):
+        """Record a job's outcome; `retry_after` reschedules it without counting the attempt"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            if retry_after is not None:
+                delay = max(self.poll_interval, retry_after) * random.uniform(1.0, 1.5)
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', attempts = attempts - 1, next_attempt_at = ?, "
+                    "updated_at = ?, last_error = ? WHERE id = ?", (now + delay, now, error, job["id"]))
+                logger.info(f"Report job {job['id']} deferred {delay:.1f}s: {error}")
+            elif error is None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'sent', updated_at = ?, last_error = NULL WHERE id = ?",
+                    (now, job["id"]))
+            elif job["attempts"] >= self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', updated_at = ?, last_error = ? WHERE id = ?",
+                    (now, error, job["id"]))
+                logger.error(f"Report job {job['id']} failed after {job['attempts']} attempts: {error}")
+            else:
+                delay = min(self.max_delay, self.base_delay * 2 ** (job["attempts"] - 1))
+                delay *= random.uniform(0.5, 1.0)
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', next_attempt_at = ?, updated_at = ?, last_error = ? "
+                    "WHERE id = ?", (now + delay, now, error, job["id"]))
+                logger.warning(f"Report job {job['id']} attempt {job['attempts']} failed, "
+                               f"retrying in {delay:.1f}s: {error}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if time.time() - self._last_recovery >= self.stale_after / 2:
+                try:
+                    self._recover_stale()
+                except Exception as e:
+                    logger.error(f"Report queue error: {e}")
+            try:
+                jobs = self._claim()
+            except Exception as e:
+                logger.error(f"Report queue error: {e}")
+                jobs = []
+            if not jobs:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            if len(jobs) == 1:
+                self._process(jobs[0])
+            elif self.digest_window:
+                self._process_digest(jobs)
+            else:
+                self._process_batch(jobs)
+
+    @staticmethod
+    def _report(job):
+        payload = json.loads(job["payload"])
+        return job["to_email"], payload["chats"], payload.get("options") or {}
+
+    @staticmethod
+    def _job_span(jobs):
+        """Span for processing `jobs`, a child of the first job's enqueuing request"""
+        try:
+            parent = json.loads(jobs[0]["payload"]).get("traceparent")
+        except ValueError:
+            parent = None
+        return tracing.span("email_job", parent=parent, root=True, job_id=jobs[0]["id"],
+                            jobs=len(jobs), attempt=jobs[0]["attempts"])
+
+    def _process(self, job):
+        retry_after = None
+        with self._job_span([job]) as job_span:
+            try:
+                to_email, chats, options = self._report(job)
+                ok = self.handler(to_email, chats, **options)
+                error = None if ok else "Handler reported failure"
+            except Overloaded as e:
+                error, retry_after = str(e), e.retry_after
+            except Exception as e:
+                error = str(e)
+            job_span.error = error
+        self._finish(job, error, retry_after)
+
+    def _process_batch(self, jobs):
+        retry_after = None
+        with self._job_span(jobs) as job_span:
+            try:
+                reports = [self._report(job) for job in jobs]
+                results = self.batch_handler(reports)
+                errors = [None if ok else "Handler reported failure" for ok in results]
+            except Overloaded as e:
+                errors, retry_after = [str(e)] * len(jobs), e.retry_after
+            except Exception as e:
+                errors = [str(e)] * len(jobs)
+            job_span.error = next((error for error in errors if error), None)
+        for job, error in zip(jobs, errors):
+            self._finish(job, error, retry_after)
+
+    def _process_digest(self, jobs):
+        retry_after = None
+        with self._job_span(jobs) as job_span:
+            try:
+                reports = [self._report(job) for job in jobs]
+                ok = self.digest_handler(reports[0][0], [(chats, options) for _, chats, options in reports])
+                error = None if ok else "Handler reported failure"
+            except Overloaded as e:
+                error, retry_after = str(e), e.retry_after
+            except Exception as e:
+                error = str(e)
+            job_span.error = error
+        for job in jobs:
+            self._finish(job, error, retry_after)
@@ -0,0 +1,147 @@
+"""
+Deterministic, in-process peer-support rubric scorer.
+
+Scores the supporter's (User's) messages on the PeerSupportEvaluator rubric:
+- Empathetic Language (40%)
+- Supportive Phrases (30%)
+- Avoidance of Harm (30%)
+using phrase matchers. Phrase hits for every turn are counted into one
+turns x features matrix and all scores are computed from it with NumPy, so
+the same transcript always gets the same scores, with no LLM call.
+"""
+
+import re
+
+import numpy as np
+
+from convert_chats import message_role, message_text
+
+WEIGHTS = {"empathy": 0.40, "supportive": 0.30, "avoidance": 0.30}
+
+# Feature name -> phrase patterns (matched case-insensitively, on word boundaries)
+PHRASES = {
+    # Reflecting and validating the other person's feelings
+    "reflection": [
+        r"it sounds like", r"that sounds", r"sounds (really |so )?(hard|tough|rough|exhausting|stressful|difficult)",
+        r"i hear you", r"i can (imagine|see|tell)", r"that must (be|feel)", r"must be (hard|tough|rough|exhausting)",
+        r"makes (total |a lot of )?sense", r"i understand", r"i get (it|that)", r"that'?s (really |so )?(hard|tough|rough)",
+        r"i'?m (so |really )?sorry", r"no wonder", r"(you'?ve|you have) been",
+    ],
+    # Gently inviting the other person to share
+    "invitation": [
+        r"how are you (feeling|doing|holding up)", r"how have you been", r"do you want to talk",
+        r"would you like to (talk|share)", r"what'?s (been )?(on your mind|bothering you|going on)",
+        r"tell me (more|about)", r"want to talk about it",
+    ],
+    "feeling_words": [
+        r"feel(ing|s)?", r"overwhelm(ed|ing)", r"stress(ed|ful)?", r"tired", r"exhausted", r"lonely",
+        r"anxious", r"drained", r"stuck", r"frustrat(ed|ing)",
+    ],
+    "supportive": [
+        r"i'?m (always )?here for you", r"here (for you|if you need)", r"you matter", r"i care about you",
+        r"your feelings (are valid|matter)", r"(it'?s|that'?s) (okay|ok|alright) to", r"how can i help",
+        r"what can i do", r"i'?m proud of you", r"proud of you", r"you'?re not alone", r"we can (figure|work)",
+        r"take your time", r"whenever you'?re ready", r"i believe in you", r"you'?ve got this",
+        r"thank you for (telling|sharing|trusting)", r"glad you (told|shared)",
+    ],
+    # Invalidating or dismissive remarks
+    "harm": [
+        r"get over it", r"cheer up", r"calm down", r"(it'?s|that'?s) not (that|a) big deal", r"others have it worse",
+        r"stop (complaining|whining|being)", r"man up", r"you'?re (being )?(lazy|dramatic|overreacting)",
+        r"overreacting", r"just (relax|smile|get over|stop)", r"whatever", r"stupid", r"your (own )?fault",
+        r"(don'?t|do not) be (sad|like that)",
+    ],
+    # Unsolicited advice / directives
+    "advice": [
+        r"you should", r"you need to", r"you have to", r"why don'?t you", r"have you tried", r"just (go|do|try)",
+    ],
+}
+
+FEATURES = list(PHRASES)
+_PATTERNS = [
+    re.compile(r"\b(?:" + "|".join(patterns) + r")\b", re.IGNORECASE)
+    for patterns in PHRASES.values()
+]
+
+# Score per category = clip(base + features @ weights, 1, 5); one column per category
+_CATEGORIES = ("empathy", "supportive", "avoidance")
+_BASE = np.array([1.0, 1.0, 5.0])
+_FEATURE_WEIGHTS = np.array([
+    # empathy, supportive, avoidance
+    [1.5, 0.0, 0.0],   # reflection
+    [1.0, 0.0, 0.0],   # invitation
+    [0.5, 0.0, 0.0],   # feeling_words
+    [0.5, 2.0, 0.0],   # supportive
+    [-1.0, -0.5, -2.0],  # harm
+    [0.0, 0.0, -1.0],  # advice
+])
+# Cap how much repeated use of one feature can count in a single message
+_MAX_HITS = 2
+
+
+def feature_matrix(messages):
+    """turns x features matrix of (capped) phrase-hit counts"""
+    counts = np.array(
+        [[len(pattern.findall(message)) for pattern in _PATTERNS] for message in messages],
+        dtype=float,
+    ).reshape(len(messages), len(_PATTERNS))
+    return np.minimum(counts, _MAX_HITS)
+
+
+def score_messages(messages):
+    """turns x 3 matrix of (empathy, supportive, avoidance) scores in [1, 5]"""
+    return np.clip(_BASE + feature_matrix(messages) @ _FEATURE_WEIGHTS, 1.0, 5.0)
+
+
+def stars(score):
+    """1-5 star string for a score, e.g. 3.6 -> ★★★★☆"""
+    n = int(min(5, max(1, np.floor(score + 0.5))))
+    return "★" * n + "☆" * (5 - n)
+
+
+def _evidence(messages, scores):
+    """Most representative quote per category, picked deterministically"""
+    evidence = {}
+    for c, category in enumerate(_CATEGORIES):
+        # Strongest (or, for avoidance, weakest) message; ties go to the earliest
+        i = int(np.argmin(scores[:, c]) if category == "avoidance" else np.argmax(scores[:, c]))
+        evidence[category] = messages[i]
+    return evidence
+
+
+def score_turn(user_message, previous_reply=""):
+    """Scores for one supporter message, in the same shape as turn_scoring.llm_score_turn"""
+    scores = score_messages([message_text(user_message)])[0]
+    return {
+        **{category: round(float(scores[c]), 2) for c, category in enumerate(_CATEGORIES)},
+        "quote": message_text(user_message)[:200],
+        "note": "",
+    }
+
+
+def user_messages(chats):
+    """The supporter's messages: role "user" for dict messages, else even indexes"""
+    picked = [m for index, m in enumerate(chats) if message_role(m, index) == "user"]
+    return [text for text in map(message_text, picked) if text]
+
+
+def score_transcript(chats):
+    """
+    Score a whole conversation.
+
+    Returns {"empathy", "supportive", "avoidance", "overall"} scores (1-5 floats,
+    averaged over the User's turns), "turns", and one "evidence" quote per category.
+    """
+    messages = user_messages(chats)
+    scores = score_messages(messages)
+    means = scores.mean(axis=0) if messages else _BASE
+    result = {category: round(float(means[c]), 2) for c, category in enumerate(_CATEGORIES)}
+    result["overall"] = weighted_overall(result)
+    result["turns"] = len(messages)
+    result["evidence"] = _evidence(messages, scores) if messages else {}
+    return result
+
+
+def weighted_overall(scores):
+    """overall = Empathy x 0.40 + Supportive x 0.30 + Avoidance x 0.30"""
+    return round(sum(scores[c] * WEIGHTS[c] for c in _CATEGORIES), 2)
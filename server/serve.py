@@ -0,0 +1,102 @@
+"""
+Production entry point for the voice chat servers.
+
+Serves whisper_server (Aaron, port 5000) or whisper_server_maya (Maya, port 5001)
+with gunicorn. The app module, and with it the Whisper model, is imported once in
+the master process before the workers are forked (preload_app), so the model
+weights are shared copy-on-write instead of loaded once per worker.
+
+    python serve.py --app aaron --workers 1 --threads 8
+    python serve.py --app maya --dev          # Flask dev server, no reloader
+
+Conversation history and turn scores live in process memory, so keep one worker
+(and scale with threads) unless the conversation state is moved out of process.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+APPS = {
+    "aaron": ("whisper_server", 5000),
+    "maya": ("whisper_server_maya", 5001),
+}
+
+
+def load_server(name):
+    """Import the server module for an app name ("aaron" or "maya")"""
+    module_name, _ = APPS[name]
+    return importlib.import_module(module_name)
+
+
+def run_dev(server, host, port):
+    """Flask's development server, without the reloader (which would load Whisper twice)"""
+    server.report_queue.start()
+    server.app.run(host=host, port=port, debug=True, use_reloader=False, threaded=True)
+
+
+def run_production(server, host, port, workers, threads, timeout):
+    """gunicorn with the app preloaded before fork"""
+    from gunicorn.app.base import BaseApplication
+
+    def post_fork(_arbiter, _worker):
+        # Threads don't survive fork, so each worker starts its own report queue
+        # workers; jobs are claimed atomically from the shared SQLite outbox
+        server.report_queue.start()
+
+    class StandaloneApplication(BaseApplication):
+        def __init__(self, app, options):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "preload_app": True,
+        # Transcription plus an LLM call can take a while; SSE streams longer still
+        "timeout": timeout,
+        "graceful_timeout": 30,
+        "post_fork": post_fork,
+        "accesslog": "-",
+    }
+    logger.info(f"Serving {server.__name__} on {host}:{port} with {workers} workers x {threads} threads")
+    StandaloneApplication(server.app, options).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a voice chat server")
+    parser.add_argument("--app", choices=sorted(APPS), default=os.getenv("SERVER_APP", "aaron"))
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=None, help="Defaults to 5000 (aaron) or 5001 (maya)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVER_WORKERS", "1")),
+                        help="Worker processes (conversation state is per process)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("SERVER_THREADS", "8")),
+                        help="Request threads per worker")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("SERVER_TIMEOUT", "300")),
+                        help="Seconds before a silent worker is restarted")
+    parser.add_argument("--dev", action="store_true", help="Use the Flask development server")
+
+    args = parser.parse_args()
+    port = args.port or APPS[args.app][1]
+    server = load_server(args.app)
+    if args.dev:
+        run_dev(server, args.host, port)
+    else:
+        run_production(server, args.host, port, args.workers, args.threads, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
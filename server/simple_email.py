@@ -1,29 +1,21 @@
-import requests
 import os
+import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 
-import google.generativeai as genai
 from convert_chats import *
+from email_delivery import get_delivery_client
+from analysis_cache import get_analysis_cache, make_key
+from turn_scoring import aggregate_scores, align_turn_scores
+from rubric_scorer import score_transcript, stars
+from tracing import CLIENT, span
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_clients import get_genai_model
 
-def send_email(to_email, chats):
-    """
-    Send email using Resend API - simplest possible implementation
-    """
-    # Replace with your actual API key from Resend dashboard
-    API_KEY = os.getenv("RESEND_API_KEY")
-
-    url = "https://api.resend.com/emails"
-
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    llm_response = generate_analysis(chats)
 
-    # Add research section at the bottom
-    research_section = """
+# Add research section at the bottom of every report
+RESEARCH_SECTION = """
     
 ---
 
@@ -38,11 +30,19 @@ This analysis is based on the following peer-reviewed research:
    [https://doi.org/10.1111/jcap.12299](https://doi.org/10.1111/jcap.12299)
 """
 
-    message = f"{llm_response}{research_section}"
+
+def build_email(to_email, chats, analysis=None, turn_scores=None):
+    """
+    Build the Resend email payload for a conversation, generating the analysis
+    unless an already generated one is passed in
+    """
+    llm_response = analysis if analysis is not None else generate_analysis(chats, turn_scores=turn_scores)
+
+    message = f"{llm_response}{RESEARCH_SECTION}"
     subject = "Peer Support Analysis Report"
 
     # Email data
-    data = {
+    return {
         # Free sender address (no setup needed)
         "from": "onboarding@resend.dev",
         "to": [to_email],
@@ -50,10 +50,18 @@ This analysis is based on the following peer-reviewed research:
         "html": f"<pre style='white-space: pre-wrap; font-family: Arial, sans-serif;'>{message}</pre>"
     }
 
+
+def send_email(to_email, chats, analysis=None, turn_scores=None):
+    """
+    Send email using Resend API (pooled connection, timeouts and retries)
+    """
+    data = build_email(to_email, chats, analysis, turn_scores)
+
     # Send the email
-    response = requests.post(url, json=data, headers=headers)
+    with span("email_send", kind=CLIENT):
+        ok, response = get_delivery_client().send(data)
 
-    if response.status_code == 200:
+    if ok:
         print(f"✅ Email sent successfully to {to_email}")
         return True
     else:
@@ -61,6 +69,85 @@ This analysis is based on the following peer-reviewed research:
         return False
 
 
+def send_emails(reports):
+    """
+    Send several reports at once through the provider's batch endpoint
+
+    Args:
+        reports: list of (to_email, chats) or (to_email, chats, options) tuples, where
+            options holds build_email keyword arguments (analysis, turn_scores)
+    Returns:
+        List of booleans, one per report, in order
+    """
+    # Analyses are the slow part, so generate them concurrently
+    with ThreadPoolExecutor(max_workers=min(4, len(reports)) or 1) as pool:
+        futures = [pool.submit(build_email, to_email, chats, **(options[0] if options else {}))
+                   for to_email, chats, *options in reports]
+
+    results = [False] * len(reports)
+    messages, indexes = [], []
+    for i, future in enumerate(futures):
+        try:
+            messages.append(future.result())
+            indexes.append(i)
+        except Exception as e:
+            print(f"❌ Failed to build report email: {e}")
+
+    with span("email_send", kind=CLIENT, emails=len(messages)):
+        sent = get_delivery_client().send_batch(messages)
+    for i, ok in zip(indexes, sent):
+        results[i] = ok
+    print(f"✅ Sent {sum(results)}/{len(results)} report emails")
+    return results
+
+
+def build_digest(to_email, reports):
+    """
+    Build one Resend email payload that combines several reports for a recipient
+
+    Args:
+        reports: list of (chats, options) tuples, where options holds build_email
+            keyword arguments (analysis, turn_scores)
+    """
+    def analysis_for(report):
+        chats, options = report
+        if options.get("analysis") is not None:
+            return options["analysis"]
+        return generate_analysis(chats, turn_scores=options.get("turn_scores"))
+
+    # Analyses are the slow part, so generate them concurrently
+    with ThreadPoolExecutor(max_workers=min(4, len(reports)) or 1) as pool:
+        analyses = list(pool.map(analysis_for, reports))
+
+    sections = [f"## Report {i} of {len(analyses)}\n\n{analysis}" for i, analysis in enumerate(analyses, start=1)]
+    message = "\n\n---\n\n".join(sections) + RESEARCH_SECTION
+    subject = f"Peer Support Analysis Reports ({len(analyses)})"
+
+    return {
+        "from": "onboarding@resend.dev",
+        "to": [to_email],
+        "subject": subject,
+        "html": f"<pre style='white-space: pre-wrap; font-family: Arial, sans-serif;'>{message}</pre>"
+    }
+
+
+def send_digest(to_email, reports):
+    """
+    Send several reports for one recipient as a single digest email (one API call)
+    """
+    data = build_digest(to_email, reports)
+
+    with span("email_send", kind=CLIENT, reports=len(reports)):
+        ok, response = get_delivery_client().send(data)
+
+    if ok:
+        print(f"✅ Digest of {len(reports)} reports sent successfully to {to_email}")
+        return True
+    else:
+        print(f"❌ Failed to send digest: {response.text}")
+        return False
+
+
 # Example usage
 if __name__ == "__main__":
     # Send email to yourself with sample chat data
@@ -81,14 +168,74 @@ if __name__ == "__main__":
 # Even indexes are the user's messages and odd indexes are the AI's messages.
 
 
-def generate_analysis(chats):
-    api_key = os.getenv("GOOGLE_API_KEY")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.5-pro")
+# Bump whenever the evaluation prompt changes, so cached analyses aren't reused
+RUBRIC_VERSION = "peer-support-v3"
+ANALYSIS_MODEL = "gemini-2.5-pro"
+
+
+def _cache_key(chats, turn_scores=None):
+    rubric = RUBRIC_VERSION
+    if turn_scores:
+        rubric += ":" + json.dumps(turn_scores, sort_keys=True, ensure_ascii=False)
+    return make_key(chats, rubric, ANALYSIS_MODEL)
+
+
+def generate_analysis(chats, export_path=None, turn_scores=None):
+    """
+    Analysis for a conversation, memoized by transcript hash and rubric version
+    (set ANALYSIS_CACHE=0 to always call the model)
+
+    The transcript is serialized in memory; pass export_path to also write it
+    to disk as JSON pairs. If per-turn scores were collected during the
+    conversation (see turn_scoring), the model only aggregates and comments on them.
+    """
+    if export_path:
+        convert_chats_to_json(chats, export_path)
+
+    if os.getenv("ANALYSIS_CACHE", "1") == "0":
+        return _run_analysis(chats, turn_scores)
 
-    chats_json = convert_chats_to_json(chats, "chats.json")
+    key = _cache_key(chats, turn_scores)
+    return get_analysis_cache().get_or_compute(key, lambda: _run_analysis(chats, turn_scores))
 
-    response = model.generate_content(f"""
+
+def compute_scores(chats, turn_scores=None):
+    """
+    Deterministic rubric scores: aggregated per-turn scores if they were collected
+    during the conversation, otherwise scored from the transcript (rubric_scorer)
+    """
+    if turn_scores:
+        return aggregate_scores(turn_scores)
+    return score_transcript(chats)
+
+
+def format_scores(scores, turn_scores=None):
+    """Prompt section with the precomputed ratings (and per-turn notes, if any)"""
+    lines = [
+        "Ratings (already computed from the transcript; copy these stars exactly):",
+        f"Empathy: {stars(scores['empathy'])} ({scores['empathy']}/5)",
+        f"Supportive Phrases: {stars(scores['supportive'])} ({scores['supportive']}/5)",
+        f"Avoidance of Harm: {stars(scores['avoidance'])} ({scores['avoidance']}/5)",
+        f"Overall: {stars(scores['overall'])} ({scores['overall']}/5)",
+    ]
+    if turn_scores:
+        lines.append("")
+        lines.append("Per-turn scores for the User's messages (empathy / supportive / avoidance):")
+        for t in turn_scores:
+            lines.append(
+                f"- Turn {t['turn'] + 1}: {t['empathy']} / {t['supportive']} / {t['avoidance']} "
+                f"| \"{t.get('quote', '')}\" {t.get('note', '')}".rstrip())
+    return "\n".join(lines) + "\n\n"
+
+
+def build_analysis_prompt(chats, turn_scores=None):
+    """The PeerSupportEvaluator prompt for a conversation"""
+    transcript = format_transcript(chats)
+    # Only the scores of turns still in the (possibly trimmed) transcript, numbered like it
+    turn_scores = align_turn_scores(chats, turn_scores)
+    scores_section = format_scores(compute_scores(chats, turn_scores), turn_scores)
+
+    return f"""
 SYSTEM:
 You are “PeerSupportEvaluator,” an expert in assessing peer-to-peer conversations where a friend comforts a depressed university student. Your job is to read a transcript of the User’s supportive responses and produce a clear, human-friendly evaluation.
 
@@ -96,7 +243,7 @@ When given a conversation, follow these steps:
 
 1. Identify each time the User offers comfort or support.
 
-2. Rate the User’s responses in three areas (each from 1 to 5 stars):
+2. The User’s responses have already been rated in three areas (each from 1 to 5 stars) with this rubric:
    • Empathetic Language (40%):  
      – ★☆☆☆☆ No warmth or reflection  
      – ★★★☆☆ Basic mirroring and validation  
@@ -110,10 +257,11 @@ When given a conversation, follow these steps:
      – ★★★☆☆ Mostly respectful, with a minor slip  
      – ★★★★★ Always respectful, never judgmental or directive  
 
-3. Calculate an overall star rating out of 5, using the weighted formula:
+3. The overall star rating out of 5 uses the weighted formula:
    > overall = Empathy×0.40 + Supportive×0.30 + Avoidance×0.30  
+   The ratings are listed below. Do not re-score the conversation or recalculate them.
 
-4. For each category, give 1–2 brief quotes from the transcript and explain why they earned their stars.
+4. For each category, give 1–2 brief quotes from the transcript and explain why they fit their stars.
 
 5. Offer one or two practical tips for improving in each area.
 
@@ -133,10 +281,53 @@ Avoidance of Harm: ★★★★★
 Overall: ★★★★☆  
 General feedback: You show strong empathy, just add more strategic encouragement.
 
-Begin your research-anchored evaluation now. Find the chats below.
+{scores_section}Begin your research-anchored evaluation now. Find the chats below, one numbered line per message ("User" is the supporter, "Friend" is the student).
+
+{transcript}
+    """
+
+
+def _run_analysis(chats, turn_scores=None):
+    model = get_genai_model(ANALYSIS_MODEL)
 
-{chats_json}
-    """)
+    with span("analysis_llm", kind=CLIENT, model=ANALYSIS_MODEL):
+        response = model.generate_content(build_analysis_prompt(chats, turn_scores))
 
     print(response.text)
     return response.text
+
+
+def _chunk_text(chunk):
+    """Text of a streamed chunk; chunks without text parts (e.g. only a finish reason) raise on .text"""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def stream_analysis(chats, turn_scores=None):
+    """
+    Generate the analysis incrementally, yielding text chunks as the model writes them.
+
+    A cached analysis is yielded in one chunk. A completed stream is stored in
+    the analysis cache, so a follow-up report doesn't call the model again.
+    """
+    use_cache = os.getenv("ANALYSIS_CACHE", "1") != "0"
+    key = _cache_key(chats, turn_scores)
+    if use_cache:
+        cached = get_analysis_cache().get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    model = get_genai_model(ANALYSIS_MODEL)
+    chunks = []
+    with span("analysis_llm", kind=CLIENT, model=ANALYSIS_MODEL, stream=True):
+        for chunk in model.generate_content(build_analysis_prompt(chats, turn_scores), stream=True):
+            text = _chunk_text(chunk)
+            if text:
+                chunks.append(text)
+                yield text
+
+    if use_cache:
+        get_analysis_cache().put(key, "".join(chunks))
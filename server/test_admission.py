@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Overloaded, from_env
+
+
+class TestAdmissionController:
+    """Test per-pool concurrency caps, queues and priorities"""
+
+    def test_sheds_when_queue_is_full(self):
+        controller = AdmissionController().add_pool("chat", limit=1, queue_depth=0)
+        slot = controller.acquire("chat")
+
+        with pytest.raises(Overloaded) as error:
+            controller.acquire("chat")
+        assert error.value.retry_after >= 1
+        assert controller.stats()["chat"]["shed"] == 1
+
+        slot.release()
+        slot.release()  # idempotent
+        controller.acquire("chat").release()
+
+    def test_waits_for_a_slot(self):
+        controller = AdmissionController().add_pool("chat", limit=1, queue_depth=1)
+        slot = controller.acquire("chat")
+        threading.Timer(0.05, slot.release).start()
+
+        with controller.slot("chat", timeout=2):
+            assert controller.stats()["chat"]["active"] == 1
+
+    def test_wait_times_out(self):
+        controller = AdmissionController().add_pool("chat", limit=1, queue_depth=1)
+        controller.acquire("chat")
+
+        with pytest.raises(Overloaded):
+            controller.acquire("chat", timeout=0.05)
+        assert controller.stats()["chat"]["waiting"] == 0
+
+    def test_chat_is_admitted_before_reports(self):
+        controller = AdmissionController(total=1)
+        controller.add_pool("chat", limit=1, queue_depth=5, priority=0)
+        controller.add_pool("reports", limit=1, queue_depth=5, priority=1)
+        held = controller.acquire("reports")
+        order = []
+
+        def request(pool):
+            with controller.slot(pool, timeout=2):
+                order.append(pool)
+
+        report = threading.Thread(target=request, args=("reports",))
+        report.start()
+        time.sleep(0.05)
+        chat = threading.Thread(target=request, args=("chat",))
+        chat.start()
+        time.sleep(0.05)
+
+        held.release()
+        report.join()
+        chat.join()
+        assert order == ["chat", "reports"]
+
+    def test_wrap_admits_background_work(self):
+        controller = AdmissionController().add_pool("reports", limit=1, queue_depth=0)
+        send = controller.wrap("reports", lambda to: controller.stats()["reports"]["active"])
+        assert send("test@example.com") == 1
+        assert controller.stats()["reports"]["active"] == 0
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("ADMISSION_CHAT_LIMIT", "3")
+    controller = from_env({"chat": (8, 32, 0), "reports": (2, 4, 1)}, total=10)
+
+    assert controller.stats()["chat"]["limit"] == 3
+    assert controller.stats()["reports"]["limit"] == 2
+    assert controller.total == 10
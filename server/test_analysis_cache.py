@@ -0,0 +1,100 @@
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+from analysis_cache import AnalysisCache, make_key
+
+
+class TestMakeKey:
+    """Test transcript hashing"""
+
+    def test_whitespace_does_not_change_key(self):
+        a = make_key(["How are you?", "I'm okay"], "v1", "gemini-2.5-pro")
+        b = make_key(["  How are   you? ", "I'm okay\n"], "v1", "gemini-2.5-pro")
+        assert a == b
+
+    def test_dict_and_string_messages_match(self):
+        a = make_key(["Hi", "Hey"], "v1", "m")
+        b = make_key([{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hey"}], "v1", "m")
+        assert a == b
+
+    def test_rubric_and_content_change_key(self):
+        base = make_key(["Hi", "Hey"], "v1", "m")
+        assert make_key(["Hi", "Hey"], "v2", "m") != base
+        assert make_key(["Hi", "Hey there"], "v1", "m") != base
+        assert make_key(["Hi", "Hey"], "v1", "other") != base
+
+
+class TestAnalysisCache:
+    """Test the on-disk analysis cache"""
+
+    def test_get_or_compute_memoizes(self, tmp_path):
+        cache = AnalysisCache(str(tmp_path))
+        compute = MagicMock(return_value="Overall: ★★★★☆")
+
+        assert cache.get_or_compute("k", compute) == "Overall: ★★★★☆"
+        assert cache.get_or_compute("k", compute) == "Overall: ★★★★☆"
+        compute.assert_called_once()
+
+    def test_persists_across_instances(self, tmp_path):
+        AnalysisCache(str(tmp_path)).put("k", "cached")
+        assert AnalysisCache(str(tmp_path)).get("k") == "cached"
+
+    def test_failures_are_not_cached(self, tmp_path):
+        cache = AnalysisCache(str(tmp_path))
+        with pytest.raises(Exception):
+            cache.get_or_compute("k", MagicMock(side_effect=Exception("API error")))
+        assert cache.get("k") is None
+
+    def test_concurrent_requests_compute_once(self, tmp_path):
+        cache = AnalysisCache(str(tmp_path))
+        calls = []
+
+        def slow_compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "analysis"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", slow_compute)))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert results == ["analysis"] * 5
+        assert len(calls) == 1
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        cache = AnalysisCache(str(tmp_path), max_entries=2)
+        cache.put("a", "A")
+        time.sleep(0.02)
+        cache.put("b", "B")
+        time.sleep(0.02)
+        cache.get("a")  # a is now more recent than b
+        time.sleep(0.02)
+        cache.put("c", "C")
+
+        assert cache.get("a") == "A"
+        assert cache.get("b") is None
+        assert cache.get("c") == "C"
+
+
+class TestGenerateAnalysisCaching:
+    """Test that generate_analysis is memoized"""
+
+    @patch('simple_email.get_genai_model')
+    @patch('simple_email.convert_chats_to_json')
+    def test_repeat_report_skips_llm(self, mock_convert, mock_get_model):
+        from simple_email import generate_analysis
+
+        mock_model = MagicMock()
+        mock_model.generate_content.return_value.text = "Overall: ★★★☆☆"
+        mock_get_model.return_value = mock_model
+
+        chats = ["How are you?", "I'm okay"]
+        assert generate_analysis(chats) == "Overall: ★★★☆☆"
+        assert generate_analysis(list(chats)) == "Overall: ★★★☆☆"
+        mock_model.generate_content.assert_called_once()
@@ -0,0 +1,149 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+from flask import Flask, jsonify, request
+
+from audio_upload import UploadError, parse_wav_header, read_audio_file, read_audio_upload, sniff_format
+
+MAX_BYTES = 1_000_000
+MAX_SECONDS = 5
+
+
+def make_wav(seconds, sample_rate=16000, channels=1, subtype="PCM_16"):
+    samples = 0.5 * np.sin(np.linspace(0, 100, int(seconds * sample_rate)))
+    if channels == 2:
+        samples = np.stack([samples, samples], axis=1)
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format="WAV", subtype=subtype)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route("/upload", methods=["POST"])
+    def upload():
+        try:
+            audio = read_audio_upload(request, MAX_BYTES, MAX_SECONDS)
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
+        return jsonify({"container": audio.container, "duration": audio.duration,
+                        "shape": list(audio.frames.shape) if audio.frames is not None else None,
+                        "peak": float(np.abs(audio.frames).max()) if audio.frames is not None else None})
+
+    return app.test_client()
+
+
+def post_file(client, data, filename="clip.wav"):
+    return client.post("/upload", data={"file": (io.BytesIO(data), filename)},
+                       content_type="multipart/form-data")
+
+
+class TestReadAudioUpload:
+    """Test the streamed, bounded upload path"""
+
+    @pytest.mark.parametrize("subtype", ["PCM_U8", "PCM_16", "PCM_32", "FLOAT"])
+    def test_wav_is_decoded_to_pcm(self, client, subtype):
+        response = post_file(client, make_wav(1, channels=2, subtype=subtype))
+
+        assert response.status_code == 200
+        assert response.json["container"] == "wav"
+        assert response.json["duration"] == 1.0
+        assert response.json["shape"] == [16000, 2]
+        assert response.json["peak"] == pytest.approx(0.5, abs=0.01)
+
+    def test_raw_audio_body(self, client):
+        response = client.post("/upload", data=make_wav(1), content_type="audio/wav")
+        assert response.status_code == 200
+
+    def test_compressed_format_is_kept_encoded(self, client):
+        buffer = io.BytesIO()
+        sf.write(buffer, np.zeros(16000), 16000, format="FLAC")
+        response = post_file(client, buffer.getvalue(), "clip.flac")
+
+        assert response.status_code == 200
+        assert response.json["container"] == "flac"
+        assert response.json["shape"] is None
+
+    def test_too_long(self, client):
+        response = post_file(client, make_wav(MAX_SECONDS + 1))
+        assert response.status_code == 413
+
+    def test_too_large(self, client):
+        # Within the duration limit, but over the byte limit
+        response = post_file(client, make_wav(4, sample_rate=48000, channels=2, subtype="FLOAT"))
+        assert response.status_code == 413
+        assert "larger than" in response.json["error"]
+
+    def test_not_audio(self, client):
+        response = post_file(client, b"<html>definitely not audio</html>")
+        assert response.status_code == 415
+
+    @pytest.mark.parametrize("subtype", ["PCM_24", "DOUBLE", "ULAW"])
+    def test_other_wav_encodings_are_kept_encoded(self, client, subtype):
+        response = post_file(client, make_wav(1, subtype=subtype))
+        assert response.status_code == 200
+        assert (response.json["container"], response.json["shape"]) == ("wav", None)
+
+        upload = read_audio_file(io.BytesIO(make_wav(1, channels=2, subtype=subtype)), MAX_BYTES, MAX_SECONDS)
+        audio, sample_rate = upload.decode()
+        assert (audio.shape, sample_rate) == ((16000,), 16000)
+        assert np.abs(audio).max() == pytest.approx(0.5, abs=0.02)
+
+    def test_other_wav_encodings_are_checked_for_duration(self, client):
+        assert post_file(client, make_wav(MAX_SECONDS + 1, subtype="PCM_24")).status_code == 413
+
+    def test_missing_file(self, client):
+        assert client.post("/upload", data={"other": "x"}).json["error"] == "No audio file provided"
+        assert post_file(client, b"", filename="").json["error"] == "No file selected"
+
+    def test_chunks_after_the_data_are_not_decoded(self, client):
+        info = b"INFOISFT" + (14).to_bytes(4, "little") + b"\xff" * 14
+        wav = bytearray(make_wav(1) + b"LIST" + len(info).to_bytes(4, "little") + info)
+        wav[4:8] = (len(wav) - 8).to_bytes(4, "little")
+
+        response = post_file(client, bytes(wav))
+        assert response.json["shape"] == [16000, 1]
+        assert response.json["peak"] == pytest.approx(0.5, abs=0.01)
+
+    def test_oversized_wav_is_rejected_from_its_header(self):
+        header = make_wav(MAX_SECONDS + 1)[:44]
+        chunks = [header]
+
+        class Stream:
+            def read(self, size):
+                if not chunks:
+                    raise AssertionError("read past the WAV header")
+                return chunks.pop(0)
+
+        class Request:
+            content_length = None
+            headers = {"Content-Type": "audio/wav"}
+            stream = Stream()
+
+        with pytest.raises(UploadError) as error:
+            read_audio_upload(Request(), MAX_BYTES * 10, MAX_SECONDS)
+        assert error.value.status == 413
+
+
+def test_read_audio_file():
+    upload = read_audio_file(io.BytesIO(make_wav(1, 44100, channels=2)), MAX_BYTES, MAX_SECONDS, "clip.wav")
+    assert (upload.filename, upload.sample_rate, upload.frames.shape) == ("clip.wav", 44100, (44100, 2))
+    with pytest.raises(UploadError):
+        read_audio_file(io.BytesIO(make_wav(MAX_SECONDS + 1)), MAX_BYTES * 10, MAX_SECONDS)
+
+
+def test_parse_wav_header_needs_more_data():
+    wav = make_wav(0.1)
+    assert parse_wav_header(wav[:20]) is None
+    fmt, offset = parse_wav_header(wav)
+    assert (fmt["channels"], fmt["sample_rate"], offset) == (1, 16000, 44)
+
+
+def test_sniff_format():
+    assert sniff_format(b"OggS\0\0\0\0\0\0\0\0") == "ogg"
+    assert sniff_format(b"\x1aE\xdf\xa3\0\0\0\0\0\0\0\0") == "webm"
+    assert sniff_format(b"hello world!") is None
@@ -0,0 +1,102 @@
+import json
+import time
+from unittest.mock import MagicMock
+
+from batch_evaluate import (TokenBucket, iter_transcripts, local_evaluation, pairs_to_chats,
+                            percentile, run_batch)
+
+
+def read_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class TestIterTranscripts:
+    """Test reading archived transcripts"""
+
+    def test_directory_of_pair_files(self, tmp_path):
+        (tmp_path / "a.json").write_text(json.dumps([{"user": "Hello", "system": "Hi"}, {"user": "Bye", "system": ""}]))
+        (tmp_path / "notes.txt").write_text("ignored")
+
+        assert list(iter_transcripts(str(tmp_path))) == [("a.json", ["Hello", "Hi", "Bye"])]
+
+    def test_jsonl_stream(self, tmp_path):
+        path = tmp_path / "sessions.jsonl"
+        path.write_text("\n".join([
+            json.dumps([{"user": "Hello", "system": "Hi"}]),
+            json.dumps({"id": "s2", "chats": ["Hey", "Yo"]}),
+            "not json",
+        ]))
+
+        assert list(iter_transcripts(str(path))) == [("line-1", ["Hello", "Hi"]), ("s2", ["Hey", "Yo"])]
+
+
+class TestRunBatch:
+    """Test concurrent evaluation with checkpointing"""
+
+    def test_results_are_written(self, tmp_path):
+        output = str(tmp_path / "results.jsonl")
+        transcripts = [(f"t{i}", ["I'm here for you.", "Thanks"]) for i in range(5)]
+
+        stats = run_batch(transcripts, output, evaluate=local_evaluation, workers=3)
+
+        results = read_results(output)
+        assert stats["ok"] == 5
+        assert sorted(r["id"] for r in results) == ["t0", "t1", "t2", "t3", "t4"]
+        assert all(r["scores"]["supportive"] > 1 for r in results)
+        assert stats["p50"] is not None
+
+    def test_resume_skips_completed(self, tmp_path):
+        output = str(tmp_path / "results.jsonl")
+        evaluate = MagicMock(side_effect=[Exception("Rate limited"), {"analysis": "ok"}])
+        run_batch([("t0", ["a"]), ("t1", ["b"])], output, evaluate=evaluate, workers=1)
+
+        retry = MagicMock(return_value={"analysis": "ok"})
+        stats = run_batch([("t0", ["a"]), ("t1", ["b"])], output, evaluate=retry, workers=1)
+
+        # Only the failed transcript is evaluated again
+        retry.assert_called_once_with(["a"])
+        assert stats["skipped"] == 1
+
+    def test_concurrency_is_bounded(self, tmp_path):
+        active, peak = [0], [0]
+
+        def evaluate(chats):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            active[0] -= 1
+            return {}
+
+        run_batch([(str(i), ["x"]) for i in range(10)], str(tmp_path / "r.jsonl"), evaluate=evaluate, workers=2)
+        assert peak[0] <= 2
+
+    def test_unserializable_result_is_recorded_as_an_error(self, tmp_path):
+        evaluate = MagicMock(side_effect=[{"analysis": object()}, {"analysis": "ok"}, {"analysis": "ok"}])
+        stats = run_batch([(str(i), ["x"]) for i in range(3)], str(tmp_path / "r.jsonl"), evaluate=evaluate, workers=1)
+
+        # The failed write didn't keep the only slot, so the later transcripts still ran
+        assert evaluate.call_count == 3
+        assert (stats["ok"], stats["error"]) == (2, 1)
+        records = {r["id"]: r for r in read_results(tmp_path / "r.jsonl")}
+        assert records["0"]["status"] == "error"
+        assert records["0"]["error"].startswith("Unserializable result")
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_helpers():
+    assert pairs_to_chats([{"user": "a", "system": "b"}, {"user": "c", "system": ""}]) == ["a", "b", "c"]
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
+    assert percentile([1, 2, 3, 4, 5], 90) == 5
+    assert percentile(list(range(1, 101)), 7) == 7
+    assert percentile([5, 1, 3], 1) == 1
+    assert percentile([5, 1, 3], 100) == 5
+    assert percentile([], 90) is None
@@ -0,0 +1,84 @@
+import threading
+import time
+import uuid
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+
+class FakeLLM:
+    def __init__(self, *replies):
+        self.replies = list(replies)
+
+    def invoke(self, messages):
+        return self.replies.pop(0)
+
+
+@pytest.fixture
+def chatbot(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "fake_api_key")
+    import chatbot
+
+    # Restored after the test; run_turn swaps in a fake model
+    monkeypatch.setattr(chatbot, "llm_with_tools", chatbot.llm_with_tools)
+    monkeypatch.setattr(chatbot, "save_state", MagicMock())
+    monkeypatch.setattr(chatbot, "get_mood_with_intensity", MagicMock())
+    chatbot.get_mood_with_intensity.invoke.return_value = {"mood": "sad", "intensity": 70}
+    return chatbot
+
+
+def run_turn(chatbot, text, *replies):
+    thread_id = uuid.uuid4().hex
+    chatbot.llm_with_tools = FakeLLM(*replies)
+    result = chatbot.graph.invoke({"messages": [HumanMessage(content=text)]}, chatbot.get_config(thread_id))
+    return thread_id, result["messages"][-1].content
+
+
+def wait_for_call(mock, timeout=5):
+    deadline = time.time() + timeout
+    while not mock.called and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class TestChatbot:
+    """Test background mood detection and state saving around the reply"""
+
+    def test_turn_is_saved_with_the_final_reply(self, chatbot):
+        tool_call = AIMessage(content="", tool_calls=[{"name": "get_weather", "args": {"city": "New York"},
+                                                       "id": "call-1"}])
+        thread_id, reply = run_turn(chatbot, "How's the weather?", tool_call, AIMessage(content="Sunny out!"))
+
+        assert reply == "Sunny out!"
+        assert chatbot.get_latest_mood(thread_id, timeout=5) == {"mood": "sad", "intensity": 70}
+        wait_for_call(chatbot.save_state.invoke)
+        chatbot.save_state.invoke.assert_called_once_with(
+            {"emotion": "sad", "user_message": "How's the weather?", "ai_response": "Sunny out!"})
+        chatbot.get_mood_with_intensity.invoke.assert_called_once_with({"user_message": "How's the weather?"})
+
+    def test_reply_does_not_wait_for_mood(self, chatbot):
+        gate = threading.Event()
+
+        def slow_mood(args):
+            gate.wait(5)
+            return {"mood": "happy", "intensity": 40}
+
+        chatbot.get_mood_with_intensity.invoke.side_effect = slow_mood
+        thread_id, reply = run_turn(chatbot, "I got the internship!", AIMessage(content="Congrats!"))
+
+        assert reply == "Congrats!"
+        assert chatbot.get_latest_mood(thread_id, timeout=0.01) is None
+        chatbot.save_state.invoke.assert_not_called()
+        gate.set()
+        assert chatbot.get_latest_mood(thread_id, timeout=5) == {"mood": "happy", "intensity": 40}
+        wait_for_call(chatbot.save_state.invoke)
+        assert chatbot.save_state.invoke.call_args[0][0]["ai_response"] == "Congrats!"
+
+    def test_mood_errors_are_contained(self, chatbot):
+        chatbot.get_mood_with_intensity.invoke.side_effect = RuntimeError("quota")
+        thread_id, reply = run_turn(chatbot, "hey", AIMessage(content="Hey!"))
+
+        assert reply == "Hey!"
+        assert chatbot.get_latest_mood(thread_id, timeout=5) is None
+        assert chatbot.get_latest_mood("unknown-thread") is None
+        chatbot.save_state.invoke.assert_not_called()
@@ -0,0 +1,90 @@
+import os
+import time
+from typing import TypedDict
+
+from langgraph.graph import END, START, StateGraph
+
+from checkpointer import BoundedSaver
+
+
+class Counter(TypedDict):
+    count: int
+
+
+def build_graph(saver):
+    builder = StateGraph(Counter)
+    builder.add_node("increment", lambda state: {"count": state["count"] + 1})
+    builder.add_edge(START, "increment")
+    builder.add_edge("increment", END)
+    return builder.compile(checkpointer=saver)
+
+
+def config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def run(graph, thread_id, count=0):
+    return graph.invoke({"count": count}, config(thread_id))["count"]
+
+
+class TestBoundedSaver:
+    """Test checkpoint pruning, thread eviction and spilling to disk"""
+
+    def test_old_checkpoints_are_pruned(self):
+        saver = BoundedSaver(max_checkpoints=2)
+        graph = build_graph(saver)
+        for count in range(5):
+            assert run(graph, "a", count) == count + 1
+
+        assert saver.checkpoint_count("a") == 2
+        assert graph.get_state(config("a")).values == {"count": 5}
+        # Only the blobs the kept checkpoints still reference survive
+        referenced = {version for _, (serialized, _, _) in saver.storage["a"][""].items()
+                      for version in saver.serde.loads_typed(serialized)["channel_versions"].items()}
+        assert {(key[2], key[3]) for key in saver.blobs if key[0] == "a"} <= referenced
+        assert all(key[2] in saver.storage["a"][""] for key in saver.writes if key[0] == "a")
+
+    def test_least_recently_used_threads_are_evicted(self):
+        saver = BoundedSaver(max_threads=2)
+        graph = build_graph(saver)
+        for thread_id in ("a", "b"):
+            run(graph, thread_id)
+        graph.get_state(config("a"))  # "a" is now the most recently used
+        run(graph, "c")
+
+        assert saver.thread_count() == 2
+        assert set(saver.storage) == {"a", "c"}
+
+    def test_idle_threads_are_evicted(self):
+        saver = BoundedSaver(idle_ttl=0.05)
+        graph = build_graph(saver)
+        run(graph, "a")
+        time.sleep(0.1)
+        run(graph, "b")
+
+        assert set(saver.storage) == {"b"}
+
+    def test_evicted_threads_spill_and_restore(self, tmp_path):
+        spill_dir = str(tmp_path / "spill")
+        saver = BoundedSaver(max_threads=1, spill_dir=spill_dir)
+        graph = build_graph(saver)
+        run(graph, "a", 41)
+        run(graph, "b", 1)
+        assert "a" not in saver.storage
+        assert len(os.listdir(spill_dir)) == 1
+
+        # Reading "a" restores it and spills "b", so the limit still holds
+        assert graph.get_state(config("a")).values == {"count": 42}
+        assert saver.thread_count() == 1
+        assert set(saver.storage) == {"a"}
+        assert graph.get_state(config("b")).values == {"count": 2}
+
+    def test_delete_thread_removes_spill_file(self, tmp_path):
+        spill_dir = str(tmp_path / "spill")
+        saver = BoundedSaver(max_threads=1, spill_dir=spill_dir)
+        graph = build_graph(saver)
+        run(graph, "a")
+        run(graph, "b")
+        saver.delete_thread("a")
+
+        assert os.listdir(spill_dir) == []
@@ -0,0 +1,94 @@
+import io
+import json
+
+import pytest
+
+from convert_chats import (chats_to_pairs, convert_file, convert_stream, format_transcript, iter_json_array,
+                           iter_messages)
+from rubric_scorer import user_messages
+
+
+class TestPairs:
+    """Test grouping messages into {user, system} pairs"""
+
+    def test_trailing_user_message_is_kept(self):
+        assert chats_to_pairs(["Hello", "Hi", "Bye"]) == [
+            {"user": "Hello", "system": "Hi"}, {"user": "Bye", "system": ""}]
+
+    def test_drop_incomplete(self):
+        assert chats_to_pairs(["Hello", "Hi", "Bye"], drop_incomplete=True) == [{"user": "Hello", "system": "Hi"}]
+
+
+class TestFormatTranscript:
+    """Test the prompt transcript labels"""
+
+    def test_plain_strings_alternate(self):
+        assert format_transcript(["Hey", "I'm okay", "Sure?", ""]) == "1 User: Hey\n1 Friend: I'm okay\n2 User: Sure?"
+
+    def test_roles_are_used_when_history_was_trimmed(self):
+        # add_message keeps the last 10 entries, so history can start with the friend
+        history = [{"role": "assistant", "content": "I failed again"},
+                   {"role": "user", "content": "That sounds hard"},
+                   {"role": "assistant", "content": "Yeah"}]
+
+        assert format_transcript(history) == "1 Friend: I failed again\n2 User: That sounds hard\n2 Friend: Yeah"
+        assert user_messages(history) == ["That sounds hard"]
+
+
+class TestStreamingConversion:
+    """Test the single-pass converter"""
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 8, 65536])
+    def test_json_array_across_chunk_boundaries(self, chunk_size):
+        items = ["Hello, [world]", {"role": "user", "content": "é \"quoted\""}, 12345, ["nested", 1]]
+        parsed = list(iter_json_array(io.StringIO(json.dumps(items, indent=2)), chunk_size=chunk_size))
+        assert parsed == items
+
+    @pytest.mark.parametrize("text, expected", [
+        ('[\n  "Hello",\n  "Hi"\n]', ["Hello", "Hi"]),
+        ('"Hello"\n\n{"role": "assistant", "content": "Hi"}\n', ["Hello", {"role": "assistant", "content": "Hi"}]),
+        ("Hello there\n\nHi!\n", ["Hello there", "Hi!"]),
+        ("[laughs] hey\nhi back\n", ["[laughs] hey", "hi back"]),
+        ('"quoted opener"\nplain reply\n', ['"quoted opener"', "plain reply"]),
+        ("", []),
+    ])
+    def test_format_detection(self, text, expected):
+        assert list(iter_messages(io.StringIO(text))) == expected
+
+    def test_extension_decides_the_format(self, tmp_path):
+        import simple_email  # noqa: F401  (puts the repo root on sys.path)
+        from chat_processor import load_chats_from_file
+
+        text = tmp_path / "export.txt"
+        text.write_text('["a", "b"] is what I wrote\n"quoted"\n', encoding="utf-8")
+        jsonl = tmp_path / "export.jsonl"
+        jsonl.write_text('"Hello"\n"Hi"\n', encoding="utf-8")
+
+        assert load_chats_from_file(str(text)) == ['["a", "b"] is what I wrote', '"quoted"']
+        assert load_chats_from_file(str(jsonl)) == ["Hello", "Hi"]
+
+    def test_truncated_json_array(self):
+        with pytest.raises(ValueError):
+            list(iter_messages(io.StringIO('["Hello", "Hi"'), "json"))
+
+    def test_convert_writes_jsonl_pairs(self, tmp_path):
+        source = tmp_path / "export.txt"
+        source.write_text("Hello\nHi\nBye\n", encoding="utf-8")
+        target = tmp_path / "pairs.jsonl"
+
+        assert convert_file(str(source), str(target)) == 2
+        lines = target.read_text(encoding="utf-8").splitlines()
+        assert [json.loads(line) for line in lines] == [
+            {"user": "Hello", "system": "Hi"}, {"user": "Bye", "system": ""}]
+
+    def test_convert_stream_is_lazy(self):
+        def messages():
+            for i in range(10):
+                yield json.dumps(f"message {i}") + "\n"
+            raise AssertionError("read past what was needed")
+
+        out = io.StringIO()
+        with pytest.raises(AssertionError):
+            convert_stream(messages(), out, fmt="jsonl")
+        # Pairs were written as the input was read, before the failure
+        assert len(out.getvalue().splitlines()) == 5
@@ -1,26 +1,22 @@
 import pytest
 import json
 import os
-from unittest.mock import patch, MagicMock, mock_open
+from unittest.mock import patch, MagicMock, PropertyMock, mock_open
 import responses
-from simple_email import send_email, generate_analysis
+from simple_email import send_digest, send_email, generate_analysis, stream_analysis
 
 
 class TestGenerateAnalysis:
     """Test the generate_analysis function"""
     
-    @patch('simple_email.os.getenv')
-    @patch('simple_email.genai.configure')
-    @patch('simple_email.genai.GenerativeModel')
+    @patch('simple_email.get_genai_model')
     @patch('simple_email.convert_chats_to_json')
-    def test_generate_analysis_success(self, mock_convert, mock_model_class, mock_configure, mock_getenv):
+    def test_generate_analysis_success(self, mock_convert, mock_get_model):
         """Test successful analysis generation"""
         # Setup mocks
-        mock_getenv.return_value = "fake_api_key"
         mock_model = MagicMock()
         mock_model.generate_content.return_value.text = "Score: 85/100\nAnalysis: Good empathetic responses."
-        mock_model_class.return_value = mock_model
-        mock_convert.return_value = [{"user": "How are you?", "system": "I'm okay"}]
+        mock_get_model.return_value = mock_model
         
         # Test data
         chats = ["How are you?", "I'm okay", "Really? You seem tired", "Yeah, haven't been sleeping well"]
@@ -30,9 +26,12 @@ class TestGenerateAnalysis:
         
         # Assert
         assert result == "Score: 85/100\nAnalysis: Good empathetic responses."
-        mock_convert.assert_called_once_with(chats, "chats.json")
-        mock_configure.assert_called_once_with(api_key="fake_api_key")
-        mock_model_class.assert_called_once_with("gemini-2.5-flash")
+        # Transcript is serialized in memory, not written to chats.json
+        mock_convert.assert_not_called()
+        prompt = mock_model.generate_content.call_args[0][0]
+        assert "1 User: How are you?" in prompt
+        assert "2 Friend: Yeah, haven't been sleeping well" in prompt
+        mock_get_model.assert_called_once_with("gemini-2.5-pro")
         mock_model.generate_content.assert_called_once()
     
     @patch('simple_email.os.getenv')
@@ -46,22 +45,137 @@ class TestGenerateAnalysis:
         with pytest.raises(Exception):
             generate_analysis(chats)
     
-    @patch('simple_email.os.getenv')
-    @patch('simple_email.genai.configure')
-    @patch('simple_email.genai.GenerativeModel')
+    @patch('simple_email.get_genai_model')
     @patch('simple_email.convert_chats_to_json')
-    def test_generate_analysis_empty_chats(self, mock_convert, mock_model_class, mock_configure, mock_getenv):
+    def test_generate_analysis_empty_chats(self, mock_convert, mock_get_model):
         """Test analysis with empty chat list"""
-        mock_getenv.return_value = "fake_api_key"
         mock_model = MagicMock()
         mock_model.generate_content.return_value.text = "No conversation to analyze."
-        mock_model_class.return_value = mock_model
-        mock_convert.return_value = []
+        mock_get_model.return_value = mock_model
         
         result = generate_analysis([])
         
         assert result == "No conversation to analyze."
-        mock_convert.assert_called_once_with([], "chats.json")
+        mock_convert.assert_not_called()
+
+    @patch('simple_email.get_genai_model')
+    def test_generate_analysis_with_turn_scores(self, mock_get_model):
+        """Test that precomputed per-turn scores are aggregated into the prompt"""
+        mock_model = MagicMock()
+        mock_model.generate_content.return_value.text = "Overall: ★★★★☆"
+        mock_get_model.return_value = mock_model
+        turn_scores = [
+            {"turn": 0, "message": "I'm here", "empathy": 4, "supportive": 3, "avoidance": 5,
+             "quote": "I'm here", "note": ""},
+            {"turn": 1, "message": "Ok", "empathy": 2, "supportive": 3, "avoidance": 5, "quote": "", "note": ""},
+        ]
+        
+        generate_analysis(["I'm here", "Thanks", "Ok", "Yeah"], turn_scores=turn_scores)
+        
+        prompt = mock_model.generate_content.call_args[0][0]
+        assert "Turn 1: 4 / 3 / 5" in prompt
+        assert "Empathy: ★★★☆☆ (3.0/5)" in prompt
+        assert "Avoidance of Harm: ★★★★★ (5.0/5)" in prompt
+        assert "Do not re-score the conversation" in prompt
+
+    @patch('simple_email.get_genai_model')
+    def test_turn_scores_follow_the_trimmed_history(self, mock_get_model):
+        """Test that scores of turns trimmed from the history are dropped and the rest renumbered"""
+        mock_model = MagicMock()
+        mock_model.generate_content.return_value.text = "Analysis"
+        mock_get_model.return_value = mock_model
+        turn_scores = [
+            {"turn": 0, "message": "Hi", "empathy": 1, "supportive": 1, "avoidance": 1},
+            {"turn": 1, "message": "I'm here", "empathy": 4, "supportive": 3, "avoidance": 5},
+            {"turn": 2, "message": "Ok", "empathy": 2, "supportive": 3, "avoidance": 5},
+        ]
+        chats = [{"role": "assistant", "content": "Hey"}, {"role": "user", "content": "I'm here"},
+                 {"role": "assistant", "content": "Thanks"}, {"role": "user", "content": "Ok"}]
+
+        with patch.dict(os.environ, {"ANALYSIS_CACHE": "0"}):
+            generate_analysis(chats, turn_scores=turn_scores)
+
+        prompt = mock_model.generate_content.call_args[0][0]
+        assert "2 User: I'm here" in prompt and "Turn 2: 4 / 3 / 5" in prompt
+        assert "3 User: Ok" in prompt and "Turn 3: 2 / 3 / 5" in prompt
+        assert "Turn 1:" not in prompt
+        assert "Empathy: ★★★☆☆ (3.0/5)" in prompt
+
+    @patch('simple_email.get_genai_model')
+    def test_scores_are_computed_locally(self, mock_get_model):
+        """Test that the star ratings in the prompt come from the local scorer and are stable"""
+        mock_model = MagicMock()
+        mock_model.generate_content.return_value.text = "Analysis"
+        mock_get_model.return_value = mock_model
+        chats = ["That sounds really hard. I'm here for you.", "Thanks", "You should just get over it", "Oh"]
+        
+        with patch.dict(os.environ, {"ANALYSIS_CACHE": "0"}):
+            generate_analysis(chats)
+            generate_analysis(chats)
+        
+        first, second = [c[0][0] for c in mock_model.generate_content.call_args_list]
+        assert first == second
+        assert "Ratings (already computed from the transcript" in first
+
+    @patch('simple_email.get_genai_model')
+    @patch('simple_email.convert_chats_to_json')
+    def test_generate_analysis_explicit_export(self, mock_convert, mock_get_model):
+        """Test that writing the transcript to disk is opt-in"""
+        mock_get_model.return_value.generate_content.return_value.text = "Analysis"
+        
+        chats = ["Hello", "Hi there"]
+        generate_analysis(chats, export_path="export.json")
+        
+        mock_convert.assert_called_once_with(chats, "export.json")
+
+
+class TestStreamAnalysis:
+    """Test the streaming analysis generator"""
+    
+    @patch('simple_email.get_genai_model')
+    def test_stream_yields_chunks_and_caches(self, mock_get_model):
+        """Test that chunks are forwarded as generated and the result is cached"""
+        mock_model = MagicMock()
+        mock_model.generate_content.return_value = [
+            MagicMock(text="Empathy: ★★★★☆\n"),
+            MagicMock(text="Overall: ★★★★☆"),
+        ]
+        mock_get_model.return_value = mock_model
+        
+        chats = ["How are you?", "I'm okay"]
+        chunks = list(stream_analysis(chats))
+        
+        assert chunks == ["Empathy: ★★★★☆\n", "Overall: ★★★★☆"]
+        assert mock_model.generate_content.call_args[1] == {"stream": True}
+        
+        # A later report for the same conversation reuses the streamed text
+        assert generate_analysis(chats) == "Empathy: ★★★★☆\nOverall: ★★★★☆"
+        assert mock_model.generate_content.call_count == 1
+    
+    @patch('simple_email.get_genai_model')
+    def test_stream_skips_chunks_without_text(self, mock_get_model):
+        """Test that a chunk with no text parts (its .text raises) doesn't end the stream"""
+        no_text = MagicMock()
+        type(no_text).text = PropertyMock(side_effect=ValueError("no text parts"))
+        mock_get_model.return_value.generate_content.return_value = [MagicMock(text="Overall"), no_text,
+                                                                     MagicMock(text=": ★★★★☆")]
+
+        with patch.dict(os.environ, {"ANALYSIS_CACHE": "0"}), patch('simple_email.span') as mock_span:
+            chunks = list(stream_analysis(["How are you?", "I'm okay"]))
+
+        assert chunks == ["Overall", ": ★★★★☆"]
+        assert mock_span.call_args[0][0] == "analysis_llm"
+
+    @patch('simple_email.generate_analysis')
+    def test_send_email_with_precomputed_analysis(self, mock_generate):
+        """Test that an already streamed analysis is emailed without regenerating it"""
+        with patch('requests.Session.post') as mock_post:
+            mock_post.return_value.status_code = 200
+            
+            assert send_email("test@example.com", ["test"], analysis="Streamed analysis") is True
+            
+            mock_generate.assert_not_called()
+            assert "Streamed analysis" in mock_post.call_args[1]['json']['html']
 
 
 class TestSendEmail:
@@ -123,7 +237,7 @@ class TestSendEmail:
         """Test that the email message includes the research section"""
         mock_generate.return_value = "Analysis content here"
         
-        with patch('simple_email.requests.post') as mock_post:
+        with patch('requests.Session.post') as mock_post:
             mock_post.return_value.status_code = 200
             
             send_email("test@example.com", ["test", "message"])
@@ -146,7 +260,7 @@ class TestSendEmail:
         """Test email headers and basic structure"""
         mock_generate.return_value = "Test analysis"
         
-        with patch('simple_email.requests.post') as mock_post:
+        with patch('requests.Session.post') as mock_post:
             mock_post.return_value.status_code = 200
             
             send_email("user@test.com", ["msg1", "msg2"])
@@ -166,11 +280,34 @@ class TestSendEmail:
             assert 'html' in request_data
 
 
+class TestSendDigest:
+    """Test combining several reports into one digest email"""
+    
+    @responses.activate
+    @patch('simple_email.generate_analysis')
+    def test_digest_is_one_request(self, mock_generate):
+        """Test that all reports for a recipient go out in a single send"""
+        mock_generate.return_value = "Generated analysis"
+        responses.add(responses.POST, "https://api.resend.com/emails", json={"id": "email_123"}, status=200)
+        
+        result = send_digest("test@example.com", [(["Hello", "Hi"], {}), (["Hey"], {"analysis": "Precomputed"})])
+        
+        assert result is True
+        assert len(responses.calls) == 1
+        mock_generate.assert_called_once_with(["Hello", "Hi"], turn_scores=None)
+        request_body = json.loads(responses.calls[0].request.body)
+        assert request_body["subject"] == "Peer Support Analysis Reports (2)"
+        html = request_body["html"]
+        assert html.index("Report 1 of 2") < html.index("Generated analysis") < html.index("Report 2 of 2")
+        assert "Precomputed" in html
+        assert html.count("Research References") == 1
+
+
 class TestEmailMessageFormatting:
     """Test the message formatting specifically"""
     
     @patch('simple_email.generate_analysis')
-    @patch('simple_email.requests.post')
+    @patch('requests.Session.post')
     def test_research_section_formatting(self, mock_post, mock_generate):
         """Test that the research section is properly formatted"""
         mock_generate.return_value = "LLM Response Here"
@@ -188,7 +325,7 @@ class TestEmailMessageFormatting:
         assert "This analysis is based on the following peer-reviewed research:" in html_content
     
     @patch('simple_email.generate_analysis')
-    @patch('simple_email.requests.post')
+    @patch('requests.Session.post')
     def test_llm_response_before_research(self, mock_post, mock_generate):
         """Test that LLM response appears before research section"""
         mock_generate.return_value = "Score: 80/100\nDetailed analysis here"
@@ -214,7 +351,7 @@ class TestEdgeCases:
         """Test handling of empty LLM response"""
         mock_generate.return_value = ""
         
-        with patch('simple_email.requests.post') as mock_post:
+        with patch('requests.Session.post') as mock_post:
             mock_post.return_value.status_code = 200
             
             result = send_email("test@example.com", ["test"])
@@ -230,7 +367,7 @@ class TestEdgeCases:
         """Test handling of network errors"""
         mock_generate.return_value = "Test response"
         
-        with patch('simple_email.requests.post') as mock_post:
+        with patch('requests.Session.post') as mock_post:
             mock_post.side_effect = Exception("Network error")
             
             # Should handle the exception gracefully
@@ -242,7 +379,7 @@ class TestEdgeCases:
         """Test with invalid email address"""
         mock_generate.return_value = "Test response"
         
-        with patch('simple_email.requests.post') as mock_post:
+        with patch('requests.Session.post') as mock_post:
             mock_post.return_value.status_code = 400
             mock_post.return_value.text = "Invalid email address"
             
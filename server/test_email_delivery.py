@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+import pytest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from email_delivery import EmailDeliveryClient, parse_retry_after
+
+
+class StubResend:
+    """Local stand-in for the Resend API that replays scripted responses"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests.append({
+                    "path": self.path,
+                    "headers": dict(self.headers),
+                    "body": json.loads(body),
+                })
+                status, headers, delay = stub.responses.pop(0) if stub.responses else (200, {}, 0)
+                time.sleep(delay)
+                payload = json.dumps({"id": "email_123"}).encode()
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def make_stub():
+    stubs = []
+
+    def factory(*responses):
+        stub = StubResend(responses)
+        stubs.append(stub)
+        return stub
+
+    yield factory
+    for stub in stubs:
+        stub.close()
+
+
+def message(to="test@example.com"):
+    return {"from": "onboarding@resend.dev", "to": [to], "subject": "Report", "html": "<pre>hi</pre>"}
+
+
+class TestDeliveryClient:
+    """Test the pooled, retrying delivery client against a stub server"""
+
+    def test_send_success(self, make_stub):
+        stub = make_stub((200, {}, 0))
+        client = EmailDeliveryClient(api_key="test_key", base_url=stub.url)
+
+        ok, response = client.send(message())
+
+        assert ok is True
+        assert len(stub.requests) == 1
+        request = stub.requests[0]
+        assert request["path"] == "/emails"
+        assert request["headers"]["Authorization"] == "Bearer test_key"
+        assert request["headers"]["Idempotency-Key"]
+        assert request["body"]["to"] == ["test@example.com"]
+
+    def test_retries_honour_retry_after(self, make_stub):
+        stub = make_stub((429, {"Retry-After": "0.2"}, 0), (503, {}, 0), (200, {}, 0))
+        client = EmailDeliveryClient(api_key="test_key", base_url=stub.url, backoff=0.01)
+
+        start = time.time()
+        ok, _ = client.send(message())
+
+        assert ok is True
+        assert len(stub.requests) == 3
+        assert time.time() - start >= 0.2
+        # Retries reuse the idempotency key so the provider can de-duplicate
+        keys = {r["headers"]["Idempotency-Key"] for r in stub.requests}
+        assert len(keys) == 1
+
+    def test_gives_up_after_max_retries(self, make_stub):
+        stub = make_stub(*[(500, {}, 0)] * 5)
+        client = EmailDeliveryClient(api_key="test_key", base_url=stub.url, max_retries=2, backoff=0.01)
+
+        ok, response = client.send(message())
+
+        assert ok is False
+        assert response.status_code == 500
+        assert len(stub.requests) == 3
+
+    def test_client_errors_are_not_retried(self, make_stub):
+        stub = make_stub((401, {}, 0))
+        client = EmailDeliveryClient(api_key="bad_key", base_url=stub.url, backoff=0.01)
+
+        ok, _ = client.send(message())
+
+        assert ok is False
+        assert len(stub.requests) == 1
+
+    def test_read_timeout(self, make_stub):
+        stub = make_stub(*[(200, {}, 1.0)] * 3)
+        client = EmailDeliveryClient(api_key="test_key", base_url=stub.url, read_timeout=0.1,
+                                     max_retries=1, backoff=0.01)
+
+        with pytest.raises(requests.Timeout):
+            client.send(message())
+
+    def test_batch_endpoint(self, make_stub):
+        stub = make_stub((200, {}, 0))
+        client = EmailDeliveryClient(api_key="test_key", base_url=stub.url)
+
+        results = client.send_batch([message("a@example.com"), message("b@example.com")])
+
+        assert results == [True, True]
+        assert len(stub.requests) == 1
+        assert stub.requests[0]["path"] == "/emails/batch"
+        assert [m["to"] for m in stub.requests[0]["body"]] == [["a@example.com"], ["b@example.com"]]
+
+    def test_batch_is_chunked(self, make_stub):
+        stub = make_stub()
+        client = EmailDeliveryClient(api_key="test_key", base_url=stub.url)
+
+        results = client.send_batch([message() for _ in range(150)])
+
+        assert results == [True] * 150
+        assert [len(r["body"]) for r in stub.requests] == [100, 50]
+
+
+class TestSendEmails:
+    """Test sending several reports through one batch call"""
+
+    @patch('simple_email.generate_analysis')
+    def test_send_emails_uses_batch(self, mock_generate, make_stub):
+        import simple_email
+
+        mock_generate.return_value = "Score: 80/100"
+        stub = make_stub((200, {}, 0))
+        client = EmailDeliveryClient(api_key="test_key", base_url=stub.url)
+
+        with patch('simple_email.get_delivery_client', return_value=client):
+            results = simple_email.send_emails([("a@example.com", ["hi"]), ("b@example.com", ["hey"])])
+
+        assert results == [True, True]
+        assert len(stub.requests) == 1
+        assert "Research References" in stub.requests[0]["body"][0]["html"]
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("garbage") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
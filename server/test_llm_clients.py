@@ -0,0 +1,66 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+import simple_email  # noqa: F401  (puts the repo root on sys.path)
+import llm_clients
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "fake_api_key")
+    llm_clients.reset_clients()
+    yield
+    llm_clients.reset_clients()
+
+
+class TestGenaiModels:
+    """Test the shared google.generativeai client cache"""
+
+    @patch('google.generativeai.GenerativeModel')
+    @patch('google.generativeai.configure')
+    def test_model_reused_and_configured_once(self, mock_configure, mock_model_class):
+        mock_model_class.side_effect = lambda *a, **kw: MagicMock()
+
+        first = llm_clients.get_genai_model("gemini-1.5-flash")
+        second = llm_clients.get_genai_model("gemini-1.5-flash")
+        other = llm_clients.get_genai_model("gemini-2.5-pro")
+
+        assert first is second
+        assert first is not other
+        mock_configure.assert_called_once_with(api_key="fake_api_key")
+        assert mock_model_class.call_count == 2
+
+    @patch('google.generativeai.GenerativeModel')
+    @patch('google.generativeai.configure')
+    def test_settings_are_part_of_the_key(self, mock_configure, mock_model_class):
+        mock_model_class.side_effect = lambda *a, **kw: MagicMock()
+
+        a = llm_clients.get_genai_model("gemini-1.5-flash", generation_config={"temperature": 0})
+        b = llm_clients.get_genai_model("gemini-1.5-flash", generation_config={"temperature": 0})
+        c = llm_clients.get_genai_model("gemini-1.5-flash", generation_config={"temperature": 1})
+
+        assert a is b
+        assert a is not c
+
+    @patch('google.generativeai.GenerativeModel')
+    @patch('google.generativeai.configure')
+    def test_custom_endpoint_uses_rest(self, mock_configure, mock_model_class, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_ENDPOINT", "http://localhost:8089")
+
+        llm_clients.get_genai_model("gemini-1.5-flash")
+
+        mock_configure.assert_called_once_with(api_key="fake_api_key", transport="rest",
+                                               client_options={"api_endpoint": "http://localhost:8089"})
+
+    def test_missing_api_key(self, monkeypatch):
+        monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+        monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+
+        with pytest.raises(ValueError):
+            llm_clients.get_genai_model("gemini-1.5-flash")
+
+    def test_google_api_key_fallback(self, monkeypatch):
+        monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+        monkeypatch.setenv("GOOGLE_API_KEY", "google_key")
+
+        assert llm_clients.get_api_key() == "google_key"
@@ -0,0 +1,112 @@
+import json
+import threading
+
+import pytest
+import requests
+from flask import Flask, Response, jsonify
+from werkzeug.serving import make_server
+
+import llm_stub
+from load_test import run_turn, summarize
+
+
+@pytest.fixture
+def serve():
+    """Run a Flask app on a free local port; returns its base URL"""
+    servers = []
+
+    def start(app):
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+class TestLlmStub:
+    """Test the local Gemini/Resend stand-in"""
+
+    def test_gemini_sdk_talks_to_the_stub(self, serve, monkeypatch):
+        import simple_email  # noqa: F401  (puts the repo root on sys.path)
+        import llm_clients
+
+        url = serve(llm_stub.create_app({"latency": 0, "jitter": 0, "chunk_delay": 0}))
+        monkeypatch.setenv("GEMINI_API_ENDPOINT", url)
+        monkeypatch.setenv("GEMINI_API_KEY", "stub")
+        llm_clients.reset_clients()
+        try:
+            model = llm_clients.get_genai_model("gemini-1.5-flash")
+            reply = json.loads(model.generate_content('Answer as JSON with "mood" and "response"').text)
+            streamed = "".join(chunk.text for chunk in model.generate_content("Write the report", stream=True))
+        finally:
+            llm_clients.reset_clients()
+
+        assert {"mood", "intensity", "response", "stage"} <= set(reply)
+        assert streamed == llm_stub.ANALYSIS_REPLY
+        assert requests.get(f"{url}/_stub/stats").json()["stream"] == 1
+
+    def test_error_injection_and_runtime_config(self, serve):
+        url = serve(llm_stub.create_app({"latency": 0, "jitter": 0}))
+        assert requests.post(f"{url}/_stub/config", json={"error_rate": 1.0, "error_status": 429}).ok
+        assert requests.post(f"{url}/_stub/config", json={"bogus": 1}).status_code == 400
+
+        response = requests.post(f"{url}/v1beta/models/gemini-1.5-flash:generateContent", json={})
+        assert response.status_code == 429
+        assert response.json()["error"]["status"] == "RESOURCE_EXHAUSTED"
+        assert requests.get(f"{url}/_stub/stats").json()["errors"] == 1
+
+    def test_resend_endpoints(self, serve):
+        url = serve(llm_stub.create_app({"email_latency": 0, "jitter": 0}))
+        assert "id" in requests.post(f"{url}/emails", json={"to": ["a@example.com"]}).json()
+        assert len(requests.post(f"{url}/emails/batch", json=[{}, {}]).json()["data"]) == 2
+
+
+@pytest.fixture
+def voice_app():
+    app = Flask(__name__)
+
+    @app.route("/voice-chat", methods=["POST"])
+    def voice_chat():
+        return jsonify({"transcript": "hi", "ai_response": "hey"})
+
+    @app.route("/voice-chat-stream", methods=["POST"])
+    def voice_chat_stream():
+        events = [{"type": "transcript", "content": "hi"}, {"type": "text", "content": "hey"},
+                  {"type": "complete"}]
+        return Response((f"data: {json.dumps(e)}\n\n" for e in events), mimetype="text/event-stream",
+                        headers={"X-Trace-Id": "abc"})
+
+    @app.route("/busy", methods=["POST"])
+    def busy():
+        return jsonify({"error": "Server busy"}), 503
+
+    return app
+
+
+class TestLoadTest:
+    """Test the load generator's turn measurement and summary"""
+
+    def test_turns_are_timed(self, serve, voice_app):
+        url = serve(voice_app)
+        with requests.Session() as session:
+            stream = run_turn(session, url, "voice-chat-stream", b"RIFF", timeout=5)
+            plain = run_turn(session, url, "voice-chat", b"RIFF", timeout=5)
+            shed = run_turn(session, url, "busy", b"RIFF", timeout=5)
+
+        assert stream["outcome"] == "ok" and stream["trace_id"] == "abc"
+        assert stream["ttfe"] <= stream["reply"] <= stream["full"]
+        assert plain["outcome"] == "ok" and plain["ttfe"] == plain["reply"]
+        assert shed["outcome"] == "shed"
+
+    def test_summary_percentiles(self):
+        records = [{"endpoint": "voice-chat", "outcome": "ok", "ttfe": t, "reply": t, "full": t}
+                   for t in (0.1, 0.2, 0.3, 0.4)]
+        records.append({"endpoint": "voice-chat", "outcome": "shed", "ttfe": None, "reply": None, "full": 0.01})
+
+        summary = summarize(records, elapsed=2.0)["voice-chat"]
+        assert (summary["turns"], summary["ok"], summary["shed"]) == (5, 4, 1)
+        assert summary["ok_turns_per_s"] == 2.0
+        assert summary["full"] == {"p50": 0.2, "p90": 0.4, "p99": 0.4}
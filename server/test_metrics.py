@@ -0,0 +1,54 @@
+import pytest
+
+from metrics import Counter, Gauge, Histogram, render, time_stage, STAGE_ERRORS, STAGE_SECONDS
+
+
+class TestMetrics:
+    """Test the Prometheus metric types and text rendering"""
+
+    def test_counter(self):
+        counter = Counter("test_events_total", "Events", ["kind"])
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+
+        assert counter.value(kind="a") == 3
+        assert 'test_events_total{kind="a"} 3' in render()
+        with pytest.raises(ValueError):
+            counter.inc(other="x")
+
+    def test_gauge_tracks_in_progress(self):
+        gauge = Gauge("test_in_progress", "In progress")
+        with gauge.track():
+            assert gauge.value() == 1
+        assert gauge.value() == 0
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("test_latency_seconds", "Latency", ["stage"], buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, stage="llm")
+
+        output = render()
+        assert '# TYPE test_latency_seconds histogram' in output
+        assert 'test_latency_seconds_bucket{stage="llm",le="0.1"} 1' in output
+        assert 'test_latency_seconds_bucket{stage="llm",le="1.0"} 2' in output
+        assert 'test_latency_seconds_bucket{stage="llm",le="+Inf"} 3' in output
+        assert 'test_latency_seconds_count{stage="llm"} 3' in output
+
+    def test_label_values_are_escaped(self):
+        counter = Counter("test_escaped_total", "Escaped", ["path"])
+        counter.inc(path='a"b\n')
+        assert 'test_escaped_total{path="a\\"b\\n"} 1' in render()
+
+
+def test_time_stage_records_latency_timings_and_errors():
+    timings = {}
+    before = STAGE_SECONDS.snapshot(stage="test_stage")["count"]
+    with time_stage("test_stage", timings):
+        pass
+    with pytest.raises(RuntimeError):
+        with time_stage("test_stage", timings):
+            raise RuntimeError("boom")
+
+    assert STAGE_SECONDS.snapshot(stage="test_stage")["count"] == before + 2
+    assert STAGE_ERRORS.value(stage="test_stage") == 1
+    assert timings["test_stage"] >= 0
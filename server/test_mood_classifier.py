@@ -0,0 +1,87 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+import chatbot_tools
+from mood_classifier import MoodClassifier, load_labels, log_label
+
+
+@pytest.fixture(scope="module")
+def lexicon_model():
+    return MoodClassifier.from_lexicon()
+
+
+class TestMoodClassifier:
+    """Test the local mood classifier"""
+
+    @pytest.mark.parametrize("text, mood", [
+        ("I'm so tired and overwhelmed", "sad"),
+        ("This is ridiculous, I'm furious", "angry"),
+        ("Thanks, that was awesome!", "happy"),
+        ("I'm not happy about it", "sad"),
+    ])
+    def test_lexicon_predictions(self, lexicon_model, text, mood):
+        result = lexicon_model.predict(text)
+        assert result["mood"] == mood
+        assert result["confidence"] >= chatbot_tools.MOOD_CONFIDENCE_THRESHOLD
+        assert 1 <= result["intensity"] <= 100
+
+    @pytest.mark.parametrize("text", ["I am here", "I dont care", "sorry", "whatever", "I feel sick", "ok"])
+    def test_everyday_words_are_not_confident(self, lexicon_model, text):
+        assert lexicon_model.predict(text)["confidence"] < chatbot_tools.MOOD_CONFIDENCE_THRESHOLD
+
+    def test_fit_learns_new_words(self):
+        model = MoodClassifier.from_lexicon()
+        examples = [{"text": "the exam went sideways again", "mood": "sad", "intensity": 80},
+                    {"text": "we won the match", "mood": "happy", "intensity": 70},
+                    {"text": "bogus label", "mood": "confused"}] * 5
+
+        accuracy = model.fit(examples, epochs=20)
+
+        assert accuracy == 1.0
+        assert model.predict("sideways again")["mood"] == "sad"
+        assert model.predict("we won")["mood"] == "happy"
+        assert model.fit([]) == 0.0
+
+    def test_save_and_load_round_trip(self, tmp_path, lexicon_model):
+        path = str(tmp_path / "mood_model.npz")
+        lexicon_model.save(path)
+        loaded = MoodClassifier.load(path)
+
+        assert loaded.n_features == lexicon_model.n_features
+        for text in ("I'm exhausted", "I am here", "that's awesome!"):
+            assert loaded.predict(text) == lexicon_model.predict(text)
+
+    def test_labels_are_logged_and_read_back(self, tmp_path):
+        path = str(tmp_path / "labels.jsonl")
+        log_label("I'm lost", "sad", 55, path=path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("not json\n")
+        assert load_labels(path) == [{"text": "I'm lost", "mood": "sad", "intensity": 55}]
+
+
+class TestGetMoodWithIntensity:
+    """Test the choice between the local classifier and Gemini"""
+
+    @pytest.fixture
+    def llm(self, monkeypatch, tmp_path, lexicon_model):
+        monkeypatch.setenv("MOOD_LABEL_LOG", str(tmp_path / "labels.jsonl"))
+        monkeypatch.setattr(chatbot_tools, "get_mood_classifier", lambda: lexicon_model)
+        model = MagicMock()
+        model.invoke.return_value = MagicMock(content='{"mood": "happy", "intensity": 30}')
+        monkeypatch.setattr(chatbot_tools, "get_chat_model", lambda *args, **kwargs: model)
+        return model
+
+    def test_confident_local_prediction_skips_the_llm(self, llm):
+        result = chatbot_tools.get_mood_with_intensity.invoke({"user_message": "I'm so exhausted"})
+        assert result["mood"] == "sad"
+        llm.invoke.assert_not_called()
+
+    def test_low_confidence_asks_the_llm_and_logs_the_label(self, llm, tmp_path):
+        result = chatbot_tools.get_mood_with_intensity.invoke({"user_message": "I am here"})
+
+        assert result == {"mood": "happy", "intensity": 30}
+        llm.invoke.assert_called_once()
+        with open(tmp_path / "labels.jsonl", encoding="utf-8") as f:
+            assert json.loads(f.readline()) == {"text": "I am here", "mood": "happy", "intensity": 30}
@@ -0,0 +1,83 @@
+import pstats
+import time
+
+import pytest
+
+from profiling import Profiler
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+class TestProfiler:
+    """Test on-demand request profiling"""
+
+    def test_nothing_is_profiled_unless_armed(self):
+        profiler = Profiler()
+        assert profiler.maybe_start("GET /health") is None
+
+    def test_arm_profiles_the_next_n_requests(self):
+        profiler = Profiler()
+        profiler.arm(2, "cprofile")
+        started = [profiler.maybe_start(f"POST /voice-chat {i}") for i in range(3)]
+
+        assert started[2] is None
+        for active in started[:2]:
+            active.stop()
+        assert [p["name"] for p in profiler.list()] == ["POST /voice-chat 1", "POST /voice-chat 0"]
+        assert profiler.status()["armed"] == 0
+
+    def test_cprofile_download_loads_as_pstats(self, tmp_path):
+        profiler = Profiler()
+        active = profiler.maybe_start("POST /voice-chat", requested_mode="cprofile", trace_id="abc")
+        busy(0.01)
+        active.stop()
+        profile = profiler.get(active.profile.id)
+
+        data, content_type = profile.render("pstats")
+        path = tmp_path / "profile.prof"
+        path.write_bytes(data)
+        functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+        assert "busy" in functions
+        assert content_type == "application/octet-stream"
+        assert b"busy" in profile.render("text")[0]
+        assert profile.summary()["trace_id"] == "abc"
+
+    def test_sampler_collects_collapsed_stacks(self):
+        profiler = Profiler(interval=0.001)
+        active = profiler.maybe_start("POST /voice-chat-stream", requested_mode="sample")
+        busy(0.1)
+        active.stop()
+        profile = profiler.get(active.profile.id)
+
+        collapsed, _ = profile.render()
+        lines = collapsed.decode().splitlines()
+        assert profile.summary()["samples"] > 0
+        assert any("test_sampler_collects_collapsed_stacks" in line and ";busy (" in line for line in lines)
+        # "frame;frame;frame count" per line
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    def test_unknown_modes_and_formats_are_rejected(self):
+        profiler = Profiler()
+        with pytest.raises(ValueError):
+            profiler.arm(1, "perf")
+        with pytest.raises(ValueError):
+            profiler.maybe_start("GET /", requested_mode="perf")
+
+        active = profiler.maybe_start("GET /", requested_mode="sample")
+        active.stop()
+        active.stop()
+        assert len(profiler.list()) == 1
+        with pytest.raises(ValueError):
+            profiler.get(active.profile.id).render("pstats")
+
+    def test_only_recent_profiles_are_kept(self):
+        profiler = Profiler(keep=2)
+        for _ in range(3):
+            profiler.maybe_start("GET /", requested_mode="sample").stop()
+        assert len(profiler.list()) == 2
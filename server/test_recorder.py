@@ -0,0 +1,91 @@
+import json
+import wave
+
+import numpy as np
+import pytest
+
+import simple_email  # noqa: F401  (puts the repo root on sys.path)
+import llm_clients
+import recorder
+from audio_upload import AudioUpload
+from replay import summarize
+
+
+class FakeModel:
+    def generate_content(self, prompt, stream=False):
+        reply = f"reply to {prompt}"
+        if stream:
+            return iter([type("Chunk", (), {"text": part})() for part in (reply[:5], reply[5:])])
+        return type("Response", (), {"text": reply})()
+
+
+@pytest.fixture(autouse=True)
+def no_hook():
+    yield
+    llm_clients.set_model_hook(None)
+
+
+def record(path, prompts):
+    archive = recorder.SessionArchive(str(path), recording=True)
+    llm_clients.set_model_hook(lambda model_name, create: recorder.RecordingModel(archive, model_name, FakeModel()))
+    model = llm_clients.get_genai_model("gemini-1.5-flash")
+    for prompt in prompts:
+        model.generate_content(prompt)
+    return archive
+
+
+class TestRecordAndReplay:
+    """Test recording Gemini calls and answering them from the archive"""
+
+    def test_replay_matches_prompts_exactly(self, tmp_path):
+        archive = record(tmp_path, ["first", "second"])
+        model = llm_clients.get_genai_model("gemini-1.5-flash")
+        streamed = "".join(chunk.text for chunk in model.generate_content("third", stream=True))
+        assert streamed == "reply to third"
+
+        replay = recorder.SessionArchive(archive.path)
+        llm_clients.set_model_hook(lambda model_name, create: recorder.ReplayModel(replay, model_name))
+        model = llm_clients.get_genai_model("gemini-1.5-flash")
+
+        # Out of recorded order, still matched by prompt
+        assert model.generate_content("second").text == "reply to second"
+        assert model.generate_content("first").text == "reply to first"
+        assert [c.text for c in model.generate_content("third", stream=True)] == ["reply", " to third"]
+        assert replay.misses == 0
+
+    def test_changed_prompt_falls_back_to_recorded_order(self, tmp_path):
+        archive = record(tmp_path, ["first", "second"])
+        replay = recorder.SessionArchive(archive.path)
+
+        assert replay.answer("gemini-1.5-flash", "second")["response"] == "reply to second"
+        assert replay.answer("gemini-1.5-flash", "first, reworded")["response"] == "reply to first"
+        assert replay.misses == 1
+        with pytest.raises(LookupError):
+            replay.answer("gemini-1.5-flash", "first")
+
+        replay.rewind()
+        assert replay.answer("gemini-1.5-flash", "first")["response"] == "reply to first"
+        assert replay.misses == 0
+
+    def test_record_turn_writes_audio_and_outcome(self, tmp_path):
+        archive = recorder.SessionArchive(str(tmp_path), recording=True)
+        upload = AudioUpload("turn.wav", "wav", frames=np.zeros((1600, 1), dtype=np.float32), sample_rate=16000)
+        archive.record_turn("voice-chat", upload, "hello",
+                            {"response": "hey", "mood": "neutral", "stage": 1}, {"whisper": 0.51234})
+
+        with wave.open(str(tmp_path / "audio" / "0001.wav")) as wav:
+            assert (wav.getframerate(), wav.getnframes()) == (16000, 1600)
+        turn = json.loads((tmp_path / "turns.jsonl").read_text())
+        assert turn["audio"] == "audio/0001.wav"
+        assert (turn["transcript"], turn["response"], turn["timings"]) == ("hello", "hey", {"whisper": 0.5123})
+        assert archive.turns() == [turn]
+
+    def test_replay_summary_takes_medians(self):
+        def result(seconds, match=True):
+            return {"turn": 1, "endpoint": "voice-chat", "seconds": seconds, "ttfe": seconds,
+                    "stages": {"whisper": seconds / 2}, "transcript_match": True, "reply_match": match}
+
+        summary = summarize([[result(1.0)], [result(3.0, match=False)], [result(2.0)]], misses=0)
+        assert summary["turns"][0]["seconds"] == 2.0
+        assert summary["stage_totals"] == {"whisper": 1.0}
+        assert summary["mismatched_turns"] == [1]
@@ -0,0 +1,219 @@
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+import pytest
+from unittest.mock import MagicMock
+
+from admission import Overloaded
+from report_jobs import ReportQueue
+
+
+def wait_for_status(queue, job_id, statuses, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job and job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} never reached {statuses}: {queue.get(job_id)}")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "outbox.db")
+
+
+class TestReportQueue:
+    """Test the durable report job queue"""
+
+    def test_job_is_sent(self, db_path):
+        handler = MagicMock(return_value=True)
+        queue = ReportQueue(db_path, handler, workers=1, poll_interval=0.05)
+        try:
+            job_id = queue.enqueue("test@example.com", ["Hello", "Hi"])
+            job = wait_for_status(queue, job_id, {"sent"})
+        finally:
+            queue.stop()
+
+        handler.assert_called_once_with("test@example.com", ["Hello", "Hi"])
+        assert job["attempts"] == 1
+        assert job["last_error"] is None
+
+    def test_failed_attempts_are_retried(self, db_path):
+        handler = MagicMock(side_effect=[Exception("Network error"), False, True])
+        queue = ReportQueue(db_path, handler, workers=1, base_delay=0.01, poll_interval=0.02)
+        try:
+            job_id = queue.enqueue("test@example.com", ["test"])
+            job = wait_for_status(queue, job_id, {"sent"})
+        finally:
+            queue.stop()
+
+        assert handler.call_count == 3
+        assert job["attempts"] == 3
+
+    def test_job_fails_after_max_attempts(self, db_path):
+        handler = MagicMock(side_effect=Exception("Invalid API key"))
+        queue = ReportQueue(db_path, handler, workers=1, max_attempts=2,
+                            base_delay=0.01, poll_interval=0.02)
+        try:
+            job_id = queue.enqueue("test@example.com", ["test"])
+            job = wait_for_status(queue, job_id, {"failed"})
+        finally:
+            queue.stop()
+
+        assert handler.call_count == 2
+        assert job["last_error"] == "Invalid API key"
+
+    def test_overloaded_jobs_are_deferred_without_using_attempts(self, db_path):
+        handler = MagicMock(side_effect=[Overloaded("reports", 0)] * 3 + [True])
+        queue = ReportQueue(db_path, handler, workers=1, max_attempts=2,
+                            base_delay=0.01, poll_interval=0.02)
+        try:
+            job_id = queue.enqueue("test@example.com", ["test"])
+            job = wait_for_status(queue, job_id, {"sent", "failed"})
+        finally:
+            queue.stop()
+
+        assert job["status"] == "sent"
+        assert handler.call_count == 4
+        assert job["attempts"] == 1
+
+    def test_stale_running_jobs_are_recovered_while_running(self, db_path):
+        first = ReportQueue(db_path, MagicMock(), workers=0)
+        job_id = first.enqueue("test@example.com", ["test"])
+        # Claimed by a worker that then died
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+        handler = MagicMock(return_value=True)
+        second = ReportQueue(db_path, handler, workers=1, poll_interval=0.02, stale_after=0.2)
+        second.start()
+        try:
+            assert second.get(job_id)["status"] == "running"  # not stale yet at start
+            wait_for_status(second, job_id, {"sent"})
+        finally:
+            second.stop()
+        handler.assert_called_once()
+
+    def test_jobs_of_an_exited_process_are_recovered_on_start(self, db_path):
+        first = ReportQueue(db_path, MagicMock(), workers=0)
+        orphaned = first.enqueue("test@example.com", ["orphaned"])
+        live = first.enqueue("test@example.com", ["live"])
+        exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        with sqlite3.connect(db_path) as conn:
+            for job_id, pid in ((orphaned, exited), (live, "1")):
+                conn.execute("UPDATE jobs SET status = 'running', updated_at = ?, owner = ? WHERE id = ?",
+                             (time.time(), f"{socket.gethostname()}:{pid}", job_id))
+
+        handler = MagicMock(return_value=True)
+        second = ReportQueue(db_path, handler, workers=1, poll_interval=0.02)
+        second.start()
+        try:
+            # Well before stale_after (15 minutes)
+            wait_for_status(second, orphaned, {"sent"})
+            assert second.get(live)["status"] == "running"
+        finally:
+            second.stop()
+        handler.assert_called_once_with("test@example.com", ["orphaned"])
+
+    def test_outbox_without_owner_column_is_migrated(self, db_path):
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, to_email TEXT NOT NULL, "
+                         "payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                         "next_attempt_at REAL NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                         "last_error TEXT)")
+
+        handler = MagicMock(return_value=True)
+        queue = ReportQueue(db_path, handler, workers=1, poll_interval=0.02)
+        queue.start()
+        try:
+            wait_for_status(queue, queue.enqueue("test@example.com", ["test"]), {"sent"})
+        finally:
+            queue.stop()
+
+    def test_jobs_survive_restart(self, db_path):
+        # Enqueue without workers, as if the process died before sending
+        first = ReportQueue(db_path, MagicMock(), workers=0)
+        job_id = first.enqueue("test@example.com", ["test"])
+        first.stop()
+        assert first.get(job_id)["status"] == "queued"
+
+        handler = MagicMock(return_value=True)
+        second = ReportQueue(db_path, handler, workers=1, poll_interval=0.05)
+        second.start()
+        try:
+            wait_for_status(second, job_id, {"sent"})
+        finally:
+            second.stop()
+        handler.assert_called_once()
+
+    def test_unknown_job(self, db_path):
+        queue = ReportQueue(db_path, MagicMock(), workers=0)
+        assert queue.get("does-not-exist") is None
+
+    def test_due_jobs_are_batched(self, db_path):
+        handler = MagicMock(return_value=True)
+        batch_handler = MagicMock(side_effect=lambda reports: [True] * len(reports))
+        # Enqueue while no workers run, so the jobs are due together
+        queue = ReportQueue(db_path, handler, workers=0, batch_handler=batch_handler, batch_size=10)
+        job_ids = [queue.enqueue(f"user{i}@example.com", ["test"]) for i in range(3)]
+
+        queue.workers = 1
+        queue.poll_interval = 0.05
+        queue.start()
+        try:
+            for job_id in job_ids:
+                wait_for_status(queue, job_id, {"sent"})
+        finally:
+            queue.stop()
+
+        handler.assert_not_called()
+        batch_handler.assert_called_once()
+        assert [to for to, *_ in batch_handler.call_args[0][0]] == [
+            "user0@example.com", "user1@example.com", "user2@example.com"]
+
+    def test_reports_are_digested_per_recipient(self, db_path):
+        handler = MagicMock(return_value=True)
+        digest_handler = MagicMock(return_value=True)
+        queue = ReportQueue(db_path, handler, workers=1, poll_interval=0.05,
+                            digest_handler=digest_handler, digest_window=0.3)
+        try:
+            first = queue.enqueue("a@example.com", ["first"])
+            second = queue.enqueue("a@example.com", ["second"], analysis="Done")
+            other = queue.enqueue("b@example.com", ["other"])
+            # Nothing is sent before the window closes
+            time.sleep(0.1)
+            assert queue.get(first)["status"] == "queued"
+            for job_id in (first, second, other):
+                wait_for_status(queue, job_id, {"sent"})
+        finally:
+            queue.stop()
+
+        digest_handler.assert_called_once_with(
+            "a@example.com", [(["first"], {}), (["second"], {"analysis": "Done"})])
+        handler.assert_called_once_with("b@example.com", ["other"])
+
+    def test_digest_leaves_jobs_in_retry_backoff(self, db_path):
+        digest_handler = MagicMock(return_value=True)
+        queue = ReportQueue(db_path, MagicMock(return_value=True), workers=0,
+                            digest_handler=digest_handler, digest_window=0.05)
+        retrying = queue.enqueue("a@example.com", ["failed once"])
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("UPDATE jobs SET attempts = 1, next_attempt_at = ? WHERE id = ?",
+                         (time.time() + 60, retrying))
+        fresh = queue.enqueue("a@example.com", ["fresh"])
+
+        queue.workers = 1
+        queue.poll_interval = 0.02
+        queue.start()
+        try:
+            wait_for_status(queue, fresh, {"sent"})
+        finally:
+            queue.stop()
+
+        job = queue.get(retrying)
+        assert (job["status"], job["attempts"]) == ("queued", 1)
+        digest_handler.assert_not_called()
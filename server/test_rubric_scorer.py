@@ -0,0 +1,64 @@
+import pytest
+
+from rubric_scorer import score_transcript, score_turn, stars, user_messages
+
+
+class TestScoreTranscript:
+    """Test the deterministic rubric scorer"""
+
+    def test_supportive_conversation_scores_high(self):
+        chats = [
+            "Hey, how have you been lately?", "Honestly, not great.",
+            "That sounds really hard. I'm here for you, and you matter to me.", "Thanks.",
+            "Take your time, I'm proud of you for sharing.", "That means a lot.",
+        ]
+        scores = score_transcript(chats)
+
+        assert scores["turns"] == 3
+        assert scores["empathy"] >= 2.5
+        assert scores["supportive"] >= 2.5
+        assert scores["avoidance"] == 5.0
+
+    def test_harmful_remarks_lower_avoidance(self):
+        chats = ["Just cheer up, it's not that big deal. You should get over it.", "..."]
+        scores = score_transcript(chats)
+
+        assert scores["avoidance"] <= 2.0
+        assert scores["evidence"]["avoidance"].startswith("Just cheer up")
+
+    def test_weighted_overall(self):
+        scores = score_transcript(["I hear you.", "ok", "You should relax.", "ok"])
+        expected = scores["empathy"] * 0.4 + scores["supportive"] * 0.3 + scores["avoidance"] * 0.3
+        assert scores["overall"] == pytest.approx(expected, abs=0.01)
+
+    def test_deterministic(self):
+        chats = ["That must be exhausting, I'm sorry.", "Yeah", "Have you tried sleeping earlier?", "No"]
+        assert score_transcript(chats) == score_transcript(list(chats))
+
+    def test_only_user_messages_are_scored(self):
+        chats = [
+            {"role": "assistant", "content": "Just cheer up, whatever."},
+            {"role": "user", "content": "I'm here for you."},
+        ]
+        assert user_messages(chats) == ["I'm here for you."]
+        assert score_transcript(chats)["avoidance"] == 5.0
+
+    def test_empty_transcript(self):
+        scores = score_transcript([])
+        assert scores["turns"] == 0
+        assert scores["evidence"] == {}
+
+
+def test_score_turn_matches_transcript_scores():
+    message = "That sounds rough, I'm here for you."
+    turn = score_turn(message)
+    transcript = score_transcript([message, "thanks"])
+    for category in ("empathy", "supportive", "avoidance"):
+        assert turn[category] == transcript[category]
+
+
+def test_stars():
+    assert stars(1.0) == "★☆☆☆☆"
+    assert stars(3.5) == "★★★★☆"
+    assert stars(4.49) == "★★★★☆"
+    assert stars(5.0) == "★★★★★"
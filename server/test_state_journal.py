@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+
+import pytest
+
+from state_journal import StateJournal
+
+
+def state(n):
+    return {"current_emotion": "neutral", "last_user_message": f"message {n}", "last_ai_response": "ok"}
+
+
+def read_journal(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "state.jsonl"), str(tmp_path / "state.json")
+
+
+def open_journal(paths, **kwargs):
+    return StateJournal(*paths, flush_interval=0.01, **kwargs)
+
+
+class TestStateJournal:
+    """Test the background state journal"""
+
+    def test_append_is_written_in_the_background(self, paths):
+        journal = open_journal(paths)
+        for n in range(3):
+            journal.append(state(n))
+        assert journal.flush(timeout=5)
+
+        assert read_journal(paths[0]) == [state(0), state(1), state(2)]
+        assert journal.latest() == state(2)
+        journal.close()
+        with pytest.raises(RuntimeError):
+            journal.append(state(3))
+
+    def test_compaction_writes_snapshot_and_trims_history(self, paths):
+        journal = open_journal(paths, compact_every=4, keep_history=3)
+        for n in range(4):
+            journal.append(state(n))
+        journal.flush(timeout=5)
+
+        with open(paths[1], encoding="utf-8") as f:
+            assert json.load(f) == dict(state(3), turns=4)
+        assert read_journal(paths[0]) == [state(1), state(2), state(3)]
+        journal.close()
+
+    def test_compaction_keeps_lines_appended_by_another_process(self, paths):
+        journal = open_journal(paths, compact_every=1000, compact_interval=1000, keep_history=2)
+        journal.append(state(0))
+        journal.flush(timeout=5)
+        # Another worker appends to the shared journal
+        with open(paths[0], "a", encoding="utf-8") as f:
+            f.write(json.dumps(state(1)) + "\n")
+        journal.append(state(2))
+        journal.close()
+
+        assert read_journal(paths[0]) == [state(1), state(2)]
+
+    def test_recovery_after_crash_uses_journal_past_the_snapshot(self, paths):
+        journal = open_journal(paths)
+        journal.append(state(0))
+        journal.close()  # compacts: snapshot is state 0 after 1 turn
+        with open(paths[0], "a", encoding="utf-8") as f:
+            # Written after the last compaction, then the process died mid-write
+            f.write(json.dumps(state(1)) + "\n" + json.dumps(state(2)) + "\n" + '{"torn')
+
+        recovered = open_journal(paths)
+        assert recovered.latest() == state(2)
+        assert recovered._turns == 3
+        recovered.close()
+
+    def test_flush_after_close_returns(self, paths):
+        journal = open_journal(paths)
+        journal.append(state(0))
+        journal.close()
+        assert journal.flush(timeout=5)
+        assert os.path.exists(paths[1])
+
+    def test_concurrent_compactions_do_not_share_a_temp_file(self, paths):
+        journals = [open_journal(paths, compact_every=1000, compact_interval=1000) for _ in range(2)]
+        for n, journal in enumerate(journals):
+            journal.append(state(n))
+            journal.flush(timeout=5)
+        errors = []
+
+        def compact(journal):
+            for _ in range(50):
+                try:
+                    journal._compact()
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=compact, args=(journal,)) for journal in journals]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        with open(paths[1], encoding="utf-8") as f:
+            assert json.load(f)["turns"] == 1
+        assert sorted(os.listdir(os.path.dirname(paths[0]))) == ["state.json", "state.jsonl", "state.jsonl.lock"]
+        for journal in journals:
+            journal.close()
@@ -0,0 +1,122 @@
+import json
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+import tracing
+from metrics import time_stage
+from report_jobs import ReportQueue
+from test_report_jobs import wait_for_status
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setenv("TRACE_EXPORT", "jsonl")
+    monkeypatch.setenv("TRACE_FILE", str(path))
+    return path
+
+
+def exported(path):
+    tracing.flush()
+    return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+
+class TestTracing:
+    """Test spans, traceparent propagation and JSONL export"""
+
+    def test_nested_spans_share_the_trace(self):
+        with tracing.span("request") as parent:
+            with tracing.span("llm") as child:
+                assert tracing.current_span() is child
+            assert tracing.current_span() is parent
+
+        assert child.trace_id == parent.trace_id
+        assert child.parent_id == parent.span_id
+        assert tracing.current_span() is None
+
+    def test_root_span_starts_a_new_trace(self):
+        with tracing.span("session") as session:
+            with tracing.span("turn", root=True) as turn:
+                pass
+        assert turn.trace_id != session.trace_id
+        assert turn.parent_id is None
+
+    def test_incoming_traceparent_is_continued(self):
+        header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+        with tracing.span("request", parent=header, root=True) as request_span:
+            pass
+        assert request_span.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert request_span.parent_id == "00f067aa0ba902b7"
+        assert request_span.traceparent.startswith("00-4bf92f3577b34da6a3ce929d0e0e4736-")
+
+    @pytest.mark.parametrize("header", [None, "", "garbage", "00-" + "0" * 32 + "-00f067aa0ba902b7-01"])
+    def test_invalid_traceparent_is_ignored(self, header):
+        assert tracing.parse_traceparent(header) is None
+
+    def test_spans_are_exported_as_otlp_json(self, trace_file):
+        with pytest.raises(RuntimeError):
+            with tracing.span("whisper", model="base"):
+                raise RuntimeError("CUDA out of memory")
+
+        [span] = exported(trace_file)
+        assert span["name"] == "whisper"
+        assert len(span["traceId"]) == 32 and len(span["spanId"]) == 16
+        assert int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"])
+        assert {"key": "model", "value": {"stringValue": "base"}} in span["attributes"]
+        assert span["status"] == {"code": 2, "message": "CUDA out of memory"}
+
+    def test_time_stage_records_a_span(self, trace_file):
+        with tracing.span("request") as request_span:
+            with time_stage("decode"):
+                pass
+
+        spans = {span["name"]: span for span in exported(trace_file)}
+        assert spans["decode"]["parentSpanId"] == request_span.span_id
+        assert spans["decode"]["status"] == {"code": 1}
+
+    def test_span_kinds_are_exported(self, trace_file, monkeypatch):
+        import simple_email
+        delivery = MagicMock()
+        delivery.send.return_value = (True, None)
+        monkeypatch.setattr(simple_email, "get_delivery_client", lambda: delivery)
+
+        with tracing.span("GET /get-score-and-email", root=True, kind=tracing.SERVER):
+            with time_stage("llm", kind=tracing.CLIENT):
+                pass
+            with time_stage("parse"):
+                pass
+            simple_email.send_email("user@test.com", ["Hi"], analysis="Overall: ★★★★☆")
+
+        kinds = {span["name"]: span["kind"] for span in exported(trace_file)}
+        assert kinds == {"GET /get-score-and-email": 2, "llm": 3, "parse": 1, "email_send": 3}
+
+    def test_report_job_joins_the_enqueuing_trace(self, tmp_path):
+        seen = []
+
+        def handler(to_email, chats):
+            seen.append(tracing.current_span())
+            return True
+
+        queue = ReportQueue(str(tmp_path / "outbox.db"), handler, workers=1, poll_interval=0.05)
+        try:
+            with tracing.span("GET /get-score-and-email") as request_span:
+                job_id = queue.enqueue("test@example.com", ["Hello"])
+            wait_for_status(queue, job_id, {"sent"})
+        finally:
+            queue.stop()
+
+        [job_span] = seen
+        assert job_span.name == "email_job"
+        assert job_span.trace_id == request_span.trace_id
+        assert job_span.parent_id == request_span.span_id
+
+    def test_export_does_not_block_when_full(self):
+        exporter = tracing.SpanExporter(sink=tracing.JsonlSink("/nonexistent/traces.jsonl"), max_queue=1)
+        exporter._thread = object()  # no background writer
+        start = time.perf_counter()
+        for _ in range(100):
+            exporter.export(tracing.Span("x", "0" * 32))
+        assert time.perf_counter() - start < 0.5
+        assert exporter._dropped == 99
@@ -0,0 +1,140 @@
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+
+from turn_scoring import TurnScorer, aggregate_scores, align_turn_scores, llm_score_turn
+
+
+def fake_scores(empathy, supportive, avoidance):
+    return {"empathy": empathy, "supportive": supportive, "avoidance": avoidance, "quote": "", "note": ""}
+
+
+class TestAggregateScores:
+    """Test combining per-turn scores"""
+
+    def test_weighted_overall(self):
+        summary = aggregate_scores([fake_scores(4, 2, 5), fake_scores(2, 4, 5)])
+
+        assert summary["empathy"] == 3.0
+        assert summary["supportive"] == 3.0
+        assert summary["avoidance"] == 5.0
+        assert summary["overall"] == pytest.approx(3 * 0.4 + 3 * 0.3 + 5 * 0.3)
+        assert summary["turns"] == 2
+
+    def test_no_scores(self):
+        assert aggregate_scores([]) is None
+
+
+class TestTurnScorer:
+    """Test background per-turn scoring"""
+
+    def test_turns_scored_in_order(self):
+        scorer = TurnScorer(score_fn=lambda msg, prev: fake_scores(len(msg) % 5 + 1, 3, 5))
+
+        scorer.submit("s1", "I'm here for you", "I've been tired lately")
+        scorer.submit("s1", "That sounds hard")
+        scores = scorer.scores("s1", timeout=5)
+
+        assert [s["turn"] for s in scores] == [0, 1]
+        assert scores[0]["message"] == "I'm here for you"
+        assert scorer.summary("s1")["turns"] == 2
+
+    def test_sessions_are_separate(self):
+        scorer = TurnScorer(score_fn=lambda msg, prev: fake_scores(3, 3, 3))
+
+        scorer.submit("a", "hello")
+        assert scorer.scores("b", timeout=5) == []
+        assert len(scorer.scores("a", timeout=5)) == 1
+
+    def test_failed_turns_are_skipped(self):
+        def score_fn(msg, prev):
+            if msg == "bad":
+                raise ValueError("Invalid JSON")
+            return fake_scores(3, 3, 3)
+
+        scorer = TurnScorer(score_fn=score_fn)
+        scorer.submit("s1", "bad")
+        scorer.submit("s1", "good")
+
+        assert [s["message"] for s in scorer.scores("s1", timeout=5)] == ["good"]
+
+    def test_reset_drops_late_results(self):
+        release = threading.Event()
+
+        def slow_score(msg, prev):
+            release.wait(5)
+            return fake_scores(3, 3, 3)
+
+        scorer = TurnScorer(score_fn=slow_score)
+        scorer.submit("s1", "hello")
+        scorer.reset("s1")
+        release.set()
+        scorer._executor.shutdown(wait=True)
+
+        assert scorer.scores("s1", timeout=0) == []
+
+    def test_only_the_latest_turns_are_kept(self):
+        release = threading.Event()
+
+        def score_fn(msg, prev):
+            if msg == "slow":
+                release.wait(5)
+            return fake_scores(3, 3, 3)
+
+        scorer = TurnScorer(score_fn=score_fn, workers=1, max_turns=2)
+        scorer.submit("s1", "first")
+        scorer.scores("s1", timeout=5)
+        scorer.submit("s1", "slow")
+        scorer.submit("s1", "queued")
+        assert scorer.pending("s1") == [1, 2]
+        scorer.submit("s1", "last")
+        release.set()
+
+        # "slow" fell out of the window while it was being scored
+        assert [s["message"] for s in scorer.scores("s1", timeout=5)] == ["queued", "last"]
+        assert scorer.pending("s1") == []
+
+    def test_waits_only_for_the_requested_turns(self):
+        release = threading.Event()
+
+        def score_fn(msg, prev):
+            if msg == "slow":
+                release.wait(5)
+            return fake_scores(3, 3, 3)
+
+        scorer = TurnScorer(score_fn=score_fn)
+        scorer.submit("s1", "slow")
+        scorer.submit("s1", "fast")
+
+        assert [s["turn"] for s in scorer.scores("s1", timeout=5, turns=[1])] == [1]
+        release.set()
+        assert [s["turn"] for s in scorer.scores("s1", timeout=5, turns=[0])] == [0]
+
+
+class TestAlignTurnScores:
+    """Test matching per-turn scores to the turns of a (trimmed) transcript"""
+
+    def test_scores_are_renumbered_to_the_transcript(self):
+        scores = [{"turn": t, "message": m, **fake_scores(3, 3, 3)}
+                  for t, m in enumerate(["old", "hey  there", "again"])]
+        chats = [{"role": role, "content": text} for role, text in
+                 [("assistant", "Hi"), ("user", "hey there"), ("assistant", "Hm"), ("user", "again")]]
+
+        aligned = align_turn_scores(chats, scores)
+
+        # "Hi" opens the trimmed history as turn 1 (and was never scored)
+        assert [(s["turn"], s["message"]) for s in aligned] == [(1, "hey  there"), (2, "again")]
+        assert align_turn_scores(chats, None) == []
+
+
+class TestLlmScoreTurn:
+    """Test parsing of the per-turn model output"""
+
+    @patch('turn_scoring.get_genai_model')
+    def test_parses_and_clamps(self, mock_get_model):
+        mock_get_model.return_value.generate_content.return_value.text = (
+            '```json\n{"empathy": 7, "supportive": 0, "avoidance": 4.6, "quote": "I care", "note": "warm"}\n```')
+
+        result = llm_score_turn("I care about you", "I've been stuck")
+
+        assert result == {"empathy": 5, "supportive": 1, "avoidance": 5, "quote": "I care", "note": "warm"}
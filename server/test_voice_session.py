@@ -0,0 +1,106 @@
+import json
+
+import numpy as np
+import pytest
+
+from voice_session import JsonStringFieldStreamer, VoiceSession
+
+
+class FakeSocket:
+    """Replays client messages; receive() returns None once they run out"""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    def receive(self):
+        return self.messages.pop(0) if self.messages else None
+
+
+def pcm16(seconds, sample_rate=16000):
+    samples = (0.25 * np.sin(np.linspace(0, 100, int(seconds * sample_rate))) * 32767).astype("<i2")
+    return samples.tobytes()
+
+
+@pytest.fixture
+def session_parts():
+    events = []
+    uploads = []
+    calls = []
+
+    def transcribe(upload):
+        uploads.append(upload)
+        return {"text": f" turn {len(uploads)} "}
+
+    def respond(transcript, history, previous_stage, on_delta):
+        calls.append((transcript, list(history), previous_stage))
+        on_delta("Hey, ")
+        on_delta("good to hear from you.")
+        return {"response": "Hey, good to hear from you.", "mood": "happy", "intensity": 70,
+                "stage": 2, "conversation_over": False}
+
+    session = VoiceSession(send=events.append, transcribe=transcribe, respond=respond)
+    return session, events, uploads, calls
+
+
+class TestVoiceSession:
+    """Test the WebSocket voice session protocol"""
+
+    def test_turns_keep_state_on_the_connection(self, session_parts):
+        session, events, uploads, calls = session_parts
+        ws = FakeSocket([
+            json.dumps({"type": "start", "format": "pcm16", "sample_rate": 16000}),
+            pcm16(0.5), pcm16(0.5),
+            json.dumps({"type": "end_turn"}),
+            pcm16(0.25),
+            json.dumps({"type": "end_turn"}),
+        ])
+        session.run(ws)
+
+        types = [event["type"] for event in events]
+        assert types[0] == "ready"
+        assert types.count("turn_complete") == 2
+        assert [e["content"] for e in events if e["type"] == "text_delta"][:2] == ["Hey, ", "good to hear from you."]
+        assert uploads[0].duration == pytest.approx(1.0)
+        assert uploads[1].duration == pytest.approx(0.25)
+        # The second turn sees the first one in its history and the advanced stage
+        assert calls[1][0] == "turn 2"
+        assert [m["content"] for m in calls[1][1]] == ["turn 1", "Hey, good to hear from you."]
+        assert calls[1][2] == 2
+        # Each turn is its own trace, announced with the transcript
+        trace_ids = [e["trace_id"] for e in events if e["type"] == "transcript"]
+        assert len(trace_ids) == 2 and len(set(trace_ids)) == 2
+
+    def test_audio_before_start_is_an_error(self, session_parts):
+        session, events, _, _ = session_parts
+        session.run(FakeSocket([pcm16(0.1)]))
+        assert events[-1] == {"type": "error", "content": "Send a start message before audio"}
+
+    def test_unsupported_format(self, session_parts):
+        session, events, _, _ = session_parts
+        session.run(FakeSocket([json.dumps({"type": "start", "format": "mp3"})]))
+        assert events[-1]["type"] == "error"
+
+    def test_turn_length_is_capped(self, session_parts):
+        session, events, _, _ = session_parts
+        session.max_turn_seconds = 1
+        session.run(FakeSocket([json.dumps({"type": "start", "format": "pcm16"}), pcm16(0.8), pcm16(0.8)]))
+        assert "longer than 1 seconds" in events[-1]["content"]
+
+    def test_failed_turn_keeps_the_session_open(self, session_parts):
+        session, events, _, _ = session_parts
+        session.respond = lambda *args: (_ for _ in ()).throw(RuntimeError("Server busy (chat)"))
+        session.run(FakeSocket([
+            json.dumps({"type": "start", "format": "pcm16"}), pcm16(0.1),
+            json.dumps({"type": "end_turn"}), json.dumps({"type": "reset"}),
+        ]))
+        assert {"type": "error", "content": "Server busy (chat)"} in events
+        assert session.history == []
+
+
+@pytest.mark.parametrize("step", [1, 2, 7, 1000])
+def test_json_string_field_streamer(step):
+    reply = json.dumps({"mood": "happy", "response": "Hi \"you\" 😀\nbye", "stage": 2})
+    streamer = JsonStringFieldStreamer("response")
+    text = "".join(streamer.feed(reply[i:i + step]) for i in range(0, len(reply), step))
+    assert text == "Hi \"you\" 😀\nbye"
+    assert streamer.done
@@ -0,0 +1,292 @@
+"""
+Lightweight, OpenTelemetry-compatible request tracing.
+
+Spans are opened with `span(name, **attributes)`; the current span is tracked
+in a contextvar, so nested spans become its children. Trace context is read
+from and written to W3C `traceparent` headers, and finished spans are exported
+in the OTLP JSON span format by a background thread:
+
+    TRACE_EXPORT=jsonl   append spans to TRACE_FILE (default server/traces.jsonl)
+    TRACE_EXPORT=otlp    POST batches to OTEL_EXPORTER_OTLP_ENDPOINT (/v1/traces)
+
+With TRACE_EXPORT unset spans are still created, so trace ids can be returned
+to clients and logged, but nothing is exported.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces.jsonl")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "voice-chat-server")
+
+# OTLP span kinds: work inside the process, a request served, a call made to another service
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation in a trace"""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, kind=INTERNAL):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self):
+        """W3C traceparent header value for propagating this span's context"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            _exporter().export(self)
+
+    def to_otlp(self):
+        """The span in the OTLP JSON format"""
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def parse_traceparent(header):
+    """(trace_id, parent span_id) from a traceparent header, or None if absent or invalid"""
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2)
+
+
+def start_span(name, parent=None, root=False, kind=INTERNAL, **attributes):
+    """
+    Start a span and make it current; finish it with end_span().
+
+    The parent is, in order: a traceparent header value, the current span
+    (unless root=True), or none, which starts a new trace. `kind` is SERVER for
+    a request being handled, CLIENT for a call out to another service.
+    """
+    context = parse_traceparent(parent) if isinstance(parent, str) else None
+    current = None if root else _current.get()
+    if context:
+        trace_id, parent_id = context
+    elif current is not None:
+        trace_id, parent_id = current.trace_id, current.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    new_span = Span(name, trace_id, parent_id, attributes, kind)
+    return new_span, _current.set(new_span)
+
+
+def end_span(active_span, token, error=None):
+    """Finish a span started with start_span() and restore the previous current span"""
+    if error is not None:
+        active_span.error = str(error) or type(error).__name__
+    active_span.end()
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Ended from a different context (e.g. a response close callback)
+        _current.set(None)
+
+
+@contextmanager
+def span(name, parent=None, root=False, kind=INTERNAL, **attributes):
+    """Context manager form of start_span(); exceptions mark the span as failed"""
+    active_span, token = start_span(name, parent, root, kind, **attributes)
+    try:
+        yield active_span
+    except BaseException as e:
+        end_span(active_span, token, e)
+        raise
+    else:
+        end_span(active_span, token)
+
+
+def current_span():
+    return _current.get()
+
+
+def current_trace_id():
+    """Id of the current trace, or None outside a span"""
+    active_span = _current.get()
+    return active_span.trace_id if active_span else None
+
+
+def current_traceparent():
+    """traceparent header value for the current span, or None outside a span"""
+    active_span = _current.get()
+    return active_span.traceparent if active_span else None
+
+
+# ----------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------
+
+class JsonlSink:
+    """Appends spans, one OTLP JSON object per line"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, spans):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for finished in spans:
+                f.write(json.dumps({"service": SERVICE_NAME, **finished.to_otlp()}) + "\n")
+
+
+class OtlpHttpSink:
+    """Posts batches of spans to an OTLP/HTTP collector in the JSON encoding"""
+
+    def __init__(self, endpoint, timeout=5):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+        import requests
+        self._session = requests.Session()
+
+    def write(self, spans):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "voice-chat"}, "spans": [s.to_otlp() for s in spans]}],
+        }]}
+        response = self._session.post(self.url, json=body, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class SpanExporter:
+    """Buffers finished spans and writes them to a sink from a background thread"""
+
+    def __init__(self, sink, batch_size=256, flush_interval=1.0, max_queue=10000):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, finished):
+        if self.sink is None:
+            return
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            # Never block a request on tracing
+            self._dropped += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self._thread.start()
+
+    def _drain(self, block):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval) if block else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        try:
+            self.sink.write(batch)
+        except Exception as e:
+            logger.warning(f"Failed to export {len(batch)} spans: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _run(self):
+        while True:
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Write out everything queued so far, including a batch the background thread is writing"""
+        if self.sink is None:
+            return
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                break
+            self._write(batch)
+        self._queue.join()
+
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def _exporter():
+    """Exporter for the current TRACE_EXPORT settings"""
+    mode = os.getenv("TRACE_EXPORT", "").lower()
+    target = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318") if mode == "otlp" \
+        else os.getenv("TRACE_FILE", DEFAULT_TRACE_FILE)
+    key = (mode, target)
+    exporter = _exporters.get(key)
+    if exporter is None:
+        with _exporters_lock:
+            exporter = _exporters.get(key)
+            if exporter is None:
+                if mode == "jsonl":
+                    sink = JsonlSink(target)
+                elif mode == "otlp":
+                    sink = OtlpHttpSink(target)
+                else:
+                    sink = None
+                exporter = _exporters[key] = SpanExporter(sink)
+    return exporter
+
+
+def flush():
+    """Export all finished spans now"""
+    for exporter in list(_exporters.values()):
+        exporter.flush()
+
+
+atexit.register(flush)
@@ -0,0 +1,178 @@
+"""
+Incremental, per-turn peer-support scoring.
+
+Each user turn is scored in the background while the conversation goes on
+(Empathetic Language, Supportive Phrases, Avoidance of Harm, 1-5 each), and the
+scores are kept per session. The final report then only has to aggregate them
+and write the summary, instead of evaluating the whole transcript at the end.
+
+Turns are scored by the deterministic local scorer (rubric_scorer) by default;
+set TURN_SCORER=llm to have a small Gemini model score them instead.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from convert_chats import iter_turns, message_text
+from llm_clients import get_genai_model
+from rubric_scorer import WEIGHTS, score_turn, weighted_overall
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = tuple(WEIGHTS)
+
+TURN_SCORING_MODEL = "gemini-1.5-flash"
+
+
+def _clamp_stars(value):
+    return min(5, max(1, int(round(float(value)))))
+
+
+def llm_score_turn(user_message, previous_reply=""):
+    """Score one supporter message with a small, fast model"""
+    prompt = f"""You are scoring one message from a peer supporter talking to a struggling university student.
+
+Student's previous message: "{previous_reply}"
+Supporter's reply: "{user_message}"
+
+Rate the supporter's reply from 1 to 5 stars in each area:
+- empathy: warmth, reflection and validation of feelings
+- supportive: use of supportive phrases such as "I'm here for you", "You matter to me"
+- avoidance: avoidance of harm (5 = respectful, no invalidating remarks or unsolicited advice)
+
+Return only a JSON object like:
+{{"empathy": 3, "supportive": 2, "avoidance": 5, "quote": "short quote from the reply", "note": "one short sentence"}}
+"""
+    model = get_genai_model(TURN_SCORING_MODEL, generation_config={"temperature": 0})
+    text = model.generate_content(prompt).text.strip()
+    if text.startswith('```'):
+        text = text.strip('`').removeprefix('json').strip()
+    result = json.loads(text)
+    return {
+        **{category: _clamp_stars(result.get(category, 3)) for category in CATEGORIES},
+        "quote": str(result.get("quote", ""))[:200],
+        "note": str(result.get("note", ""))[:300],
+    }
+
+
+def aggregate_scores(turn_scores):
+    """
+    Combine per-turn scores into category averages and the weighted overall score.
+
+    Returns None if there are no scores.
+    """
+    if not turn_scores:
+        return None
+    summary = {
+        category: round(sum(t[category] for t in turn_scores) / len(turn_scores), 2)
+        for category in CATEGORIES
+    }
+    summary["overall"] = weighted_overall(summary)
+    summary["turns"] = len(turn_scores)
+    return summary
+
+
+def align_turn_scores(chats, turn_scores):
+    """
+    Keep the per-turn scores whose messages are still in `chats`, renumbered to
+    the transcript's turns (0-based, like the scorer's), so a trimmed history and
+    its scores describe the same turns.
+    """
+    user_turns = [(turn, text) for turn, role, text in iter_turns(chats) if role == "user"]
+    aligned = []
+    position = 0
+    for score in turn_scores or []:
+        text = message_text(score.get("message", ""))
+        for index in range(position, len(user_turns)):
+            if user_turns[index][1] == text:
+                aligned.append({**score, "turn": user_turns[index][0] - 1})
+                position = index + 1
+                break
+    return aligned
+
+
+class TurnScorer:
+    """
+    Scores user turns on a background pool and keeps the results per session
+    (only the latest `max_turns` turns of each, if set)
+    """
+
+    def __init__(self, score_fn=None, workers=2, max_turns=None):
+        if score_fn is None:
+            score_fn = llm_score_turn if os.getenv("TURN_SCORER", "local") == "llm" else score_turn
+        self.score_fn = score_fn
+        self.max_turns = max_turns
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="turn-scorer")
+        self._lock = threading.Lock()
+        # session_id -> {"next_turn": int, "scores": {turn: dict}, "pending": {turn: Future}}
+        self._sessions = {}
+
+    def _session(self, session_id):
+        return self._sessions.setdefault(session_id, {"next_turn": 0, "scores": {}, "pending": {}})
+
+    def submit(self, session_id, user_message, previous_reply=""):
+        """Queue a user turn for scoring; returns its turn number"""
+        with self._lock:
+            session = self._session(session_id)
+            turn = session["next_turn"]
+            session["next_turn"] += 1
+            future = self._executor.submit(self.score_fn, user_message, previous_reply)
+            session["pending"][turn] = future
+            dropped = []
+            if self.max_turns:
+                # Turns that fell out of the window are dropped, scored or not
+                oldest = turn - self.max_turns + 1
+                for old in [t for t in session["scores"] if t < oldest]:
+                    del session["scores"][old]
+                dropped = [session["pending"].pop(t) for t in list(session["pending"]) if t < oldest]
+        # Outside the lock: cancelling runs the done callback, which takes it
+        for old in dropped:
+            old.cancel()
+        future.add_done_callback(lambda f: self._store(session_id, session, turn, user_message, f))
+        return turn
+
+    def _store(self, session_id, session, turn, user_message, future):
+        with self._lock:
+            # Ignore results for a turn that was dropped, or a session that was reset, while scoring
+            if session["pending"].pop(turn, None) is None or self._sessions.get(session_id) is not session:
+                return
+            try:
+                session["scores"][turn] = {"turn": turn, "message": user_message, **future.result()}
+            except Exception as e:
+                logger.warning(f"Turn scoring failed for turn {turn}: {e}")
+
+    def scores(self, session_id, timeout=None, turns=None):
+        """
+        Per-turn scores of a session, in turn order (only those in `turns`, if given).
+
+        Waits up to `timeout` seconds for turns still being scored (None waits for all).
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            pending = [f for t, f in session["pending"].items() if turns is None or t in turns] if session else []
+        if pending:
+            wait(pending, timeout=timeout)
+        with self._lock:
+            if not session:
+                return []
+            return [session["scores"][t] for t in sorted(session["scores"]) if turns is None or t in turns]
+
+    def pending(self, session_id):
+        """Turn numbers of a session that are still being scored"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return sorted(session["pending"]) if session else []
+
+    def summary(self, session_id, timeout=None):
+        """Aggregated scores for a session (see aggregate_scores)"""
+        return aggregate_scores(self.scores(session_id, timeout))
+
+    def reset(self, session_id):
+        """Forget a session's scores (e.g. when the conversation is cleared)"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -0,0 +1,254 @@
+"""
+Full-duplex voice sessions over a WebSocket.
+
+One connection carries a whole conversation, so there is no per-turn HTTP
+request, multipart parse or session lookup. The conversation history and stage
+live on the VoiceSession bound to the connection.
+
+Protocol (text frames are JSON, audio frames are binary):
+
+    client -> {"type": "start", "format": "pcm16" | "opus", "sample_rate": 16000, "channels": 1}
+    client -> binary audio: raw little-endian PCM16, or one Opus packet per frame
+    client -> {"type": "end_turn"}          transcribe and answer the audio sent so far
+    client -> {"type": "reset"}             forget the conversation
+    server -> {"type": "ready", "session_id": ..., "formats": [...]}
+    server -> {"type": "transcript" | "text_delta" | "text" | "mood" | "stage" | "conversation_over", "content": ...}
+    server -> {"type": "turn_complete"} | {"type": "error", "content": ...}
+
+Each turn is traced separately; its first event (transcript, or the "No speech
+detected" error) carries the turn's "trace_id".
+
+Opus needs the optional opuslib package (and libopus); without it only pcm16 is offered.
+"""
+
+import json
+import logging
+import uuid
+
+import numpy as np
+
+import tracing
+from audio_upload import AudioUpload, UploadError
+
+logger = logging.getLogger(__name__)
+
+try:
+    import opuslib
+except Exception:  # ImportError, or OSError when libopus itself is missing
+    opuslib = None
+
+FORMATS = ["pcm16", "opus"] if opuslib else ["pcm16"]
+# Opus packets decode to at most 120 ms
+OPUS_MAX_FRAME_MS = 120
+# Conversation messages kept per session, as in the HTTP endpoints
+MAX_HISTORY = 10
+
+
+class JsonStringFieldStreamer:
+    """
+    Incrementally extracts one string field from a JSON object as it streams in,
+    e.g. the "response" text of a model reply, so it can be forwarded as deltas
+    """
+
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self, field):
+        self._key = f'"{field}"'
+        self._text = ""
+        self._pos = None
+        self.done = False
+
+    def feed(self, text):
+        """Add streamed text; returns the newly decoded part of the field ("" if none)"""
+        self._text += text
+        if self.done:
+            return ""
+        if self._pos is None:
+            key = self._text.find(self._key)
+            if key < 0:
+                return ""
+            # Skip to the opening quote of the value
+            rest = self._text[key + len(self._key):]
+            stripped = rest.lstrip().lstrip(":").lstrip()
+            if not stripped.startswith('"'):
+                return ""
+            self._pos = len(self._text) - len(stripped) + 1
+
+        delta = []
+        pos = self._pos
+        while pos < len(self._text):
+            char = self._text[pos]
+            if char == '"':
+                self.done = True
+                pos += 1
+                break
+            if char == "\\":
+                if pos + 1 >= len(self._text):
+                    break
+                code = self._text[pos + 1]
+                if code == "u":
+                    if pos + 6 > len(self._text):
+                        break
+                    escape = 12 if 0xD800 <= int(self._text[pos + 2:pos + 6], 16) < 0xDC00 else 6
+                    if pos + escape > len(self._text):
+                        break
+                    # json handles surrogate pairs (emoji) for us
+                    delta.append(json.loads(f'"{self._text[pos:pos + escape]}"'))
+                    pos += escape
+                    continue
+                delta.append(self._ESCAPES.get(code, code))
+                pos += 2
+                continue
+            delta.append(char)
+            pos += 1
+        self._pos = pos
+        return "".join(delta)
+
+
+class VoiceSession:
+    """Conversation state and turn handling for one WebSocket connection"""
+
+    def __init__(self, send, transcribe, respond, max_turn_bytes=25 * 1024 * 1024, max_turn_seconds=120.0):
+        """
+        Args:
+            send: callable(event dict) that writes an event to the socket
+            transcribe: callable(AudioUpload) -> Whisper result dict
+            respond: callable(transcript, history, stage, on_delta) -> reply dict with
+                "response", "mood", "intensity", "stage" and "conversation_over"
+        """
+        self.send = send
+        self.transcribe = transcribe
+        self.respond = respond
+        self.max_turn_bytes = max_turn_bytes
+        self.max_turn_seconds = max_turn_seconds
+
+        self.session_id = uuid.uuid4().hex
+        self.history = []
+        self.stage = 1
+        self.format = None
+        self.sample_rate = 16000
+        self.channels = 1
+        self._audio = bytearray()
+        self._opus = None
+
+    # ------------------------------------------------------------------
+    # Connection loop
+    # ------------------------------------------------------------------
+
+    def run(self, ws):
+        """Serve the connection until the client closes it"""
+        self.send({"type": "ready", "session_id": self.session_id, "formats": FORMATS})
+        while True:
+            message = ws.receive()
+            if message is None:
+                return
+            try:
+                if isinstance(message, (bytes, bytearray)):
+                    self.handle_audio(bytes(message))
+                else:
+                    self.handle_control(json.loads(message))
+            except (UploadError, ValueError) as e:
+                self.send({"type": "error", "content": str(e)})
+            except Exception as e:
+                # e.g. shed by admission control; the session stays usable
+                logger.error(f"Voice session {self.session_id} turn failed: {e}")
+                self.send({"type": "error", "content": str(e)})
+
+    def handle_control(self, message):
+        kind = message.get("type")
+        if kind == "start":
+            self.start(message.get("format", "pcm16"), int(message.get("sample_rate", 16000)),
+                       int(message.get("channels", 1)))
+        elif kind == "end_turn":
+            self.end_turn()
+        elif kind == "reset":
+            self.reset()
+        else:
+            raise ValueError(f"Unknown message type: {kind}")
+
+    def reset(self):
+        """Forget the conversation"""
+        self.history = []
+        self.stage = 1
+        self._audio = bytearray()
+
+    # ------------------------------------------------------------------
+    # Audio
+    # ------------------------------------------------------------------
+
+    def start(self, audio_format, sample_rate=16000, channels=1):
+        """Set the audio format for the following turns"""
+        if audio_format not in FORMATS:
+            raise ValueError(f"Unsupported audio format {audio_format!r} (supported: {', '.join(FORMATS)})")
+        if channels not in (1, 2) or not 8000 <= sample_rate <= 48000:
+            raise ValueError("Expected 1 or 2 channels at 8-48 kHz")
+        self.format = audio_format
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._audio = bytearray()
+        self._opus = opuslib.Decoder(sample_rate, channels) if audio_format == "opus" else None
+
+    def handle_audio(self, data):
+        if self.format is None:
+            raise ValueError("Send a start message before audio")
+        if self._opus is not None:
+            frame_size = self.sample_rate * OPUS_MAX_FRAME_MS // 1000
+            data = self._opus.decode(data, frame_size)
+        if len(self._audio) + len(data) > self.max_turn_bytes:
+            self._audio = bytearray()
+            raise UploadError("Turn audio is too large", 413)
+        self._audio.extend(data)
+        if self.buffered_seconds() > self.max_turn_seconds:
+            self._audio = bytearray()
+            raise UploadError(f"Turn is longer than {self.max_turn_seconds:g} seconds", 413)
+
+    def buffered_seconds(self):
+        return len(self._audio) / (2 * self.channels * self.sample_rate)
+
+    def _take_upload(self):
+        usable = len(self._audio) - len(self._audio) % (2 * self.channels)
+        samples = np.frombuffer(bytes(self._audio[:usable]), dtype="<i2")
+        self._audio = bytearray()
+        frames = (samples.astype(np.float32) / 32768.0).reshape(-1, self.channels)
+        return AudioUpload("", self.format, frames=frames, sample_rate=self.sample_rate)
+
+    # ------------------------------------------------------------------
+    # Turns
+    # ------------------------------------------------------------------
+
+    def _add_message(self, role, content):
+        self.history.append({"role": role, "content": content})
+        del self.history[:-MAX_HISTORY]
+
+    def end_turn(self):
+        """Transcribe the buffered audio and stream the reply back, as one trace"""
+        upload = self._take_upload()
+        if not len(upload.frames):
+            raise ValueError("No audio received for this turn")
+        with tracing.span("voice_turn", root=True, kind=tracing.SERVER, session_id=self.session_id) as turn_span:
+            self._turn(upload, turn_span.trace_id)
+
+    def _turn(self, upload, trace_id):
+        transcript = self.transcribe(upload)["text"].strip()
+        if not transcript:
+            self.send({"type": "error", "content": "No speech detected", "trace_id": trace_id})
+            return
+        self.send({"type": "transcript", "content": transcript, "trace_id": trace_id})
+
+        history = list(self.history)
+        self._add_message("user", transcript)
+
+        def on_delta(text):
+            self.send({"type": "text_delta", "content": text})
+
+        result = self.respond(transcript, history, self.stage, on_delta)
+        # The complete reply as well, since fallback replies aren't streamed as deltas
+        response = result["response"]
+        self.send({"type": "text", "content": response})
+        self._add_message("assistant", response)
+
+        self.stage = max(int(result.get("stage") or 1), self.stage)
+        self.send({"type": "mood", "content": f"{result['mood']} {result['intensity']}"})
+        self.send({"type": "stage", "content": str(self.stage)})
+        self.send({"type": "conversation_over", "content": str(result.get("conversation_over", False))})
+        self.send({"type": "turn_complete"})
@@ -1,9 +1,11 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
+from flask_sock import Sock
 import whisper
 import os
 import logging
 import json
+import hmac
 from datetime import datetime
 import time
 from dotenv import load_dotenv
@@ -11,20 +13,36 @@ from dotenv import load_dotenv
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from simple_email import send_email
+from simple_email import send_digest, send_email, send_emails, stream_analysis
+from report_jobs import ReportQueue
+from admission import Overloaded, from_env
+from audio_upload import MULTIPART_OVERHEAD, WHISPER_SAMPLE_RATE, UploadError, read_audio_upload, resample
+from voice_session import JsonStringFieldStreamer, VoiceSession
+import metrics
+from metrics import ACTIVE_SESSIONS, FALLBACKS, IN_FLIGHT, REQUEST_SECONDS, time_stage
+import tracing
+from profiling import profiler_from_env
+import recorder
+from turn_scoring import TurnScorer
+from llm_clients import get_genai_model
 import tempfile
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+# Gemini model for mood detection and responses (client shared via llm_clients)
+GEMINI_MODEL = 'gemini-1.5-flash'
 
 app = Flask(__name__)
-CORS(app)
+# Let browser clients read the trace id to quote in bug reports
+CORS(app, expose_headers=['X-Trace-Id'])
+sock = Sock(app)
+
+# Upload limits; uploads are streamed and rejected as soon as a limit is hit
+MAX_UPLOAD_BYTES = int(float(os.getenv('AUDIO_MAX_UPLOAD_MB', '25')) * 1024 * 1024)
+MAX_AUDIO_SECONDS = float(os.getenv('AUDIO_MAX_SECONDS', '120'))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -33,8 +51,51 @@ logger = logging.getLogger(__name__)
 # Load Whisper model
 model = whisper.load_model("base")
 
+# Concurrency caps and wait queues per stage: (limit, queue depth, priority).
+# All stages share `total` slots, and chat and transcription are admitted
+# ahead of report generation when they compete for them.
+admission = from_env({
+    'transcription': (2, 8, 0),
+    'chat': (8, 32, 0),
+    'reports': (2, 4, 1),
+}, total=10)
+
+# Report jobs (analysis + email) run in the background from a durable outbox
+report_queue = ReportQueue(
+    os.getenv('REPORT_OUTBOX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_outbox.db')),
+    handler=admission.wrap('reports', lambda to_email, chats, **options:
+                           send_email(to_email, chats, **with_pending_scores(options))),
+    batch_handler=admission.wrap('reports', lambda reports:
+                                 send_emails([(to_email, chats, with_pending_scores(options))
+                                              for to_email, chats, options in reports])),
+    # Reports to the same recipient within the window go out as one digest (0 = off)
+    digest_handler=admission.wrap('reports', lambda to_email, reports:
+                                  send_digest(to_email, [(chats, with_pending_scores(options))
+                                                         for chats, options in reports])),
+    digest_window=float(os.getenv('REPORT_DIGEST_WINDOW', '0')),
+    workers=int(os.getenv('REPORT_WORKERS', '2')),
+    max_attempts=int(os.getenv('REPORT_MAX_ATTEMPTS', '5')),
+)
+
 # Global conversation history for single user
 conversation_history = []
+# Messages kept in the history
+MAX_HISTORY = 10
+
+# Each user turn is scored in the background so the final report only aggregates;
+# scores are kept for as many turns as the history can hold
+SESSION_ID = "default"
+turn_scorer = TurnScorer(workers=int(os.getenv('TURN_SCORING_WORKERS', '2')), max_turns=MAX_HISTORY)
+# How long a report waits for turns that are still being scored
+TURN_SCORES_WAIT = float(os.getenv('TURN_SCORES_WAIT', '2'))
+
+# On-demand profiling of live requests, controlled through the /admin endpoints
+# (disabled unless ADMIN_TOKEN is set)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+profiler = profiler_from_env()
+
+# Record each turn to RECORD_DIR, or answer Gemini from a REPLAY_ARCHIVE recording (see replay.py)
+session_archive = recorder.from_env()
 
 stage = 1
 
@@ -46,18 +107,55 @@ def add_message(role, content):
         "content": content
     })
     
-    # Keep only last 10 messages to prevent memory bloat
-    if len(conversation_history) > 10:
+    # Keep only the last MAX_HISTORY messages to prevent memory bloat
+    if len(conversation_history) > MAX_HISTORY:
         conversation_history.pop(0)  # Remove oldest message
 
 
-def get_conversation_context():
-    """Get conversation context for Gemini prompt"""
-    if not conversation_history:
+def score_user_turn(transcript):
+    """Queue the latest user turn for background rubric scoring"""
+    previous_reply = next(
+        (msg["content"] for msg in reversed(conversation_history) if msg["role"] == "assistant"), "")
+    turn_scorer.submit(SESSION_ID, transcript, previous_reply)
+
+
+def get_turn_scores():
+    """Per-turn scores of the current session, or None if none were collected"""
+    return turn_scorer.scores(SESSION_ID, timeout=TURN_SCORES_WAIT) or None
+
+
+def queue_report(to_email, chats):
+    """
+    Queue a report job with the turn scores finished so far; turns still being
+    scored are listed so the job collects them, rather than the request waiting
+    """
+    # Pending first: a turn finishing in between is then in both, not in neither
+    pending = turn_scorer.pending(SESSION_ID)
+    options = {'turn_scores': turn_scorer.scores(SESSION_ID, timeout=0) or None}
+    if pending:
+        options['pending_turns'] = pending
+    return report_queue.enqueue(to_email, chats, **options)
+
+
+def with_pending_scores(options):
+    """Report options with the scores of the turns that were pending when it was queued"""
+    options = dict(options)
+    pending = options.pop('pending_turns', None)
+    if pending:
+        scores = {t['turn']: t for t in options.get('turn_scores') or []}
+        scores.update((t['turn'], t) for t in turn_scorer.scores(SESSION_ID, TURN_SCORES_WAIT, turns=pending))
+        options['turn_scores'] = [scores[t] for t in sorted(scores)] or None
+    return options
+
+
+def get_conversation_context(history=None):
+    """Get conversation context for Gemini prompt (from the global history by default)"""
+    history = conversation_history if history is None else history
+    if not history:
         return ""
     
     context = "Previous conversation:\n"
-    for msg in conversation_history[-6:]:  # Last 6 messages for context
+    for msg in history[-6:]:  # Last 6 messages for context
         role_name = "User" if msg["role"] == "user" else "Assistant"
         context += f"{role_name}: {msg['content']}\n"
     
@@ -75,14 +173,34 @@ def load_system_prompt():
         return "You are a helpful assistant."
 
 
-def detect_mood_and_generate_response(transcript):
-    """Detect mood from transcript and generate appropriate response with conversation context"""
+def stream_reply(full_prompt, on_delta):
+    """Generate a reply with streaming, passing its "response" text to on_delta as it arrives"""
+    streamer = JsonStringFieldStreamer("response")
+    chunks = []
+    for chunk in get_genai_model(GEMINI_MODEL).generate_content(full_prompt, stream=True):
+        chunks.append(chunk.text)
+        delta = streamer.feed(chunk.text)
+        if delta:
+            on_delta(delta)
+    return "".join(chunks)
+
+
+def detect_mood_and_generate_response(transcript, history=None, previous_stage=None, on_delta=None, timings=None):
+    """
+    Detect mood from transcript and generate appropriate response with conversation context
+
+    history and previous_stage default to the global conversation; pass on_delta(text)
+    to receive the response text incrementally while it is generated, and a timings
+    dict to collect per-stage seconds (prompt, llm, parse).
+    """
     try:
-        # Load system prompt
-        system_prompt = load_system_prompt()
-        print(f"Using system prompt: {system_prompt}")
-        # Get conversation context
-        context = get_conversation_context()
+        with time_stage("prompt", timings):
+            # Load system prompt
+            system_prompt = load_system_prompt()
+            print(f"Using system prompt: {system_prompt}")
+            # Get conversation context
+            context = get_conversation_context(history)
+        previous_stage = stage if previous_stage is None else previous_stage
         
         # Create the full prompt with system prompt, context, and current message
         full_prompt = f"""{system_prompt}
@@ -90,7 +208,7 @@ def detect_mood_and_generate_response(transcript):
 {context}Current user message: "{transcript}"
 
 Based on your character as Maya and the conversation history (if any), respond naturally as Maya would. Also analyze the intended mood/emotion from the user's message (choose from: happy, sad, angry), kind messages should have a happy mood, while critical or negative messages should have a sad or angry mood.
-Include what stage in the conversation you are at (1, 2, 3, or 4). The previous stage was {stage}, if the previous message was suitable for the criteria then move to the next stage and respond according to the next stage. Only move to the next stage if the criteria in the system prompt has been met.
+Include what stage in the conversation you are at (1, 2, 3, or 4). The previous stage was {previous_stage}, if the previous message was suitable for the criteria then move to the next stage and respond according to the next stage. Only move to the next stage if the criteria in the system prompt has been met.
 Also include whether the conversations is over or not, ie both parties have said goodbye and stage 4 has been reached.
 
 Please respond in this exact JSON format:
@@ -104,20 +222,26 @@ Please respond in this exact JSON format:
 """
         
         logger.info("Calling Gemini for mood detection and response generation...")
-        response = gemini_model.generate_content(full_prompt)
+        with time_stage("llm", timings, kind=tracing.CLIENT):
+            if on_delta is None:
+                response_text = get_genai_model(GEMINI_MODEL).generate_content(full_prompt).text
+            else:
+                response_text = stream_reply(full_prompt, on_delta)
         
         # Parse the JSON response
-        response_text = response.text.strip()
-        if response_text.startswith('```json'):
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-        
-        result = json.loads(response_text)
+        with time_stage("parse", timings):
+            response_text = response_text.strip()
+            if response_text.startswith('```json'):
+                response_text = response_text.replace('```json', '').replace('```', '').strip()
+            
+            result = json.loads(response_text)
         logger.info(f"Gemini response: mood={result.get('mood')}, intensity={result.get('intensity')}")
         
         return result
         
     except Exception as e:
         logger.error(f"Mood detection/response generation failed: {e}")
+        FALLBACKS.inc(kind="reply")
         # Return fallback response
         return {
             "mood": "neutral",
@@ -127,114 +251,96 @@ Please respond in this exact JSON format:
         }
 
 
-def transcribe_audio_file(audio_file):
-    """Helper function to transcribe an audio file using Whisper"""
-    tmp_path = None
-    try:
-        # Create temporary file in current directory for better Whisper compatibility
-        import uuid
-        filename = f"temp_audio_{uuid.uuid4().hex[:8]}.wav"
-        tmp_path = os.path.join(os.getcwd(), filename)
-
-        # Save the uploaded audio to the temporary file
-        audio_file.save(tmp_path)
-
-        # Verify file exists and has content
-        if not os.path.exists(tmp_path):
-            raise FileNotFoundError(
-                f"Temporary file was not created: {tmp_path}")
+def decode_audio(upload, timings=None):
+    """Decode an upload to what Whisper expects: mono float32 samples at 16 kHz"""
+    with time_stage("decode", timings):
+        audio_data, sample_rate = upload.decode()
+    with time_stage("resample", timings):
+        audio_data = resample(audio_data, sample_rate)
+    if len(audio_data) > MAX_AUDIO_SECONDS * WHISPER_SAMPLE_RATE:
+        raise UploadError(f"Audio is longer than {MAX_AUDIO_SECONDS:g} seconds", 413)
+    logger.info(f"Decoded audio: {len(audio_data)} samples at {WHISPER_SAMPLE_RATE}Hz")
+    return audio_data
 
-        file_size = os.path.getsize(tmp_path)
-        if file_size == 0:
-            raise ValueError("Audio file is empty")
 
-        logger.info(
-            f"Processing audio file: {tmp_path} (size: {file_size} bytes)")
+def decode_audio_with_ffmpeg(upload, timings=None):
+    """Decode formats soundfile can't read (e.g. WebM/Opus) with Whisper's ffmpeg loader"""
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix=f".{upload.container}", delete=False) as tmp:
+            tmp.write(upload.encoded)
+            tmp_path = tmp.name
+        with time_stage("decode_ffmpeg", timings):
+            audio_data = whisper.load_audio(tmp_path)
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    if len(audio_data) > MAX_AUDIO_SECONDS * WHISPER_SAMPLE_RATE:
+        raise UploadError(f"Audio is longer than {MAX_AUDIO_SECONDS:g} seconds", 413)
+    return audio_data
 
-        # Use memory-based approach to bypass file system issues
-        logger.info("Starting Whisper transcription using memory approach...")
-        try:
-            import soundfile as sf
-            import numpy as np
-
-            # Read audio data directly into memory
-            audio_data, sample_rate = sf.read(tmp_path)
-            logger.info(
-                f"Loaded audio: {len(audio_data)} samples at {sample_rate}Hz")
-
-            # Convert to float32 and ensure it's 1D
-            if len(audio_data.shape) > 1:
-                audio_data = audio_data.mean(axis=1)  # Convert stereo to mono
-            audio_data = audio_data.astype(np.float32)
-
-            # Resample to 16kHz if needed (Whisper's expected sample rate)
-            if sample_rate != 16000:
-                import librosa
-                audio_data = librosa.resample(
-                    audio_data, orig_sr=sample_rate, target_sr=16000)
-                logger.info("Resampled audio to 16kHz")
-
-            # Transcribe the audio data directly
-            result = model.transcribe(audio_data, verbose=True)
-
-        except ImportError as import_e:
-            logger.error(f"Missing required audio library: {import_e}")
-            logger.info("Please install: pip install soundfile librosa")
-            raise Exception(
-                "Missing audio processing libraries. Run: pip install soundfile librosa")
-        except Exception as memory_e:
-            logger.error(f"Memory-based transcription failed: {memory_e}")
-            logger.info("Falling back to file-based approach...")
-
-            # Last resort: try the original file path approach
-            try:
-                result = model.transcribe(tmp_path)
-            except Exception as final_e:
-                logger.error(f"All transcription methods failed: {final_e}")
-                raise final_e
 
-        logger.info(f"Transcription successful: {result['text']}")
-        return result
+def transcribe_audio_file(upload, timings=None):
+    """
+    Transcribe an uploaded clip (see audio_upload) in stages: decode, resample, then Whisper.
 
-    finally:
-        # Clean up temporary file
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-                logger.info(f"Cleaned up temporary file: {tmp_path}")
-            except Exception as cleanup_e:
-                logger.warning(
-                    f"Failed to clean up temporary file {tmp_path}: {cleanup_e}")
+    Pass a timings dict to collect the seconds spent in each stage.
+    """
+    try:
+        audio_data = decode_audio(upload, timings)
+    except UploadError:
+        raise
+    except ImportError as import_e:
+        logger.error(f"Missing required audio library: {import_e}")
+        logger.info("Please install: pip install soundfile librosa")
+        raise Exception(
+            "Missing audio processing libraries. Run: pip install soundfile librosa")
+    except Exception as decode_e:
+        if upload.encoded is None:
+            raise
+        logger.info(f"Decoding {upload.container} in memory failed ({decode_e}), using ffmpeg...")
+        FALLBACKS.inc(kind="ffmpeg_decode")
+        audio_data = decode_audio_with_ffmpeg(upload, timings)
+
+    logger.info("Starting Whisper transcription...")
+    with time_stage("whisper", timings):
+        result = model.transcribe(audio_data, verbose=True)
+
+    logger.info(f"Transcription successful: {result['text']}")
+    return result
 
 
 @app.route('/voice-chat', methods=['POST'])
 def voice_chat():
     """Main voice chat endpoint - transcribe, detect mood, and respond"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No audio file provided'}), 400
-
-        audio = request.files['file']
-        if audio.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        timings = {}
+        # Streamed and size-checked; missing, oversized and non-audio uploads raise UploadError
+        with time_stage("upload", timings):
+            audio = read_audio_upload(request, MAX_UPLOAD_BYTES, MAX_AUDIO_SECONDS)
 
         # Step 1: Transcribe audio
         logger.info("Transcribing audio...")
-        transcription_result = transcribe_audio_file(audio)
+        with admission.slot('transcription'):
+            transcription_result = transcribe_audio_file(audio, timings)
         transcript = transcription_result['text'].strip()
 
         if not transcript:
             return jsonify({'error': 'No speech detected'}), 400
 
-        # Step 2: Add user message to conversation history
+        # Step 2: Add user message to conversation history (and score it in the background)
+        score_user_turn(transcript)
         add_message("user", transcript)
 
         # Step 3: Detect mood and generate response using Gemini with context
         logger.info("Detecting mood and generating response with conversation context...")
-        gemini_result = detect_mood_and_generate_response(transcript)
+        with admission.slot('chat'):
+            gemini_result = detect_mood_and_generate_response(transcript, timings=timings)
 
         # Step 4: Add AI response to conversation history
         add_message("assistant", gemini_result['response'])
+        if session_archive:
+            session_archive.record_turn('voice-chat', audio, transcript, gemini_result, timings)
 
         return jsonify({
             'transcript': transcript,
@@ -243,23 +349,74 @@ def voice_chat():
             'mood_intensity': gemini_result['intensity']
         })
 
+    except (Overloaded, UploadError):
+        raise
     except Exception as e:
         logger.error(f"Voice chat error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/get-score-and-email', methods=['GET'])
 def get_score_and_email():
+    """Queue a report job (analysis + email) and return its id immediately"""
     global conversation_history
     try:
-        send_email("evanlamb848@gmail.com", conversation_history)
+        job_id = queue_report("evanlamb848@gmail.com", list(conversation_history))
 
-        return jsonify({'status': 'success', 
-                        'message': 'Email sent successfully',
-                        'timestamp': datetime.now().isoformat()}), 200
+        return jsonify({'status': 'queued',
+                        'message': 'Report queued',
+                        'job_id': job_id,
+                        'status_url': f'/report-jobs/{job_id}',
+                        'timestamp': datetime.now().isoformat()}), 202
 
     except Exception as e:
         logger.error(f"Error during get score and email: {str(e)}")
         return jsonify({'error': f'Get score and email failed: {str(e)}'}), 500
+
+
+@app.route('/report-jobs/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """Poll the status of a queued report job"""
+    job = report_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify(job)
+
+
+@app.route('/get-score-stream', methods=['GET'])
+def get_score_stream():
+    """Stream the analysis report over SSE as it is generated, then queue the email"""
+    chats = list(conversation_history)
+    # Raises Overloaded (503) before the stream starts if reports are saturated
+    report_slot = admission.acquire('reports')
+    trace_id = tracing.current_trace_id()
+
+    def generate():
+        try:
+            yield f"data: {json.dumps({'type': 'start', 'trace_id': trace_id})}\n\n"
+
+            chunks = []
+            for chunk in stream_analysis(chats, get_turn_scores()):
+                chunks.append(chunk)
+                yield f"data: {json.dumps({'type': 'analysis', 'content': chunk})}\n\n"
+
+            # Email the assembled text; the worker doesn't need to call the model again
+            job_id = report_queue.enqueue("evanlamb848@gmail.com", chats, analysis="".join(chunks))
+            yield f"data: {json.dumps({'type': 'complete', 'job_id': job_id})}\n\n"
+
+        except Exception as stream_error:
+            logger.error(f"Analysis stream error: {stream_error}")
+            yield f"data: {json.dumps({'type': 'error', 'content': str(stream_error)})}\n\n"
+        finally:
+            report_slot.release()
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'Access-Control-Allow-Origin': '*'
+    })
+    # Also release if the client goes away before the stream starts
+    response.call_on_close(report_slot.release)
+    return response
         
 
 
@@ -267,18 +424,19 @@ def get_score_and_email():
 def voice_chat_stream():
     """Streaming voice chat endpoint - transcribe, detect mood, and stream response"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No audio file provided'}), 400
-
-        audio = request.files['file']
-        if audio.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        timings = {}
+        # Streamed and size-checked; missing, oversized and non-audio uploads raise UploadError
+        with time_stage("upload", timings):
+            audio = read_audio_upload(request, MAX_UPLOAD_BYTES, MAX_AUDIO_SECONDS)
 
         # Transcribe audio
         logger.info("Starting streaming voice chat - transcribing audio...")
         try:
-            transcription_result = transcribe_audio_file(audio)
+            with admission.slot('transcription'):
+                transcription_result = transcribe_audio_file(audio, timings)
             transcript = transcription_result['text'].strip()
+        except (Overloaded, UploadError):
+            raise
         except Exception as transcription_error:
             logger.error(f"Transcription failed: {transcription_error}")
             return jsonify({'error': f'Transcription failed: {str(transcription_error)}'}), 500
@@ -287,22 +445,28 @@ def voice_chat_stream():
             return jsonify({'error': 'No speech detected'}), 400
 
         logger.info(f"Transcription successful: {transcript}")
+        # Hold a chat slot for the whole stream; 503 now rather than mid-stream
+        chat_slot = admission.acquire('chat')
+        trace_id = tracing.current_trace_id()
 
         def generate():
             try:
                 global stage
-                # Send transcript first
-                yield f"data: {json.dumps({'type': 'transcript', 'content': transcript})}\n\n"
+                # Send transcript first, with the trace id to match the stream to our spans
+                yield f"data: {json.dumps({'type': 'transcript', 'content': transcript, 'trace_id': trace_id})}\n\n"
                 
-                # Add user message to conversation history
+                # Add user message to conversation history (and score it in the background)
+                score_user_turn(transcript)
                 add_message("user", transcript)
                 
                 # Get mood and response from Gemini with conversation context
                 logger.info("Getting mood detection and response from Gemini with context...")
-                gemini_result = detect_mood_and_generate_response(transcript)
+                gemini_result = detect_mood_and_generate_response(transcript, timings=timings)
                 
                 # Add AI response to conversation history
                 add_message("assistant", gemini_result['response'])
+                if session_archive:
+                    session_archive.record_turn('voice-chat-stream', audio, transcript, gemini_result, timings)
                 
                 # Send mood data
                 yield f"data: {json.dumps({'type': 'mood', 'content': gemini_result['mood'] + ' ' + str(gemini_result['intensity'])})}\n\n"
@@ -318,21 +482,190 @@ def voice_chat_stream():
             except Exception as stream_error:
                 logger.error(f"Stream generation error: {stream_error}")
                 yield f"data: {json.dumps({'type': 'error', 'content': str(stream_error)})}\n\n"
+            finally:
+                chat_slot.release()
 
-        return Response(generate(), mimetype='text/event-stream', headers={
+        response = Response(generate(), mimetype='text/event-stream', headers={
             'Cache-Control': 'no-cache',
             'Connection': 'keep-alive',
             'Access-Control-Allow-Origin': '*'
         })
+        response.call_on_close(chat_slot.release)
+        return response
 
+    except (Overloaded, UploadError):
+        raise
     except Exception as e:
         logger.error(f"Streaming endpoint error: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.before_request
+def start_request_trace():
+    """Root span for the request, continuing the caller's trace if it sent a traceparent"""
+    rule = request.url_rule.rule if request.url_rule else request.path
+    g.trace_span, g.trace_token = tracing.start_span(
+        f"{request.method} {rule}", parent=request.headers.get('traceparent'), root=True, kind=tracing.SERVER,
+        **{'http.method': request.method, 'http.route': rule})
+
+
+@app.after_request
+def finish_request_trace(response):
+    """Return the trace id, and end the root span once the response (or stream) is done"""
+    request_span, token = g.get('trace_span'), g.get('trace_token')
+    if request_span is None:
+        return response
+    request_span.set_attribute('http.status_code', response.status_code)
+    response.headers['X-Trace-Id'] = request_span.trace_id
+    response.headers['traceparent'] = request_span.traceparent
+    error = f"HTTP {response.status_code}" if response.status_code >= 500 else None
+    response.call_on_close(lambda: tracing.end_span(request_span, token, error))
+    return response
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.metrics_endpoint = request.endpoint or 'unknown'
+    IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+
+@app.after_request
+def finish_request_metrics(response):
+    """Record latency once the response is fully sent (SSE streams included)"""
+    endpoint, start = g.get('metrics_endpoint'), g.get('request_start')
+    if endpoint is None:
+        return response
+
+    def finish():
+        IN_FLIGHT.dec(endpoint=endpoint)
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status=response.status_code)
+
+    response.call_on_close(finish)
+    return response
+
+
+def is_admin_request():
+    """Whether the request carries ADMIN_TOKEN (as a bearer token or X-Admin-Token)"""
+    if not ADMIN_TOKEN:
+        return False
+    auth = request.headers.get('Authorization', '')
+    token = auth[len('Bearer '):] if auth.startswith('Bearer ') else request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+@app.before_request
+def start_request_profile():
+    """Profile the request if profiling is armed, or an admin asked with X-Profile: cprofile|sample"""
+    if request.path.startswith('/admin/'):
+        return None
+    requested = request.headers.get('X-Profile') if is_admin_request() else None
+    try:
+        g.profile = profiler.maybe_start(f"{request.method} {request.path}", requested,
+                                         trace_id=tracing.current_trace_id())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.after_request
+def finish_request_profile(response):
+    """Stop profiling once the response (or stream) is done"""
+    active = g.get('profile')
+    if active is not None:
+        response.headers['X-Profile-Id'] = active.profile.id
+        response.call_on_close(active.stop)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text-format metrics: stage latencies, fallbacks, cache hits, in-flight requests"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """Arm profiling for the next N requests: {"requests": N, "mode": "sample" | "cprofile"}"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            profiler.arm(int(data.get('requests', 1)), data.get('mode', 'sample'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify(profiler.status())
+
+
+@app.route('/admin/profiles', methods=['GET'])
+def admin_profiles():
+    """Recorded profiles of this worker, newest first"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'profiles': profiler.list()})
+
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+def admin_profile(profile_id):
+    """Download a profile: ?format=pstats|text for cProfile, collapsed for sampled stacks"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    profile = profiler.get(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Unknown profile id'}), 404
+    fmt = request.args.get('format')
+    try:
+        body, content_type = profile.render(fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    extension = {'pstats': 'prof', 'text': 'txt', 'collapsed': 'folded'}[fmt or profile.formats()[0]]
+    return Response(body, content_type=content_type, headers={
+        'Content-Disposition': f'attachment; filename=profile-{profile_id}.{extension}'})
+
+
+@app.errorhandler(UploadError)
+def upload_error(e):
+    """Rejected audio upload (missing, too large, too long or not audio)"""
+    return jsonify({'error': str(e)}), e.status
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    """Shed load: 503 with a Retry-After hint"""
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+@sock.route('/voice-session')
+def voice_session(ws):
+    """Persistent voice session: PCM16/Opus audio in, transcript/text/mood/stage events out"""
+    def transcribe(upload):
+        with admission.slot('transcription'):
+            return transcribe_audio_file(upload)
+
+    def respond(transcript, history, previous_stage, on_delta):
+        with admission.slot('chat'):
+            return detect_mood_and_generate_response(transcript, history, previous_stage, on_delta)
+
+    session = VoiceSession(
+        send=lambda event: ws.send(json.dumps(event)),
+        transcribe=transcribe,
+        respond=respond,
+        max_turn_bytes=MAX_UPLOAD_BYTES,
+        max_turn_seconds=MAX_AUDIO_SECONDS,
+    )
+    logger.info(f"Voice session {session.session_id} connected")
+    with ACTIVE_SESSIONS.track():
+        session.run(ws)
+    logger.info(f"Voice session {session.session_id} closed")
+
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy', 'model_loaded': model is not None})
+    return jsonify({'status': 'healthy', 'model_loaded': model is not None,
+                    'admission': admission.stats()})
 
 
 @app.route('/conversation', methods=['GET'])
@@ -340,21 +673,26 @@ def get_conversation():
     """Get current conversation history"""
     return jsonify({
         'conversation_history': conversation_history,
-        'message_count': len(conversation_history)
+        'message_count': len(conversation_history),
+        'turn_scores': turn_scorer.scores(SESSION_ID, timeout=0)
     })
 
 
 @app.route('/conversation', methods=['DELETE'])
 def clear_conversation():
-    """Clear conversation history"""
-    global conversation_history
+    """Clear conversation history (and the conversation stage)"""
+    global conversation_history, stage
     conversation_history = []
+    stage = 1
+    turn_scorer.reset(SESSION_ID)
     logger.info("Conversation history cleared")
     return jsonify({'message': 'Conversation history cleared'})
 
 
 if __name__ == '__main__':
     print("Starting simplified Whisper + Gemini Flask server...")
-    print("Endpoints: /voice-chat (standard), /voice-chat-stream (streaming)")
+    print("Endpoints: /voice-chat (standard), /voice-chat-stream (streaming), /voice-session (WebSocket)")
     print("Flow: Audio → Whisper Transcription → Gemini Mood Detection & Response")
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    report_queue.start()
+    # The reloader would import (and load Whisper) twice; set FLASK_USE_RELOADER=1 to enable it
+    app.run(host='0.0.0.0', port=5001, debug=True, use_reloader=os.getenv('FLASK_USE_RELOADER') == '1')